@@ -0,0 +1,178 @@
+# app/config/query_stats.py
+"""
+Query fingerprinting, per-fingerprint statistics and the slow-query log.
+
+A fingerprint is the statement with literals, placeholders and IN-lists
+normalized ("WHERE id = %s AND status = 'x'" -> "where id = ? and status = ?"),
+so every execution of the same query shape shares one entry. Each entry
+keeps count, total time, errors and a window of recent durations for p95.
+
+Queries slower than DB_SLOW_QUERY_MS are logged with the request route,
+tenant and row count. With DB_EXPLAIN_MS set, SELECTs slower than that get
+an EXPLAIN (ANALYZE, BUFFERS) captured on the same connection (at most once
+per fingerprint per DB_EXPLAIN_COOLDOWN seconds) inside a savepoint, so a
+failing EXPLAIN never aborts the caller's transaction.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
+from app.config.request_context import request_route, request_tenant
+from app.services.metrics import CallbackMetric
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+# 0 = never run EXPLAIN ANALYZE
+DB_EXPLAIN_MS = float(os.getenv("DB_EXPLAIN_MS", "0"))
+DB_EXPLAIN_COOLDOWN = float(os.getenv("DB_EXPLAIN_COOLDOWN", "300"))
+
+MAX_FINGERPRINTS = 500
+RECENT_DURATIONS = 200
+# Fingerprints exported to /metrics (by total time); the admin endpoint has all of them
+METRICS_TOP_FINGERPRINTS = 25
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_query(query: str) -> str:
+    text = _STRING.sub("?", query)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _IN_LIST.sub("(?, ...)", text)
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def fingerprint(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()[:12]
+
+
+class _QueryStat:
+    __slots__ = ("query", "count", "total", "max", "errors", "recent", "last_plan", "last_explained")
+
+    def __init__(self, query: str):
+        self.query = query
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=RECENT_DURATIONS)
+        self.last_plan: Optional[str] = None
+        self.last_explained = 0.0
+
+    def p95(self) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+_stats: dict = {}
+_stats_lock = threading.Lock()
+
+
+def _stat_for(query: str) -> Optional[_QueryStat]:
+    key = fingerprint(query)
+    stat = _stats.get(key)
+    if stat is None:
+        if len(_stats) >= MAX_FINGERPRINTS:
+            return None
+        stat = _stats[key] = _QueryStat(normalize_query(query))
+    return stat
+
+
+def record_error(query: str):
+    with _stats_lock:
+        stat = _stat_for(str(query))
+        if stat is not None:
+            stat.errors += 1
+
+
+def _explain(cur, query, params) -> Optional[str]:
+    cur.execute("SAVEPOINT query_stats_explain")
+    try:
+        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+        lines = [row["QUERY PLAN"] if isinstance(row, dict) else row[0] for row in cur.fetchall()]
+        cur.execute("RELEASE SAVEPOINT query_stats_explain")
+        return "\n".join(lines)
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+        print(f"EXPLAIN capture failed: {e}")
+        return None
+
+
+def record_query(cur, query, params, elapsed: float, row_count: int):
+    """Account one finished query; log it if slow and maybe capture its plan."""
+    query = str(query)
+    elapsed_ms = elapsed * 1000
+    explain = False
+    with _stats_lock:
+        stat = _stat_for(query)
+        if stat is not None:
+            stat.count += 1
+            stat.total += elapsed
+            stat.max = max(stat.max, elapsed)
+            stat.recent.append(elapsed)
+            now = time.monotonic()
+            if (DB_EXPLAIN_MS and elapsed_ms >= DB_EXPLAIN_MS
+                    and now - stat.last_explained >= DB_EXPLAIN_COOLDOWN
+                    and normalize_query(query).startswith("select")):
+                stat.last_explained = now
+                explain = True
+
+    if elapsed_ms >= DB_SLOW_QUERY_MS:
+        print(
+            f"🐢 Slow query {elapsed_ms:.0f}ms [{fingerprint(query)}] rows={row_count} "
+            f"route={request_route.get() or '-'} tenant={request_tenant.get() or '-'}: "
+            f"{normalize_query(query)[:300]}"
+        )
+    if explain:
+        plan = _explain(cur, query, params)
+        if plan:
+            with _stats_lock:
+                stat.last_plan = plan
+            print(f"🔎 Plan for [{fingerprint(query)}]:\n{plan}")
+
+
+def get_query_stats(limit: Optional[int] = None) -> list:
+    """Per-fingerprint stats, most total time first."""
+    with _stats_lock:
+        items = [(key, stat) for key, stat in _stats.items()]
+        rows = [
+            {
+                "fingerprint": key,
+                "query": stat.query,
+                "count": stat.count,
+                "errors": stat.errors,
+                "totalMs": round(stat.total * 1000, 2),
+                "meanMs": round(stat.total * 1000 / stat.count, 2) if stat.count else 0.0,
+                "p95Ms": round(stat.p95() * 1000, 2),
+                "maxMs": round(stat.max * 1000, 2),
+                "plan": stat.last_plan,
+            }
+            for key, stat in items
+        ]
+    rows.sort(key=lambda row: row["totalMs"], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+def _top_metric(field: str, scale: float = 1.0):
+    def collect():
+        return {row["fingerprint"]: row[field] * scale for row in get_query_stats(METRICS_TOP_FINGERPRINTS)}
+    return collect
+
+
+CallbackMetric("db_query_fingerprint_calls_total", "Executions per query fingerprint (top by total time).",
+               _top_metric("count"), ("fingerprint",), "counter")
+CallbackMetric("db_query_fingerprint_seconds_total", "Total time per query fingerprint (top by total time).",
+               _top_metric("totalMs", 0.001), ("fingerprint",), "counter")
+CallbackMetric("db_query_fingerprint_p95_seconds", "p95 of recent executions per query fingerprint.",
+               _top_metric("p95Ms", 0.001), ("fingerprint",))
@@ -0,0 +1,252 @@
+# app/config/replicas.py
+"""
+Read replicas (DATABASE_REPLICA_URLS) and read/write routing.
+
+A statement goes to a replica only when all of these hold, otherwise to the
+primary:
+
+- the route opted in with `Depends(prefer_replica)` (read-only endpoints);
+- it is a plain SELECT run by execute_query (not FOR UPDATE/SHARE, not
+  inside execute_in_transaction);
+- a healthy replica has replayed the WAL at least up to the LSN this
+  request must see (read-your-writes, below).
+
+Replicas are checked every REPLICA_CHECK_SECONDS from a background task:
+one probe returns the replay LSN and lag. Replicas that fail, or lag by more
+than REPLICA_MAX_LAG_SECONDS, get no reads. Reads are spread over the others
+weighted by their probe latency. A read that fails on a replica for
+connection or recovery-conflict reasons marks it unhealthy and is retried
+on the primary.
+
+Read-your-writes: after a mutating request (POST/PUT/PATCH/DELETE) writes,
+the primary's WAL position (LSN) is recorded
+
+- in this process, for the tenant, for REPLICA_STICKY_SECONDS, and
+- in a `db_lsn` cookie, so the next request sees its write on any worker
+  (for clients that send cookies);
+
+and reads within that window only use replicas that have replayed past it.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2 import pool
+
+from app.config.request_context import request_tenant
+from app.services.metrics import CallbackMetric, Counter
+
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_POOL_MAX = int(os.getenv("DB_REPLICA_POOL_MAX", os.getenv("DB_POOL_MAX", "20")))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+LSN_COOKIE = "db_lsn"
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_READ_ONLY = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+_LOCKING = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+# Failures that say nothing about the query itself: retry it on the primary
+RETRYABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.errors.SerializationFailure)
+
+db_reads_total = Counter(
+    "db_reads_total", "Reads from routes that prefer replicas, by where they ran.", ("target",))
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        parsed = urlparse(url)
+        self.name = f"{parsed.hostname}:{parsed.port or 5432}"
+        self.pool: Optional[pool.SimpleConnectionPool] = None
+        self.healthy = False
+        self.replay_lsn = 0
+        self.lag_seconds: Optional[float] = None
+        self.latency = 0.0  # moving average of the probe round trip, seconds
+        self._lock = threading.Lock()
+
+    def get_pool(self) -> pool.SimpleConnectionPool:
+        with self._lock:
+            if self.pool is None:
+                self.pool = pool.SimpleConnectionPool(1, REPLICA_POOL_MAX, self.url)
+            return self.pool
+
+    def mark_down(self, error: Exception):
+        if self.healthy:
+            print(f"⚠️  Replica {self.name} marked unhealthy: {error}")
+        self.healthy = False
+
+    def check(self, primary_lsn: Optional[int]):
+        """Probe replay position and lag; runs in a thread."""
+        started = time.perf_counter()
+        try:
+            conn = self.get_pool().getconn()
+        except Exception as e:
+            self.mark_down(e)
+            return
+        broken = False
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT pg_is_in_recovery(),
+                           COALESCE(pg_last_wal_replay_lsn() - '0/0'::pg_lsn, 0)::bigint,
+                           EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                    """
+                )
+                in_recovery, replay_lsn, replay_age = cur.fetchone()
+        except Exception as e:
+            broken = True
+            self.mark_down(e)
+            return
+        finally:
+            self.pool.putconn(conn, close=broken)
+        elapsed = time.perf_counter() - started
+        self.latency = elapsed if not self.latency else 0.8 * self.latency + 0.2 * elapsed
+        self.replay_lsn = replay_lsn
+        # An idle primary writes nothing to replay: caught up means no lag, whatever the last replay time
+        caught_up = primary_lsn is not None and replay_lsn >= primary_lsn
+        self.lag_seconds = 0.0 if caught_up or replay_age is None else float(replay_age)
+        healthy = in_recovery and self.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+        if healthy != self.healthy:
+            print(f"{'✅' if healthy else '⚠️ '} Replica {self.name} {'healthy' if healthy else 'lagging'} "
+                  f"(lag {self.lag_seconds:.1f}s)")
+        self.healthy = healthy
+
+    def reset(self):
+        """Forget connections inherited across a fork."""
+        self.pool = None
+        self.healthy = False
+
+
+replicas: List[Replica] = [Replica(url) for url in REPLICA_URLS]
+
+
+# --- Request state -----------------------------------------------------------
+
+class ReadConsistency:
+    """What a request must read: at least `min_lsn`; `write_lsn` is set once it writes."""
+
+    __slots__ = ("min_lsn", "write_lsn", "track_writes")
+
+    def __init__(self, min_lsn: int = 0, track_writes: bool = False):
+        self.min_lsn = min_lsn
+        self.write_lsn = 0
+        self.track_writes = track_writes
+
+
+replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+# A mutable object, so writes made inside the endpoint are visible to the middleware
+read_consistency: ContextVar[Optional[ReadConsistency]] = ContextVar("read_consistency", default=None)
+
+# tenant -> (LSN of its last write, pin expiry on the monotonic clock)
+_tenant_pins: Dict[str, Tuple[int, float]] = {}
+
+
+async def prefer_replica():
+    """Route dependency: this endpoint only reads, its SELECTs may use replicas."""
+    replica_reads.set(True)
+
+
+def is_replica_read(query, commit: bool) -> bool:
+    if not replicas or not commit or not replica_reads.get():
+        return False
+    text = str(query)
+    return bool(_READ_ONLY.match(text)) and not _LOCKING.search(text)
+
+
+def _required_lsn() -> int:
+    required = 0
+    consistency = read_consistency.get()
+    if consistency is not None:
+        required = max(consistency.min_lsn, consistency.write_lsn)
+    tenant = request_tenant.get()
+    pin = _tenant_pins.get(tenant) if tenant else None
+    if pin:
+        if pin[1] > time.monotonic():
+            required = max(required, pin[0])
+        else:
+            _tenant_pins.pop(tenant, None)
+    return required
+
+
+def choose_replica() -> Optional[Replica]:
+    """A healthy replica that has replayed what this request must see (weighted by latency), or None."""
+    required = _required_lsn()
+    candidates = [r for r in replicas if r.healthy and r.replay_lsn >= required]
+    if not candidates:
+        db_reads_total.inc("primary_pinned" if required and any(r.healthy for r in replicas) else "primary_no_replica")
+        return None
+    db_reads_total.inc("replica")
+    if len(candidates) == 1:
+        return candidates[0]
+    return random.choices(candidates, weights=[1 / max(r.latency, 0.001) for r in candidates])[0]
+
+
+def wants_write_lsn(query) -> bool:
+    """Whether a statement just committed on the primary should pin later reads to its LSN."""
+    consistency = read_consistency.get()
+    if not replicas or consistency is None or not consistency.track_writes:
+        return False
+    return not _READ_ONLY.match(str(query))
+
+
+def record_write(lsn: int):
+    consistency = read_consistency.get()
+    if consistency is not None:
+        consistency.write_lsn = max(consistency.write_lsn, lsn)
+    tenant = request_tenant.get()
+    if tenant:
+        _tenant_pins[tenant] = (lsn, time.monotonic() + REPLICA_STICKY_SECONDS)
+
+
+# --- Health checks -----------------------------------------------------------
+
+def _check_all():
+    from app.config.db import current_wal_lsn
+    try:
+        primary_lsn = current_wal_lsn()
+    except Exception as e:
+        print(f"⚠️  Replica check could not read the primary's WAL position: {e}")
+        primary_lsn = None
+    for replica in replicas:
+        replica.check(primary_lsn)
+    now = time.monotonic()
+    for tenant, (_, expires) in list(_tenant_pins.items()):
+        if expires <= now:
+            _tenant_pins.pop(tenant, None)
+
+
+async def watch_replicas(interval: float = REPLICA_CHECK_SECONDS):
+    while True:
+        await asyncio.to_thread(_check_all)
+        await asyncio.sleep(interval)
+
+
+def start_replica_monitor():
+    """Start the replica health checks if DATABASE_REPLICA_URLS is set."""
+    if not replicas:
+        return None
+    return asyncio.create_task(watch_replicas())
+
+
+def reset_replicas():
+    for replica in replicas:
+        replica.reset()
+
+
+def _replica_stats():
+    if not replicas:
+        return None
+    return {(r.name,): (r.lag_seconds if r.healthy and r.lag_seconds is not None else -1) for r in replicas}
+
+
+CallbackMetric("db_replica_lag_seconds", "Replay lag per replica (-1 while unhealthy).", _replica_stats, ("replica",))
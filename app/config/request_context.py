@@ -0,0 +1,12 @@
+# app/config/request_context.py
+"""
+Per-request context for diagnostics (slow-query log, profiles).
+
+Set by MetricsMiddleware (method and path) and by token decoding (tenant);
+contextvars follow the request into run_in_threadpool and sync endpoints.
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+request_route: ContextVar[Optional[str]] = ContextVar("request_route", default=None)
+request_tenant: ContextVar[Optional[str]] = ContextVar("request_tenant", default=None)
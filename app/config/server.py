@@ -0,0 +1,99 @@
+# app/config/server.py
+"""
+Process sizing and recycling for the production server (see gunicorn.conf.py).
+
+Worker count comes from the container's CPU quota and memory limit (cgroup
+v2, then v1, then the host), unless WEB_CONCURRENCY pins it. Each worker
+watches its own resident memory and asks to be replaced (SIGTERM to itself,
+which gunicorn treats as a graceful exit and respawns) once it passes
+WORKER_MAX_MEMORY_MB.
+"""
+import asyncio
+import math
+import os
+import signal
+from typing import Optional
+
+MB = 1024 * 1024
+# Async workers: one per core is enough, bcrypt and image work use thread pools
+WORKERS_PER_CPU = float(os.getenv("WORKERS_PER_CPU", "1"))
+# Expected steady-state RSS of one worker, used to fit workers into the memory limit
+WORKER_MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", "300"))
+# Share of the memory limit the workers may plan for (the rest is headroom)
+MEMORY_BUDGET_RATIO = 0.8
+MEMORY_CHECK_INTERVAL = float(os.getenv("WORKER_MEMORY_CHECK_SECONDS", "10"))
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> float:
+    """CPUs this process may use: cgroup quota if set, else the CPUs it is pinned to."""
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            return min(available, int(quota) / int(period or 100000))
+        return available
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return min(available, int(quota) / int(period))
+    return available
+
+
+def memory_limit() -> Optional[int]:
+    """Memory limit in bytes (cgroup, else physical memory), or None if unknown."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value != "max" and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def worker_count() -> int:
+    """Workers to run: WEB_CONCURRENCY, or as many as CPU and memory allow."""
+    pinned = os.getenv("WEB_CONCURRENCY")
+    if pinned:
+        return max(1, int(pinned))
+    workers = max(1, math.ceil(cpu_limit() * WORKERS_PER_CPU))
+    memory = memory_limit()
+    if memory:
+        workers = min(workers, max(1, int(memory * MEMORY_BUDGET_RATIO // (WORKER_MEMORY_MB * MB))))
+    return workers
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process (Linux), or None."""
+    statm = _read("/proc/self/statm")
+    if not statm:
+        return None
+    return int(statm.split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def watch_memory(limit_bytes: int, interval: float = MEMORY_CHECK_INTERVAL):
+    """Ask for a graceful restart of this worker once its RSS exceeds `limit_bytes`."""
+    while True:
+        await asyncio.sleep(interval)
+        rss = rss_bytes()
+        if rss is not None and rss > limit_bytes:
+            print(f"♻️  Worker {os.getpid()} at {rss // MB} MB (limit {limit_bytes // MB} MB), recycling")
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+
+
+def start_memory_watchdog() -> Optional[asyncio.Task]:
+    """Start the RSS watchdog if WORKER_MAX_MEMORY_MB is set (the launcher sets it)."""
+    limit_mb = int(os.getenv("WORKER_MAX_MEMORY_MB", "0"))
+    if limit_mb <= 0:
+        return None
+    return asyncio.create_task(watch_memory(limit_mb * MB))
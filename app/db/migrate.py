@@ -1,141 +1,239 @@
 # app/db/migrate.py
+"""
+Versioned schema migrations.
+
+Migrations are the files app/db/migrations/NNNN_name.sql, applied in
+version order and recorded in the `schema_migrations` ledger with the
+SHA-256 of their text:
+
+- an applied migration is never run again, and editing one after it was
+  applied is an error (add a new migration instead);
+- replicas starting at the same time serialize on a Postgres advisory lock;
+  whoever gets it second re-reads the ledger and finds nothing left to do.
+  Waiters poll for the lock instead of blocking on it, because a session
+  blocked inside a statement holds a snapshot that CREATE INDEX
+  CONCURRENTLY in the lock holder would have to wait for;
+- when everything is applied, startup costs one ledger read and no lock.
+
+A migration whose first line is `-- migrate: no-transaction` runs in
+autocommit mode as a single statement. Index builds use it for
+`CREATE INDEX CONCURRENTLY`, which does not block writes to the table but
+cannot run inside a transaction. A concurrent build that fails leaves an
+INVALID index behind that `IF NOT EXISTS` would then skip, so such an
+index is dropped before the migration is retried.
+
+    python -m app.db.migrate            # apply pending migrations
+    python -m app.db.migrate --status   # list applied and pending migrations
+"""
+import argparse
+import hashlib
 import os
+import re
 import sys
-from dotenv import load_dotenv
-from app.config.db import get_db, return_db
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
 import psycopg2
+from dotenv import load_dotenv
 
 load_dotenv()
 
-def migrate():
-    """Add missing columns to existing tables"""
-    conn = get_db()
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+# Arbitrary constant shared by every process running migrations against the database
+ADVISORY_LOCK_ID = 7_482_615_093
+LOCK_POLL_SECONDS = 1.0
+# Transactional migrations give up instead of queueing traffic behind a lock they wait for
+LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "10s")
+
+_FILE_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+_NO_TRANSACTION = "-- migrate: no-transaction"
+_CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+    checksum: str
+    transactional: bool
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Migration files in version order."""
+    migrations = {}
+    for path in sorted(directory.glob("*.sql")):
+        match = _FILE_PATTERN.match(path.name)
+        if not match:
+            raise MigrationError(f"Unexpected migration file name: {path.name} (want NNNN_name.sql)")
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"Duplicate migration version {version}: {path.name}")
+        sql = path.read_text()
+        migrations[version] = Migration(
+            version=version,
+            name=match.group(2),
+            sql=sql,
+            checksum=hashlib.sha256(sql.encode()).hexdigest(),
+            transactional=not sql.lstrip().startswith(_NO_TRANSACTION),
+        )
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def _applied(cur) -> Optional[Dict[int, str]]:
+    """{version: checksum} from the ledger, or None if it does not exist yet."""
+    try:
+        cur.execute("SELECT version, checksum FROM schema_migrations")
+    except psycopg2.errors.UndefinedTable:
+        return None
+    return {version: checksum for version, checksum in cur.fetchall()}
+
+
+def _pending(migrations: List[Migration], applied: Dict[int, str]) -> List[Migration]:
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is not None and checksum != migration.checksum:
+            raise MigrationError(
+                f"Migration {migration.version}_{migration.name} was changed after it was applied; "
+                "add a new migration instead"
+            )
+    return [m for m in migrations if m.version not in applied]
+
+
+def _drop_invalid_index(cur, sql: str):
+    """Drop what a failed CREATE INDEX CONCURRENTLY left behind, so the build is retried."""
+    match = _CONCURRENT_INDEX.search(sql)
+    if not match:
+        return
+    cur.execute(
+        """
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND c.relnamespace = 'public'::regnamespace AND NOT i.indisvalid
+        """,
+        (match.group(1),)
+    )
+    if cur.fetchone():
+        print(f"  ⚠️  Dropping invalid index {match.group(1)} left by an interrupted build")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def _lock(cur):
+    waiting = False
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+        if cur.fetchone()[0]:
+            return
+        if not waiting:
+            print("⏳ Another process is running migrations, waiting...")
+            waiting = True
+        time.sleep(LOCK_POLL_SECONDS)
+
+
+def _apply(conn, migration: Migration):
+    """Run one migration and record it; the connection is in autocommit mode."""
+    cur = conn.cursor()
+    started = time.perf_counter()
+    try:
+        if migration.transactional:
+            conn.autocommit = False
+            cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+            cur.execute(migration.sql)
+        else:
+            _drop_invalid_index(cur, migration.sql)
+            cur.execute(migration.sql)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        cur.execute(
+            "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+            (migration.version, migration.name, migration.checksum, duration_ms)
+        )
+        if migration.transactional:
+            conn.commit()
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+        cur.close()
+    print(f"  ✅ {migration.version:04d}_{migration.name} ({duration_ms} ms)")
+
+
+def migrate(database_url: Optional[str] = None):
+    """Apply pending migrations; a no-op (one ledger read) when the schema is current."""
+    migrations = load_migrations()
+    conn = psycopg2.connect(database_url or os.getenv("DATABASE_URL"))
+    conn.autocommit = True
     try:
         cur = conn.cursor()
-        
-        print("🔄 Running database migrations...")
-        
-        # Add columns to projects table if they don't exist
-        migrations = [
-            # Create folders table FIRST (before adding foreign key)
-            """
-            CREATE TABLE IF NOT EXISTS folders (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                company_id UUID NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-                user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                name VARCHAR(255) NOT NULL,
-                parent_folder_id UUID REFERENCES folders(id) ON DELETE CASCADE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            
-            # Add design_mode column
-            """
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_name = 'projects' AND column_name = 'design_mode'
-                ) THEN
-                    ALTER TABLE projects ADD COLUMN design_mode VARCHAR(50) DEFAULT '2d';
-                END IF;
-            END $$;
-            """,
-            
-            # Add is_draft column
-            """
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_name = 'projects' AND column_name = 'is_draft'
-                ) THEN
-                    ALTER TABLE projects ADD COLUMN is_draft BOOLEAN DEFAULT false;
-                END IF;
-            END $$;
-            """,
-            
-            # Add folder_id column (after folders table exists)
-            """
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_name = 'projects' AND column_name = 'folder_id'
-                ) THEN
-                    ALTER TABLE projects ADD COLUMN folder_id UUID REFERENCES folders(id) ON DELETE SET NULL;
-                END IF;
-            END $$;
-            """,
-            
-            # Create indexes if they don't exist
-            """
-            CREATE INDEX IF NOT EXISTS idx_projects_design_mode ON projects(design_mode);
-            CREATE INDEX IF NOT EXISTS idx_projects_is_draft ON projects(is_draft);
-            CREATE INDEX IF NOT EXISTS idx_projects_folder_id ON projects(folder_id);
-            CREATE INDEX IF NOT EXISTS idx_folders_company_id ON folders(company_id);
-            CREATE INDEX IF NOT EXISTS idx_folders_user_id ON folders(user_id);
-            """,
-            
-            # Create AI suggestions table if it doesn't exist
-            """
-            CREATE TABLE IF NOT EXISTS ai_suggestions (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                issue_type VARCHAR(100) NOT NULL,
-                severity VARCHAR(20) NOT NULL,
-                description TEXT NOT NULL,
-                element_ids TEXT[],
-                suggestion TEXT NOT NULL,
-                fix_action JSONB,
-                applied BOOLEAN DEFAULT false,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            
-            # Create AI prompts table if it doesn't exist
-            """
-            CREATE TABLE IF NOT EXISTS ai_prompts (
-                id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-                project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
-                prompt TEXT NOT NULL,
-                result JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """,
-            
-            # Create indexes for AI tables
-            """
-            CREATE INDEX IF NOT EXISTS idx_ai_suggestions_project_id ON ai_suggestions(project_id);
-            CREATE INDEX IF NOT EXISTS idx_ai_prompts_project_id ON ai_prompts(project_id);
-            """,
-        ]
-        
-        for i, migration in enumerate(migrations, 1):
-            try:
-                cur.execute(migration)
-                print(f"  ✅ Migration {i}/{len(migrations)} completed")
-            except psycopg2.Error as e:
-                if "already exists" in str(e) or "duplicate" in str(e).lower():
-                    print(f"  ⚠️  Migration {i}/{len(migrations)}: Already applied (skipping)")
-                else:
-                    print(f"  ❌ Migration {i}/{len(migrations)} failed: {e}")
-                    raise
-        
-        conn.commit()
-        print("✅ All migrations completed successfully!")
-        
+        applied = _applied(cur)
+        if applied is not None and not _pending(migrations, applied):
+            print(f"✅ Database schema is current ({len(applied)} migrations applied)")
+            return
+
+        # Session-level lock, held across the per-migration transactions below
+        _lock(cur)
+        try:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    checksum CHAR(64) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    duration_ms INTEGER
+                )
+                """
+            )
+            # Another replica may have applied them while we waited for the lock
+            pending = _pending(migrations, _applied(cur))
+            if pending:
+                print(f"🔄 Applying {len(pending)} migration(s)...")
+            for migration in pending:
+                _apply(conn, migration)
+            print("✅ Database schema is current")
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
     except Exception as e:
-        conn.rollback()
         print(f"❌ Migration failed: {e}")
-        import traceback
-        traceback.print_exc()
         raise
     finally:
-        cur.close()
-        return_db(conn)
+        conn.close()
+
+
+def status(database_url: Optional[str] = None):
+    migrations = load_migrations()
+    conn = psycopg2.connect(database_url or os.getenv("DATABASE_URL"))
+    conn.autocommit = True
+    try:
+        applied = _applied(conn.cursor()) or {}
+    finally:
+        conn.close()
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            state = "pending"
+        elif checksum != migration.checksum:
+            state = "CHANGED"
+        else:
+            state = "applied"
+        print(f"{migration.version:04d}_{migration.name:48} {state}")
 
-if __name__ == "__main__":
-    migrate()
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply versioned database migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    args = parser.parse_args()
+    try:
+        if args.status:
+            status()
+        else:
+            migrate()
+    except MigrationError:
+        sys.exit(1)
@@ -0,0 +1,34 @@
+-- Tables for shared rate limiting, the render cache and image proxy, and the catalog
+
+CREATE TABLE IF NOT EXISTS rate_limit_counters (
+  bucket_key VARCHAR(255) NOT NULL,
+  window_start BIGINT NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket_key, window_start)
+);
+
+CREATE TABLE IF NOT EXISTS render_cache (
+  tenant_key VARCHAR(64) NOT NULL,
+  cache_key VARCHAR(64) NOT NULL,
+  result JSONB NOT NULL,
+  hit_count INTEGER DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (tenant_key, cache_key)
+);
+CREATE INDEX IF NOT EXISTS idx_render_cache_last_hit ON render_cache(tenant_key, last_hit_at DESC);
+
+CREATE TABLE IF NOT EXISTS render_images (
+  generation_id VARCHAR(64) NOT NULL,
+  image_index INTEGER NOT NULL,
+  source_url TEXT NOT NULL,
+  content_hash VARCHAR(64),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (generation_id, image_index)
+);
+
+CREATE TABLE IF NOT EXISTS catalog_blocks (
+  id VARCHAR(255) PRIMARY KEY,
+  definition JSONB NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Prefix index for company slug allocation (slug LIKE 'base-%')
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_companies_slug_prefix ON companies(slug text_pattern_ops);
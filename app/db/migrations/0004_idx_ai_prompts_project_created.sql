@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Keyset pagination of AI designer history per project
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_prompts_project_created ON ai_prompts(project_id, created_at DESC, id DESC);
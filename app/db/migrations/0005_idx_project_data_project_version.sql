@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Latest version of a project (autosave's MAX(version), opening a project) without scanning its history
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_project_data_project_version ON project_data(project_id, version DESC);
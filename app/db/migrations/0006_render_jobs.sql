@@ -0,0 +1,14 @@
+-- State of every render job, so any worker can answer status polls and streams
+CREATE TABLE IF NOT EXISTS render_jobs (
+  id UUID PRIMARY KEY,
+  tenant_id VARCHAR(64),
+  project_id UUID,
+  kind VARCHAR(32) NOT NULL,
+  status VARCHAR(16) NOT NULL,
+  completed_steps INTEGER NOT NULL DEFAULT 0,
+  state JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_render_jobs_finished_at ON render_jobs(finished_at);
@@ -0,0 +1,3 @@
+-- Which project version the open suggestions describe, so a late check of an older version can't overwrite them
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS suggestions_version INTEGER;
+ALTER TABLE ai_suggestions ADD COLUMN IF NOT EXISTS project_version INTEGER;
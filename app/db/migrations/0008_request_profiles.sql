@@ -0,0 +1,7 @@
+-- Captured request profiles, readable from every worker (the newest PROFILER_BUFFER_SIZE are kept)
+CREATE TABLE IF NOT EXISTS request_profiles (
+  id BIGSERIAL PRIMARY KEY,
+  summary JSONB NOT NULL,
+  stacks JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
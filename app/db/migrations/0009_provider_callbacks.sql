@@ -0,0 +1,6 @@
+-- Provider webhooks, so the worker waiting for a generation sees a callback another worker received
+CREATE TABLE IF NOT EXISTS provider_callbacks (
+  generation_id VARCHAR(64) PRIMARY KEY,
+  payload JSONB NOT NULL,
+  received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
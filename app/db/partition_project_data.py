@@ -0,0 +1,324 @@
+# app/db/partition_project_data.py
+"""
+Online conversion of `project_data` to a table hash-partitioned on project_id.
+
+Every version of every project lives in project_data, and every read or
+write of it filters on one project_id. Hash partitions keep each heap and
+index a fraction of the size (vacuum, index rebuilds and the latest-version
+lookups work per partition), and the planner prunes those queries to a
+single partition, so the application's SQL does not change.
+
+The copy runs while the app keeps serving, one step at a time. Each step
+is idempotent and can be re-run:
+
+    python -m app.db.partition_project_data status
+    python -m app.db.partition_project_data prepare --partitions 16
+    python -m app.db.partition_project_data backfill --batch-size 500
+    python -m app.db.partition_project_data verify [--full]
+    python -m app.db.partition_project_data swap
+    python -m app.db.partition_project_data drop-old
+
+- prepare: creates `project_data_partitioned` with a (project_id, version
+  DESC) index on every partition, plus a trigger that mirrors each insert,
+  update and delete on project_data into it from then on;
+- backfill: copies the existing rows in primary-key batches, each in its own
+  short transaction (resumable with --after, throttled with --pause);
+- verify: compares row counts (--full: looks for every row by key);
+- swap: in one short transaction, renames the tables (and their indexes) so
+  the partitioned table becomes project_data, and drops the trigger;
+- drop-old: drops the unpartitioned copy, kept until then as a frozen
+  snapshot from the moment of the swap.
+
+Once project_data is partitioned, CREATE INDEX CONCURRENTLY cannot target
+it. A migration adding an index creates it ON ONLY project_data, builds it
+CONCURRENTLY on each partition, then runs ALTER INDEX ... ATTACH PARTITION.
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SHADOW = "project_data_partitioned"
+OLD = "project_data_unpartitioned"
+DEFAULT_PARTITIONS = 16
+# BEFORE ROW triggers (updated_at) on partitioned tables
+MIN_SERVER_VERSION = 130000
+SWAP_LOCK_TIMEOUT = os.getenv("PARTITION_SWAP_LOCK_TIMEOUT", "5s")
+SWAP_ATTEMPTS = 10
+_COLUMNS = "id, project_id, data_json, version, created_at, updated_at"
+
+
+class PartitionError(Exception):
+    pass
+
+
+def _connect():
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    conn.autocommit = True
+    return conn
+
+
+def _relkind(cur, name: str):
+    """'r' (table), 'p' (partitioned table) or None if it does not exist."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (f"public.{name}",))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def state(cur) -> str:
+    if _relkind(cur, "project_data") == "p":
+        return "partitioned"
+    if _relkind(cur, SHADOW):
+        return "copying"
+    return "unpartitioned"
+
+
+def prepare(cur, partitions: int = DEFAULT_PARTITIONS):
+    current = state(cur)
+    if current == "partitioned":
+        print("✅ project_data is already partitioned")
+        return
+    cur.execute("SHOW server_version_num")
+    if int(cur.fetchone()[0]) < MIN_SERVER_VERSION:
+        raise PartitionError("Partitioning project_data needs PostgreSQL 13 or newer")
+
+    cur.connection.autocommit = False
+    try:
+        # The foreign key and the trigger lock projects and project_data briefly; don't queue writes behind us
+        cur.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+        if current == "unpartitioned":
+            cur.execute(
+                f"""
+                CREATE TABLE {SHADOW} (
+                  id UUID NOT NULL DEFAULT uuid_generate_v4(),
+                  project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+                  data_json JSONB NOT NULL,
+                  version INTEGER DEFAULT 1,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  CONSTRAINT {SHADOW}_pkey PRIMARY KEY (project_id, id)
+                ) PARTITION BY HASH (project_id)
+                """
+            )
+            for remainder in range(partitions):
+                cur.execute(
+                    f"CREATE TABLE project_data_p{remainder:02d} PARTITION OF {SHADOW} "
+                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                )
+            # Empty table: a plain build, cascaded to every partition
+            cur.execute(f"CREATE INDEX idx_{SHADOW}_project_version ON {SHADOW} (project_id, version DESC)")
+            cur.execute(
+                f"""
+                CREATE TRIGGER update_{SHADOW}_updated_at BEFORE UPDATE ON {SHADOW}
+                  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()
+                """
+            )
+
+        cur.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION project_data_sync() RETURNS TRIGGER AS $$
+            BEGIN
+              IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.project_id <> NEW.project_id) THEN
+                DELETE FROM {SHADOW} WHERE project_id = OLD.project_id AND id = OLD.id;
+              END IF;
+              IF TG_OP = 'DELETE' THEN
+                RETURN OLD;
+              END IF;
+              INSERT INTO {SHADOW} ({_COLUMNS})
+              VALUES (NEW.id, NEW.project_id, NEW.data_json, NEW.version, NEW.created_at, NEW.updated_at)
+              ON CONFLICT (project_id, id) DO UPDATE
+                SET data_json = EXCLUDED.data_json, version = EXCLUDED.version, updated_at = EXCLUDED.updated_at;
+              RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """
+        )
+        # Waits for in-flight writes to project_data, so every later commit goes through the trigger
+        cur.execute("DROP TRIGGER IF EXISTS project_data_sync ON project_data")
+        cur.execute(
+            """
+            CREATE TRIGGER project_data_sync AFTER INSERT OR UPDATE OR DELETE ON project_data
+              FOR EACH ROW EXECUTE FUNCTION project_data_sync()
+            """
+        )
+        cur.connection.commit()
+    except Exception:
+        cur.connection.rollback()
+        raise
+    finally:
+        cur.connection.autocommit = True
+    print(f"✅ {SHADOW} ready ({partitions} partitions), new writes are mirrored; run backfill next")
+
+
+def backfill(cur, batch_size: int = 500, after: str = "00000000-0000-0000-0000-000000000000", pause: float = 0.0):
+    if state(cur) != "copying":
+        raise PartitionError(f"Nothing to backfill (state: {state(cur)}); run prepare first")
+    copied = batches = 0
+    started = time.monotonic()
+    while True:
+        try:
+            cur.execute(
+                f"""
+                WITH batch AS (
+                  SELECT {_COLUMNS} FROM project_data WHERE id > %s ORDER BY id LIMIT %s
+                ), inserted AS (
+                  INSERT INTO {SHADOW} ({_COLUMNS})
+                  SELECT {_COLUMNS} FROM batch
+                  ON CONFLICT (project_id, id) DO NOTHING
+                  RETURNING 1
+                )
+                SELECT (SELECT id::text FROM batch ORDER BY id DESC LIMIT 1),
+                       (SELECT COUNT(*) FROM inserted)
+                """,
+                (after, batch_size)
+            )
+        except psycopg2.errors.ForeignKeyViolation:
+            # A project in this batch was deleted while we copied it; the retry no longer sees its rows
+            continue
+        last_id, inserted = cur.fetchone()
+        if last_id is None:
+            break
+        after, copied, batches = last_id, copied + inserted, batches + 1
+        if batches % 100 == 0:
+            print(f"  … {copied} rows copied, last id {after} ({time.monotonic() - started:.0f}s)")
+        if pause:
+            time.sleep(pause)
+    print(f"✅ Backfill done: {copied} rows copied in {batches} batches ({time.monotonic() - started:.0f}s)")
+
+
+def verify(cur, full: bool = False) -> bool:
+    if state(cur) != "copying":
+        raise PartitionError(f"Nothing to verify (state: {state(cur)})")
+    cur.execute(f"SELECT (SELECT COUNT(*) FROM project_data), (SELECT COUNT(*) FROM {SHADOW})")
+    source, copy = cur.fetchone()
+    print(f"project_data: {source} rows, {SHADOW}: {copy} rows")
+    ok = source == copy
+    if full:
+        cur.execute(
+            f"""
+            SELECT COUNT(*) FROM project_data o
+            WHERE NOT EXISTS (SELECT 1 FROM {SHADOW} n WHERE n.project_id = o.project_id AND n.id = o.id)
+            """
+        )
+        missing = cur.fetchone()[0]
+        print(f"rows missing from {SHADOW}: {missing}")
+        ok = ok and missing == 0
+    print("✅ Copy matches" if ok else "❌ Copy does not match; re-run backfill")
+    return ok
+
+
+def swap(cur, force: bool = False):
+    current = state(cur)
+    if current == "partitioned":
+        print("✅ project_data is already partitioned")
+        return
+    if current != "copying":
+        raise PartitionError("Run prepare and backfill before swap")
+    if not verify(cur) and not force:
+        raise PartitionError("Row counts differ; re-run backfill (or --force)")
+
+    conn = cur.connection
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        conn.autocommit = False
+        try:
+            # Short lock_timeout: never queue autosaves behind a swap waiting for a long reader
+            cur.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+            cur.execute(f"LOCK TABLE project_data, {SHADOW} IN ACCESS EXCLUSIVE MODE")
+            cur.execute("DROP TRIGGER project_data_sync ON project_data")
+            cur.execute("DROP FUNCTION project_data_sync()")
+            cur.execute(f"ALTER TABLE project_data RENAME TO {OLD}")
+            cur.execute(f"ALTER INDEX project_data_pkey RENAME TO {OLD}_pkey")
+            cur.execute(f"ALTER INDEX IF EXISTS idx_project_data_project_id RENAME TO idx_{OLD}_project_id")
+            cur.execute(f"ALTER INDEX IF EXISTS idx_project_data_project_version RENAME TO idx_{OLD}_project_version")
+            cur.execute(f"ALTER TABLE {SHADOW} RENAME TO project_data")
+            cur.execute(f"ALTER INDEX {SHADOW}_pkey RENAME TO project_data_pkey")
+            cur.execute(f"ALTER INDEX idx_{SHADOW}_project_version RENAME TO idx_project_data_project_version")
+            cur.execute(f"ALTER TRIGGER update_{SHADOW}_updated_at ON project_data RENAME TO update_project_data_updated_at")
+            conn.commit()
+            print(f"✅ project_data is now partitioned; the old table is kept as {OLD} (drop-old removes it)")
+            return
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            print(f"  ⏳ project_data busy, retrying swap ({attempt}/{SWAP_ATTEMPTS})")
+            time.sleep(attempt)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+    raise PartitionError("Could not lock project_data for the swap; try again at a quieter time")
+
+
+def drop_old(cur):
+    if state(cur) != "partitioned":
+        raise PartitionError("project_data is not partitioned yet; refusing to drop anything")
+    cur.execute(f"DROP TABLE IF EXISTS {OLD}")
+    print(f"✅ Dropped {OLD}")
+
+
+def status(cur):
+    current = state(cur)
+    print(f"project_data: {current}")
+    if current != "unpartitioned":
+        table = "project_data" if current == "partitioned" else SHADOW
+        cur.execute(
+            """
+            SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+            """,
+            (f"public.{table}",)
+        )
+        for name, rows, size in cur.fetchall():
+            print(f"  {name:24} ~{max(rows, 0):>12} rows {size // (1024 * 1024):>8} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert project_data to a hash-partitioned table online.")
+    steps = parser.add_subparsers(dest="step", required=True)
+    steps.add_parser("status")
+    prepare_parser = steps.add_parser("prepare")
+    prepare_parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    backfill_parser = steps.add_parser("backfill")
+    backfill_parser.add_argument("--batch-size", type=int, default=500)
+    backfill_parser.add_argument("--after", default="00000000-0000-0000-0000-000000000000",
+                                 help="resume after this project_data id")
+    backfill_parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    verify_parser = steps.add_parser("verify")
+    verify_parser.add_argument("--full", action="store_true", help="look up every row by key (slow)")
+    swap_parser = steps.add_parser("swap")
+    swap_parser.add_argument("--force", action="store_true", help="swap even if row counts differ")
+    steps.add_parser("drop-old")
+    args = parser.parse_args()
+
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        if args.step == "status":
+            status(cur)
+        elif args.step == "prepare":
+            prepare(cur, args.partitions)
+        elif args.step == "backfill":
+            backfill(cur, args.batch_size, args.after, args.pause)
+        elif args.step == "verify":
+            if not verify(cur, args.full):
+                sys.exit(1)
+        elif args.step == "swap":
+            swap(cur, args.force)
+        elif args.step == "drop-old":
+            drop_old(cur)
+    except PartitionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
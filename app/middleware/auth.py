@@ -2,36 +2,111 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
+from collections import OrderedDict
+import hashlib
 import os
+import threading
+import time
 from app.config.db import execute_query
+from app.config.request_context import request_tenant
+from app.services.metrics import CallbackMetric
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify JWT token and return user info"""
-    token = credentials.credentials
-    
+# Verified-token cache: digest(token) -> (claims, exp). Bounded LRU.
+# Tokens can't be revoked, so a cached entry is as valid as the token until `exp`.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+_token_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _cache_get(key: str):
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
+            _token_cache_stats["misses"] += 1
+            return None
+        claims, exp = entry
+        if exp is not None and exp <= time.time():
+            del _token_cache[key]
+            _token_cache_stats["misses"] += 1
+            return None
+        _token_cache.move_to_end(key)
+        _token_cache_stats["hits"] += 1
+        return claims
+
+def _cache_put(key: str, claims: dict, exp):
+    with _token_cache_lock:
+        _token_cache[key] = (claims, exp)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+            _token_cache_stats["evictions"] += 1
+
+def get_token_cache_stats() -> dict:
+    with _token_cache_lock:
+        return {**_token_cache_stats, "size": len(_token_cache), "max_size": TOKEN_CACHE_SIZE}
+
+CallbackMetric(
+    "token_cache_events_total", "Verified-token cache lookups and evictions.",
+    lambda: {event: get_token_cache_stats()[event] for event in ("hits", "misses", "evictions")}, ("event",), "counter",
+)
+CallbackMetric("token_cache_entries", "Verified tokens currently cached.", lambda: get_token_cache_stats()["size"])
+
+def decode_token(token: str, use_cache: bool = True) -> dict:
+    """Verify a JWT and return user claims, reusing cached verification until `exp`"""
+    key = _token_key(token)
+    if use_cache:
+        claims = _cache_get(key)
+        if claims is not None:
+            return dict(claims)
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        user_id = payload.get("userId")
-        company_id = payload.get("companyId")
-        role = payload.get("role")
-        
-        if not user_id or not company_id:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token"
-            )
-        
-        return {
-            "userId": user_id,
-            "companyId": company_id,
-            "role": role
-        }
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
         )
 
+    user_id = payload.get("userId")
+    company_id = payload.get("companyId")
+    role = payload.get("role")
+
+    if not user_id or not company_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+
+    claims = {
+        "userId": user_id,
+        "companyId": company_id,
+        "role": role
+    }
+    _cache_put(key, claims, payload.get("exp"))
+    # Hand out a copy so callers can't mutate the cached entry
+    return dict(claims)
+
+def _tagged(claims: dict) -> dict:
+    """Attach the tenant to the request context (slow-query log)"""
+    request_tenant.set(claims["companyId"])
+    return claims
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Verify JWT token and return user info"""
+    return _tagged(decode_token(credentials.credentials))
+
+async def get_optional_user(credentials: HTTPAuthorizationCredentials = Depends(optional_security)):
+    """Return user info if a valid token is present, otherwise None"""
+    if credentials is None:
+        return None
+    try:
+        return _tagged(decode_token(credentials.credentials))
+    except HTTPException:
+        return None
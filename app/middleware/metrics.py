@@ -0,0 +1,57 @@
+# app/middleware/metrics.py
+"""
+Request metrics as ASGI middleware.
+
+Records a latency histogram and a status counter per (method, route
+template). The template comes from the endpoint the router matched, so
+`/api/projects/{project_id}` is one series however many projects exist;
+unmatched paths share the "unmatched" label.
+"""
+import time
+
+from app.config.request_context import request_route
+from app.services.metrics import http_request_duration_seconds, http_requests_total
+
+KNOWN_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._routes_by_endpoint = None
+
+    def _route_template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes_by_endpoint is None:
+            app = scope.get("app")
+            routes = getattr(getattr(app, "router", None), "routes", [])
+            self._routes_by_endpoint = {
+                route.endpoint: route.path for route in routes if hasattr(route, "endpoint") and hasattr(route, "path")
+            }
+        return self._routes_by_endpoint.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        # The route template is only known after routing; the raw path is enough for logs
+        request_route.set(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            route = self._route_template(scope)
+            http_request_duration_seconds.observe(time.perf_counter() - started, method, route)
+            http_requests_total.inc(method, route, str(status_code))
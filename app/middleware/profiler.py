@@ -0,0 +1,68 @@
+# app/middleware/profiler.py
+"""
+Opt-in request profiling as ASGI middleware.
+
+A request is profiled from its first byte when it carries
+`X-Profile: 1` together with `X-Admin-Token: <PROFILER_TOKEN>`; with
+PROFILER_SLOW_MS set, every request is registered and the sampler starts on
+it once it crosses the threshold. Finished profiles are stored off the
+event loop and read from /api/admin/profiles on any worker.
+"""
+import asyncio
+import hmac
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.profiler import PROFILER_SLOW_MS, PROFILER_TOKEN, RequestProfile, profiler
+
+
+def is_admin_token(token: str) -> bool:
+    return bool(PROFILER_TOKEN) and hmac.compare_digest((token or "").encode("utf-8"), PROFILER_TOKEN.encode("utf-8"))
+
+
+def _tenant_of(headers: dict):
+    authorization = headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    from app.middleware.auth import decode_token
+    try:
+        return decode_token(authorization[7:].strip()).get("companyId")
+    except Exception:
+        return None
+
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        requested = headers.get("x-profile", "").lower() in ("1", "true") and is_admin_token(headers.get("x-admin-token"))
+        if not requested and not PROFILER_SLOW_MS:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            scope["method"], scope["path"], "header" if requested else None,
+            asyncio.current_task(), threading.get_ident(),
+        )
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        profiler.start(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await run_in_threadpool(
+                profiler.finish, profile, status_code, _tenant_of(headers) if profile.sampling else None
+            )
@@ -0,0 +1,280 @@
+# app/middleware/rate_limit.py
+"""
+Sliding-window rate limiting as ASGI middleware.
+
+Each rule applies to a method + path prefix and is counted per scope
+(client IP, user and/or company, taken from the bearer token; "client" is
+the user when the request is authenticated and the IP otherwise, so users
+behind one proxy or NAT don't share a budget). Counters use
+the sliding-window approximation: hits in the current fixed window plus the
+previous window's hits weighted by how much of it still overlaps.
+
+With RATE_LIMIT_BACKEND=postgres the counters are shared through the
+`rate_limit_counters` table so limits hold across workers and replicas;
+`memory` keeps them in the process. Unset, it is postgres when the server
+runs more than one worker (WEB_CONCURRENCY, exported by gunicorn.conf.py)
+and memory otherwise. `memory` with several workers is refused at startup:
+each worker would enforce its own budget, multiplying every limit.
+"""
+import json
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+SERVER_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY") or "1"))
+RATE_LIMIT_BACKEND = (os.getenv("RATE_LIMIT_BACKEND") or ("postgres" if SERVER_WORKERS > 1 else "memory")).lower()
+if RATE_LIMIT_ENABLED and RATE_LIMIT_BACKEND == "memory" and SERVER_WORKERS > 1:
+    raise RuntimeError(
+        f"RATE_LIMIT_BACKEND=memory gives each of the {SERVER_WORKERS} workers its own budget; "
+        "use RATE_LIMIT_BACKEND=postgres (or leave it unset)"
+    )
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+# Trusted proxies in front of the app; each appends the address it received the request from
+RATE_LIMIT_PROXY_HOPS = max(1, int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1")))
+RATE_LIMIT_WINDOW_MS = int(os.getenv("RATE_LIMIT_WINDOW_MS", "900000"))
+RATE_LIMIT_MAX_REQUESTS = int(os.getenv("RATE_LIMIT_MAX_REQUESTS", "1000"))
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    path_prefix: str
+    limit: int
+    window_seconds: float
+    method: Optional[str] = None
+    scopes: Tuple[str, ...] = ("ip",)
+    exclude: Tuple[str, ...] = ()
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method and self.method != method:
+            return False
+        return path.startswith(self.path_prefix) and not path.startswith(self.exclude)
+
+
+RATE_LIMIT_RENDER_MAX = int(os.getenv("RATE_LIMIT_RENDER_MAX", "6"))
+# Provider webhooks arrive from a few provider IPs and are authenticated by their own secret
+PROVIDER_CALLBACKS = ("/api/gemini/leonardo/callback",)
+# Cheap reads a client repeats on its own: job polls and streams, render images, plan symbols
+POLL_AND_ASSET_PATHS = ("/api/jobs/", "/api/renders/", "/api/catalog/symbols/")
+
+# Most specific budgets first; every matching rule is enforced
+RATE_LIMIT_RULES = [
+    # Login throttle: each attempt costs a bcrypt verify
+    RateLimitRule("login", "/api/auth/login", int(os.getenv("RATE_LIMIT_LOGIN_MAX", "10")), 60, "POST", ("ip",)),
+    RateLimitRule("register", "/api/auth/register", int(os.getenv("RATE_LIMIT_REGISTER_MAX", "5")), 900, "POST", ("ip",)),
+    # Image generation ties up the provider for up to a minute per call (one shared budget)
+    *(
+        RateLimitRule("render", prefix, RATE_LIMIT_RENDER_MAX, 60, "POST", ("ip", "user", "company"))
+        for prefix in ("/api/gemini/generate-kitchen", "/api/gemini/jobs",
+                       "/api/ai-designer/generate", "/api/ai-designer/jobs")
+    ),
+    RateLimitRule("api", "/api/", RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW_MS / 1000, None, ("client",),
+                  exclude=PROVIDER_CALLBACKS + POLL_AND_ASSET_PATHS),
+]
+
+
+class MemoryRateLimitStore:
+    """Per-process sliding-window counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> [window_start, current_hits, previous_hits]
+        self._last_sweep = time.time()
+
+    def hit(self, key: str, window_seconds: float, now: float) -> Tuple[int, int]:
+        window_start = math.floor(now / window_seconds) * window_seconds
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None or entry[0] < window_start - window_seconds:
+                entry = [window_start, 0, 0]
+            elif entry[0] < window_start:
+                entry = [window_start, 0, entry[1]]
+            entry[1] += 1
+            self._counters[key] = entry
+            if now - self._last_sweep > 60:
+                self._sweep(now)
+            return entry[1], entry[2]
+
+    def _sweep(self, now: float):
+        # Drop counters idle for a long time so the dict stays bounded
+        horizon = now - 2 * max(RATE_LIMIT_WINDOW_MS / 1000, 3600)
+        for key in [k for k, v in self._counters.items() if v[0] < horizon]:
+            del self._counters[key]
+        self._last_sweep = now
+
+
+class PostgresRateLimitStore:
+    """Sliding-window counters shared through Postgres (one round trip per rule scope)."""
+
+    HIT_QUERY = """
+        WITH upsert AS (
+            INSERT INTO rate_limit_counters (bucket_key, window_start, hits)
+            VALUES (%(key)s, %(window_start)s, 1)
+            ON CONFLICT (bucket_key, window_start)
+            DO UPDATE SET hits = rate_limit_counters.hits + 1
+            RETURNING hits
+        )
+        SELECT (SELECT hits FROM upsert) AS current_hits,
+               COALESCE((
+                   SELECT hits FROM rate_limit_counters
+                   WHERE bucket_key = %(key)s AND window_start = %(previous_start)s
+               ), 0) AS previous_hits
+    """
+
+    def hit(self, key: str, window_seconds: float, now: float) -> Tuple[int, int]:
+        from app.config.db import execute_query
+
+        window_start = int(math.floor(now / window_seconds) * window_seconds)
+        rows = execute_query(
+            self.HIT_QUERY,
+            {"key": key, "window_start": window_start, "previous_start": int(window_start - window_seconds)},
+        )
+        if random.random() < 0.01:
+            execute_query(
+                "DELETE FROM rate_limit_counters WHERE window_start < %s",
+                (int(now - 2 * max(RATE_LIMIT_WINDOW_MS / 1000, 3600)),),
+            )
+        row = rows[0] if rows else {"current_hits": 1, "previous_hits": 0}
+        return row["current_hits"], row["previous_hits"]
+
+
+def _estimate(current: int, previous: int, window_seconds: float, now: float) -> Tuple[float, float]:
+    """Return (weighted hit count, seconds elapsed in the current window)."""
+    elapsed = now - math.floor(now / window_seconds) * window_seconds
+    weight = 1 - elapsed / window_seconds
+    return current + previous * weight, elapsed
+
+
+def _retry_after(rule: RateLimitRule, current: int, previous: int, elapsed: float) -> int:
+    """Seconds until the weighted count drops back under the limit."""
+    if current >= rule.limit or previous <= 0:
+        return max(1, math.ceil(rule.window_seconds - elapsed))
+    # previous * (1 - t/window) + current < limit  =>  t > window * (1 - (limit - current) / previous)
+    needed = rule.window_seconds * (1 - (rule.limit - current) / previous)
+    return max(1, math.ceil(needed - elapsed))
+
+
+def _client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        # Only the entries our own proxies appended are trustworthy; anything left of them
+        # is whatever the client sent. Take the one added by the outermost trusted proxy.
+        forwarded = [
+            entry.strip()
+            for name, value in scope.get("headers", []) if name == b"x-forwarded-for"
+            for entry in value.decode("latin-1").split(",") if entry.strip()
+        ]
+        if forwarded:
+            return forwarded[-min(RATE_LIMIT_PROXY_HOPS, len(forwarded))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _token_claims(scope) -> dict:
+    """Best-effort user/company from the bearer token; never raises."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            auth = value.decode("latin-1")
+            if auth.lower().startswith("bearer "):
+                from app.middleware.auth import decode_token
+                try:
+                    return decode_token(auth[7:].strip())
+                except Exception:
+                    return {}
+    return {}
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, rules=None, store=None):
+        self.app = app
+        self.rules = rules if rules is not None else RATE_LIMIT_RULES
+        if store is not None:
+            self.store = store
+        elif RATE_LIMIT_BACKEND == "postgres":
+            self.store = PostgresRateLimitStore()
+        else:
+            self.store = MemoryRateLimitStore()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        matched = [rule for rule in self.rules if rule.matches(method, path)]
+        if not matched:
+            await self.app(scope, receive, send)
+            return
+
+        identities = {"ip": _client_ip(scope)}
+        if any(s in ("user", "company", "client") for rule in matched for s in rule.scopes):
+            claims = _token_claims(scope)
+            identities["user"] = claims.get("userId")
+            identities["company"] = claims.get("companyId")
+            identities["client"] = f"user:{identities['user']}" if identities["user"] else f"ip:{identities['ip']}"
+
+        now = time.time()
+        blocked = None
+        tightest = None
+        for rule in matched:
+            for scope_name in rule.scopes:
+                identity = identities.get(scope_name)
+                if not identity:
+                    continue
+                key = f"{rule.name}:{scope_name}:{identity}"
+                try:
+                    if isinstance(self.store, PostgresRateLimitStore):
+                        current, previous = await run_in_threadpool(self.store.hit, key, rule.window_seconds, now)
+                    else:
+                        current, previous = self.store.hit(key, rule.window_seconds, now)
+                except Exception as e:
+                    # Fail open: a broken limiter must not take the API down
+                    print(f"Rate limiter error: {e}")
+                    continue
+                estimated, elapsed = _estimate(current, previous, rule.window_seconds, now)
+                remaining = max(0, int(rule.limit - estimated))
+                if tightest is None or remaining < tightest[1]:
+                    tightest = (rule, remaining)
+                if estimated > rule.limit:
+                    retry = _retry_after(rule, current, previous, elapsed)
+                    if blocked is None or retry > blocked[1]:
+                        blocked = (rule, retry)
+
+        if blocked is not None:
+            rule, retry = blocked
+            body = json.dumps({"error": "Too many requests, please try again later."}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry).encode()),
+                    (b"x-ratelimit-limit", str(rule.limit).encode()),
+                    (b"x-ratelimit-remaining", b"0"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        if tightest is None:
+            await self.app(scope, receive, send)
+            return
+
+        limit_headers = [
+            (b"x-ratelimit-limit", str(tightest[0].limit).encode()),
+            (b"x-ratelimit-remaining", str(tightest[1]).encode()),
+        ]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + limit_headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,49 @@
+# app/middleware/read_consistency.py
+"""
+Read-your-writes across workers when reads go to replicas.
+
+Carries the `db_lsn` cookie (the WAL position of the client's last write)
+into the request, so replica-preferring reads wait for a replica that has
+replayed it, and sets the cookie on responses to requests that wrote.
+A no-op when DATABASE_REPLICA_URLS is unset.
+"""
+from http.cookies import CookieError, SimpleCookie
+
+from app.config.replicas import (
+    LSN_COOKIE, MUTATING_METHODS, REPLICA_STICKY_SECONDS, ReadConsistency, read_consistency, replicas,
+)
+
+
+def _cookie_lsn(scope) -> int:
+    for name, value in scope.get("headers", []):
+        if name != b"cookie":
+            continue
+        try:
+            morsel = SimpleCookie(value.decode("latin-1")).get(LSN_COOKIE)
+        except CookieError:
+            return 0
+        if morsel and morsel.value.isdigit():
+            return int(morsel.value)
+    return 0
+
+
+class ReadConsistencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replicas:
+            await self.app(scope, receive, send)
+            return
+
+        consistency = ReadConsistency(_cookie_lsn(scope), scope["method"] in MUTATING_METHODS)
+        read_consistency.set(consistency)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and consistency.write_lsn:
+                cookie = (f"{LSN_COOKIE}={consistency.write_lsn}; Max-Age={int(REPLICA_STICKY_SECONDS)}; "
+                          "Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,39 @@
+# app/routers/admin.py
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from app.config.query_stats import get_query_stats
+from app.middleware.profiler import is_admin_token
+from app.services.profiler import folded_stacks, profiler, top_frames
+
+router = APIRouter()
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Operator access: X-Admin-Token must match PROFILER_TOKEN (disabled when unset)."""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not found")
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin_token)])
+async def list_profiles():
+    """Captured request profiles, newest first"""
+    return {"profiles": await run_in_threadpool(profiler.list_profiles)}
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def get_profile(profile_id: int, format: str = "json"):
+    """One profile as JSON (with top frames) or as folded stacks (?format=folded) for flamegraph tools"""
+    profile = await run_in_threadpool(profiler.get_profile, profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(folded_stacks(profile))
+    return {"profile": {**profile, "topFrames": top_frames(profile)}}
+
+
+@router.get("/queries", dependencies=[Depends(require_admin_token)])
+async def list_query_stats(limit: Optional[int] = None):
+    """Per-fingerprint query statistics, most total time first"""
+    return {"queries": get_query_stats(limit)}
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Callable, List, Optional
+import asyncio
 import os
-import google.generativeai as genai
-from app.routers.gemini import generate_leonardo_image, GEMINI_API_KEY
+import uuid
+from app.middleware.auth import get_current_user, get_optional_user
+from app.middleware.error_handler import AppError
+from app.services.ai_history import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, InvalidCursor, get_history_item, list_history, record_generation
+from app.services.leonardo import generate_image_cached
+from app.services.render_jobs import RenderJob, RenderJobNotSaved, RenderQueueFull, submit_job
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
 # Reuse the same Gemini configuration
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
 GEMINI_DISABLED = True  # hard-disable Gemini to avoid 404s/noise
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
 
 FALLBACK_MODELS = [
     GEMINI_MODEL,
@@ -30,6 +34,7 @@ class GenerateRequest(BaseModel):
     variants: int = 3
     projectId: Optional[str] = None
     generateAllViews: bool = False  # Generate front, left, right, top views together
+    forceRegenerate: bool = False  # bypass the render cache
 
 
 class UploadRequest(BaseModel):
@@ -37,55 +42,83 @@ class UploadRequest(BaseModel):
     type: str = "pdf"
 
 
-@router.post("/generate")
-async def generate_design(req: GenerateRequest):
-    if not req.prompt or not req.prompt.strip():
-        raise HTTPException(status_code=400, detail="Prompt is required")
+VIEW_SUFFIXES = [
+    ". EXACT SAME DESIGN from left side perspective, camera positioned to the left showing the side view of the same layout, same cabinets, same colors, same materials, same appliances, only camera angle changed to left side.",
+    ". EXACT SAME DESIGN from right side perspective, camera positioned to the right showing the side view of the same layout, same cabinets, same colors, same materials, same appliances, only camera angle changed to right side.",
+    ". EXACT SAME DESIGN from top-down bird's eye view, aerial perspective from above showing the same layout, same cabinets, same colors, same materials, same appliances, only camera angle changed to top view.",
+]
+
 
+def _error_detail(exc: BaseException) -> str:
+    if isinstance(exc, HTTPException):
+        return exc.detail if isinstance(exc.detail, str) else str(exc.detail)
+    return str(exc)
+
+
+async def _generate_view(prompt: str, tenant_id: Optional[str], variant: int, force_regenerate: bool,
+                         on_done: Optional[Callable] = None) -> dict:
+    try:
+        return await generate_image_cached(prompt, tenant_id, variant, force_regenerate)
+    finally:
+        if on_done:
+            on_done()
+
+
+def count_design_generations(req: GenerateRequest) -> int:
     variants_to_create = max(1, min(req.variants or 1, 3))
+    return variants_to_create * (1 + len(VIEW_SUFFIXES) if req.generateAllViews else 1)
 
-    model = get_gemini_model()
-    results: List[dict] = []
 
+async def run_design_generation(req: GenerateRequest, tenant_id: Optional[str] = None,
+                                on_progress: Optional[Callable] = None) -> List[dict]:
+    """
+    Generate all variants (and camera views) concurrently.
+
+    Every variant/view is its own generation, bounded by the global and
+    per-tenant slots. A failed side view is dropped; a failed front view
+    marks the variant as errored but keeps any side views that succeeded.
+    """
+    variants_to_create = max(1, min(req.variants or 1, 3))
+
+    # Gemini enhancement is disabled; use raw prompt
+    enhanced_prompt = req.prompt.strip()
+    view_prompts = [enhanced_prompt]
+    if req.generateAllViews:
+        view_prompts += [enhanced_prompt + suffix for suffix in VIEW_SUFFIXES]
+
+    outcomes = await asyncio.gather(
+        *[
+            _generate_view(view_prompt, tenant_id, idx, req.forceRegenerate, on_progress)
+            for idx in range(variants_to_create)
+            for view_prompt in view_prompts
+        ],
+        return_exceptions=True,
+    )
+
+    results: List[dict] = []
+    views_per_variant = len(view_prompts)
     for idx in range(variants_to_create):
-        enhanced_prompt = req.prompt.strip()
+        variant_outcomes = outcomes[idx * views_per_variant:(idx + 1) * views_per_variant]
+        front = variant_outcomes[0]
         image_urls = []
+        proxy_urls = []
         image_error: Optional[str] = None
+        cached = False
 
-        # Gemini enhancement is disabled; use raw prompt
-        enhanced_prompt = req.prompt.strip()
-
-        try:
-            # Generate front view
-            leonardo_result = generate_leonardo_image(enhanced_prompt)
-            front_image_urls = leonardo_result.get("image_urls", [])
-            image_urls.extend(front_image_urls)
-            
-            # If generateAllViews is True, generate all angles at once for consistency
-            if req.generateAllViews and front_image_urls:
-                view_prompts = [
-                    (enhanced_prompt + ". EXACT SAME DESIGN from left side perspective, camera positioned to the left showing the side view of the same layout, same cabinets, same colors, same materials, same appliances, only camera angle changed to left side."),
-                    (enhanced_prompt + ". EXACT SAME DESIGN from right side perspective, camera positioned to the right showing the side view of the same layout, same cabinets, same colors, same materials, same appliances, only camera angle changed to right side."),
-                    (enhanced_prompt + ". EXACT SAME DESIGN from top-down bird's eye view, aerial perspective from above showing the same layout, same cabinets, same colors, same materials, same appliances, only camera angle changed to top view.")
-                ]
-                
-                for view_prompt in view_prompts:
-                    try:
-                        view_result = generate_leonardo_image(view_prompt)
-                        view_images = view_result.get("image_urls", [])
-                        if view_images:
-                            image_urls.extend(view_images)
-                    except Exception:
-                        # If one view fails, continue with others
-                        pass
-                        
-            image_status = leonardo_result.get("status")
-        except HTTPException as e:
-            image_error = e.detail if isinstance(e.detail, str) else str(e.detail)
-            image_status = "error"
-        except Exception as e:
-            image_error = str(e)
+        if isinstance(front, BaseException):
+            image_error = _error_detail(front)
             image_status = "error"
+        else:
+            image_urls.extend(front.get("image_urls", []))
+            proxy_urls.extend(front.get("proxy_urls") or [])
+            image_status = front.get("status")
+            cached = front.get("cached", False)
+
+        for view in variant_outcomes[1:]:
+            # If one view fails, keep the others
+            if not isinstance(view, BaseException):
+                image_urls.extend(view.get("image_urls", []))
+                proxy_urls.extend(view.get("proxy_urls") or [])
 
         results.append(
             {
@@ -93,12 +126,73 @@ async def generate_design(req: GenerateRequest):
                 "title": f"Variant {idx+1}",
                 "enhanced_prompt": enhanced_prompt,
                 "image_urls": image_urls,
+                "proxy_urls": proxy_urls,
                 "status": image_status,
                 "image_error": image_error,
+                "cached": cached,
             }
         )
+    return results
 
-    return {"success": True, "variants": results}
+
+@router.post("/generate")
+async def generate_design(req: GenerateRequest, current_user: Optional[dict] = Depends(get_optional_user)):
+    if not req.prompt or not req.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt is required")
+    if req.projectId:
+        try:
+            uuid.UUID(req.projectId)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid projectId")
+
+    tenant_id = current_user["companyId"] if current_user else None
+    results = await run_design_generation(req, tenant_id)
+
+    history_id = None
+    if req.projectId and tenant_id:
+        # Keep the result so it can be found again instead of regenerated
+        try:
+            history_id = await run_in_threadpool(
+                record_generation, tenant_id, req.projectId, req.prompt.strip(),
+                {
+                    "kind": "design",
+                    "status": "complete" if any(v["image_urls"] for v in results) else "failed",
+                    "request": {"variants": req.variants, "generateAllViews": req.generateAllViews},
+                    "variants": results,
+                },
+            )
+        except Exception as e:
+            print(f"Failed to record AI designer history: {e}")
+
+    return {"success": True, "variants": results, "historyId": history_id}
+
+
+@router.post("/jobs")
+async def submit_design_job(req: GenerateRequest, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Queue a design generation and return a job id to poll at /api/jobs/{id}"""
+    if not req.prompt or not req.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt is required")
+    if req.projectId:
+        try:
+            uuid.UUID(req.projectId)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid projectId")
+
+    tenant_id = current_user["companyId"] if current_user else None
+
+    async def run(job: RenderJob) -> dict:
+        variants = await run_design_generation(req, tenant_id, on_progress=job.advance)
+        return {"success": True, "variants": variants}
+
+    try:
+        job = await submit_job(RenderJob(
+            "design", req.prompt.strip(), run, tenant_id, req.projectId,
+            total_steps=count_design_generations(req),
+        ))
+    except (RenderQueueFull, RenderJobNotSaved) as e:
+        raise AppError(str(e), 503)
+
+    return {"jobId": job.id, "status": job.status, "statusUrl": f"/api/jobs/{job.id}"}
 
 
 @router.post("/upload")
@@ -108,7 +202,28 @@ async def upload_placeholder(req: UploadRequest):
 
 
 @router.get("/history")
-async def history():
-    # Will return recent prompts/variants.
-    return {"items": []}
+async def history(
+    projectId: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+):
+    """Recent prompts and their results, newest first; pass nextCursor back for the next page."""
+    if projectId:
+        try:
+            uuid.UUID(projectId)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid projectId")
+    try:
+        return await run_in_threadpool(list_history, current_user["companyId"], projectId, cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/history/{item_id}")
+async def history_item(item_id: str, current_user: dict = Depends(get_current_user)):
+    item = await run_in_threadpool(get_history_item, current_user["companyId"], item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="History item not found")
+    return {"item": item}
 
@@ -1,28 +1,21 @@
 # app/routers/auth.py
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
-from passlib.context import CryptContext
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 import os
 import re
 import psycopg2
-import hashlib
 from psycopg2.extras import RealDictCursor
 from app.config.db import execute_query, get_db, return_db
 from app.middleware.error_handler import AppError
+from app.services.passwords import (
+    PasswordQueueFull,
+    hash_password,
+    verify_password,
+)
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def prepare_password_for_bcrypt(password: str) -> str:
-    """
-    Pre-hash password with SHA-256 to allow passwords longer than bcrypt's 72-byte limit.
-    Returns a hex string (64 characters = 64 bytes when UTF-8 encoded).
-    """
-    password_bytes = password.encode('utf-8')
-    sha256_binary = hashlib.sha256(password_bytes).digest()
-    return sha256_binary.hex()
 
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_EXPIRES_IN = os.getenv("JWT_EXPIRES_IN", "7d")
@@ -45,34 +38,38 @@ def create_company_slug(name: str) -> str:
     slug = re.sub(r'^-+|-+$', '', slug)
     return slug
 
-def get_unique_company_slug(base_slug: str) -> str:
-    """Get a unique company slug, appending number if needed"""
-    from app.config.db import execute_query
-    
-    slug = base_slug
-    counter = 1
-    
-    while True:
-        existing = execute_query(
-            "SELECT id FROM companies WHERE slug = %s",
-            (slug,)
-        )
-        
-        if not existing:
-            return slug
-        
-        # Slug exists, try with number suffix
-        slug = f"{base_slug}-{counter}"
-        counter += 1
-        
-        # Safety limit
-        if counter > 1000:
-            # Use timestamp as fallback
-            import time
-            slug = f"{base_slug}-{int(time.time())}"
-            break
+# Highest numeric suffix already taken for a base slug (-1 if the base itself is free).
+# Slugs only contain [a-z0-9-], so the LIKE prefix needs no escaping and can use
+# the text_pattern_ops index on companies(slug).
+MAX_SLUG_SUFFIX_QUERY = """
+    SELECT COALESCE(MAX(
+        CASE WHEN slug = %(base)s THEN 0
+             ELSE CAST(substring(slug FROM %(suffix_start)s) AS BIGINT)
+        END
+    ), -1) AS max_suffix
+    FROM companies
+    WHERE slug = %(base)s
+       OR (slug LIKE %(prefix)s AND substring(slug FROM %(suffix_start)s) ~ '^[0-9]{1,18}$')
+"""
+
+def get_unique_company_slug(base_slug: str, cur=None) -> str:
+    """Get a unique company slug in one query, appending the next free number if needed"""
+    params = {
+        "base": base_slug,
+        "prefix": f"{base_slug}-%",
+        "suffix_start": len(base_slug) + 2,
+    }
+    if cur is not None:
+        cur.execute(MAX_SLUG_SUFFIX_QUERY, params)
+        row = cur.fetchone()
+    else:
+        rows = execute_query(MAX_SLUG_SUFFIX_QUERY, params)
+        row = rows[0] if rows else None
     
-    return slug
+    max_suffix = row["max_suffix"] if row else -1
+    if max_suffix < 0:
+        return base_slug
+    return f"{base_slug}-{max_suffix + 1}"
 
 def get_jwt_expires_in() -> timedelta:
     """Parse JWT_EXPIRES_IN string to timedelta"""
@@ -118,20 +115,10 @@ async def register(request: RegisterRequest):
         
         # Create company with unique slug
         base_slug = create_company_slug(request.companyName)
-        company_slug = get_unique_company_slug(base_slug)
         
         # Hash password: pre-hash with SHA-256 to support any length, then bcrypt
-        # Use SHA-256 binary digest (32 bytes) converted to hex (64 chars) to ensure it's well under 72 bytes
-        password_bytes = request.password.encode('utf-8')
-        sha256_binary = hashlib.sha256(password_bytes).digest()
-        # Convert to hex string for bcrypt (64 characters, 64 bytes when UTF-8 encoded)
-        prepared_password = sha256_binary.hex()
-        
-        # Double-check it's safe for bcrypt
-        if len(prepared_password.encode('utf-8')) > 72:
-            raise AppError("Internal error: password preparation failed", 500)
-        
-        password_hash = pwd_context.hash(prepared_password)
+        # Runs in the bcrypt worker pool so the event loop stays responsive
+        password_hash = await hash_password(request.password)
         
         # Use a single connection for both operations to ensure consistency
         conn = get_db()
@@ -141,35 +128,25 @@ async def register(request: RegisterRequest):
         
         try:
             cur = conn.cursor(cursor_factory=RealDictCursor)
+            company_slug = get_unique_company_slug(base_slug, cur)
             
-            # Create company
-            try:
+            # Create company. ON CONFLICT keeps the transaction usable if a concurrent
+            # signup grabbed the same slug; we then allocate the next one and retry.
+            company_row = None
+            for _ in range(5):
                 cur.execute(
                     """
                     INSERT INTO companies (name, slug) 
                     VALUES (%s, %s)
+                    ON CONFLICT (slug) DO NOTHING
                     RETURNING id, name, slug
                     """,
                     (request.companyName, company_slug)
                 )
                 company_row = cur.fetchone()
-            except psycopg2.IntegrityError as db_error:
-                error_msg = str(db_error)
-                # Handle duplicate slug constraint violation
-                if "duplicate key" in error_msg.lower() or "unique constraint" in error_msg.lower() or "companies_slug_key" in error_msg.lower():
-                    # Try again with a new unique slug
-                    company_slug = get_unique_company_slug(base_slug)
-                    cur.execute(
-                        """
-                        INSERT INTO companies (name, slug) 
-                        VALUES (%s, %s)
-                        RETURNING id, name, slug
-                        """,
-                        (request.companyName, company_slug)
-                    )
-                    company_row = cur.fetchone()
-                else:
-                    raise
+                if company_row:
+                    break
+                company_slug = get_unique_company_slug(base_slug, cur)
             
             if not company_row:
                 raise AppError("Failed to create company - no result returned", 500)
@@ -243,6 +220,8 @@ async def register(request: RegisterRequest):
         }
     except HTTPException:
         raise
+    except PasswordQueueFull as e:
+        raise AppError(str(e), 503)
     except Exception as e:
         print(f"Registration error: {e}")
         raise AppError(str(e), 500)
@@ -267,31 +246,24 @@ async def login(request: LoginRequest):
         
         user = result[0]
         
-        # Verify password: try new method (SHA-256 + bcrypt) first, then fallback to old method (direct bcrypt)
-        # This ensures backward compatibility with existing users
-        password_valid = False
-        
-        try:
-            prepared_password = prepare_password_for_bcrypt(request.password)
-            password_valid = pwd_context.verify(prepared_password, user["password_hash"])
-        except (ValueError, Exception) as e:
-            # If new method fails due to error (not just wrong password), try old method
-            pass
-        
-        # If new method fails, try old method for backward compatibility (only if password is <= 72 bytes)
-        if not password_valid:
-            try:
-                # Only try old method if password fits bcrypt limit to avoid errors
-                password_bytes = request.password.encode('utf-8')
-                if len(password_bytes) <= 72:
-                    password_valid = pwd_context.verify(request.password, user["password_hash"])
-            except (ValueError, Exception):
-                # Old method also failed, password is invalid
-                password_valid = False
+        # Verify password in the bcrypt worker pool: new method (SHA-256 + bcrypt) first,
+        # then the legacy direct-bcrypt fallback for existing users
+        password_valid, needs_upgrade = await verify_password(request.password, user["password_hash"])
         
         if not password_valid:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
+        # Transparently rehash legacy (or outdated-cost) hashes so future logins verify once
+        if needs_upgrade:
+            try:
+                new_hash = await hash_password(request.password)
+                execute_query(
+                    "UPDATE users SET password_hash = %s WHERE id = %s",
+                    (new_hash, user["id"])
+                )
+            except Exception as e:
+                print(f"Password hash upgrade failed for user {user['id']}: {e}")
+        
         # Generate token
         token = create_token(str(user["id"]), str(user["company_id"]), user["role"])
         
@@ -312,6 +284,8 @@ async def login(request: LoginRequest):
         }
     except HTTPException:
         raise
+    except PasswordQueueFull as e:
+        raise AppError(str(e), 503)
     except Exception as e:
         print(f"Login error: {e}")
         raise AppError(str(e), 500)
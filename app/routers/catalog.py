@@ -1,8 +1,20 @@
 # app/routers/catalog.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Any, List
+from app.config.replicas import prefer_replica
 from app.middleware.auth import get_current_user
+from app.services.catalog_store import CatalogStore
+from app.services.plan_symbols import (
+    IMMUTABLE_CACHE_CONTROL,
+    SPRITE_SIZES,
+    PlanSymbolError,
+    compile_symbol,
+    get_compiled_symbol,
+    render_sprite,
+    symbol_hash,
+)
 
 router = APIRouter()
 
@@ -21,24 +33,74 @@ class BlockDefinition(BaseModel):
     description: Optional[str] = None
     planSymbols: Optional[List[Any]] = None
 
-# In-memory catalog (can be replaced with database)
-runtime_catalog: List[BlockDefinition] = []
+# Stored in Postgres, cached per worker process
+catalog_store = CatalogStore(BlockDefinition.model_validate)
 
-@router.get("/blocks")
+def find_compiled_symbol(symbol_key: str):
+    """Look up a compiled symbol, recompiling from the catalog if it was evicted"""
+    compiled = get_compiled_symbol(symbol_key)
+    if compiled is not None:
+        return compiled
+    for block in catalog_store.all():
+        if symbol_hash(block.planSymbols, block.width, block.height) == symbol_key:
+            return compile_symbol(block.planSymbols, block.width, block.height)
+    raise HTTPException(status_code=404, detail="Symbol not found")
+
+def immutable_response(request: Request, content: bytes, media_type: str, etag: str) -> Response:
+    """Serve a content-addressed artifact with long-lived cache headers"""
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": f'"{etag}"'}
+    if request.headers.get("if-none-match") == f'"{etag}"':
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+@router.get("/blocks", dependencies=[Depends(prefer_replica)])
 async def get_blocks(current_user: dict = Depends(get_current_user)):
     """Get all catalog blocks"""
-    return {"blocks": runtime_catalog}
+    blocks = catalog_store.all()
+    symbols = {}
+    for block in blocks:
+        try:
+            symbols[block.id] = compile_symbol(block.planSymbols, block.width, block.height).to_dict()
+        except PlanSymbolError:
+            continue
+    return {"blocks": blocks, "symbols": symbols}
 
 @router.post("/blocks")
 async def create_block(block: BlockDefinition, current_user: dict = Depends(get_current_user)):
     """Create or update a catalog block"""
-    global runtime_catalog
-    
-    # Remove existing block with same id
-    runtime_catalog = [b for b in runtime_catalog if b.id != block.id]
+    # Validate and precompile plan symbols before accepting the block
+    try:
+        compiled = compile_symbol(block.planSymbols, block.width, block.height)
+    except PlanSymbolError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Add new block
-    runtime_catalog.append(block)
+    # Replace any existing block with the same id
+    catalog_store.upsert(block)
     
-    return {"block": block}
+    return {"block": block, "symbol": compiled.to_dict()}
+
+@router.get("/blocks/{block_id}/symbol", dependencies=[Depends(prefer_replica)])
+async def get_block_symbol(block_id: str, current_user: dict = Depends(get_current_user)):
+    """Get the compiled plan symbol for a block"""
+    block = catalog_store.get(block_id)
+    if not block:
+        raise HTTPException(status_code=404, detail="Block not found")
+    try:
+        compiled = compile_symbol(block.planSymbols, block.width, block.height)
+    except PlanSymbolError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"symbol": compiled.to_dict()}
+
+# Compiled artifacts are content-addressed and public so browsers/CDNs can cache them forever
+@router.get("/symbols/{symbol_key}.svg", dependencies=[Depends(prefer_replica)])
+async def get_symbol_svg(symbol_key: str, request: Request):
+    compiled = find_compiled_symbol(symbol_key)
+    return immutable_response(request, compiled.svg.encode("utf-8"), "image/svg+xml", compiled.hash)
 
+@router.get("/symbols/{symbol_key}/{size}.png", dependencies=[Depends(prefer_replica)])
+async def get_symbol_sprite(symbol_key: str, size: int, request: Request):
+    if size not in SPRITE_SIZES:
+        raise HTTPException(status_code=404, detail="Sprite size not available")
+    compiled = find_compiled_symbol(symbol_key)
+    sprite = await run_in_threadpool(render_sprite, compiled, size)
+    return immutable_response(request, sprite, "image/png", f"{compiled.hash}-{size}")
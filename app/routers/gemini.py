@@ -1,13 +1,14 @@
 # backend/app/routers/gemini.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional
 import os
-import time
-import requests
-import google.generativeai as genai
-import base64
-from io import BytesIO
+import hmac
+import uuid
+from app.middleware.auth import get_optional_user
+from app.middleware.error_handler import AppError
+from app.services.leonardo import LEONARDO_API_KEY, LEONARDO_WEBHOOK_SECRET, generate_image_cached, handle_webhook
+from app.services.render_jobs import RenderJob, RenderJobNotSaved, RenderQueueFull, submit_job
 
 router = APIRouter()
 
@@ -22,15 +23,22 @@ FALLBACK_MODELS = [
     "gemini-1.5-flash-latest",
     "gemini-pro",
 ]
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+_genai = None
 
-def get_gemini_model():
-    return None  # Gemini intentionally disabled
+def get_genai():
+    """Gemini SDK, imported and configured on first use (importing it costs ~0.3s of cold start)"""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        if GEMINI_API_KEY:
+            genai.configure(api_key=GEMINI_API_KEY)
+        _genai = genai
+    return _genai
 
-LEONARDO_API_KEY = os.getenv("LEONARDO_API_KEY")
-LEONARDO_MODEL_ID = os.getenv("LEONARDO_MODEL_ID", "1e60896f-3c26-4296-8ecc-53e2afecc132")
-LEONARDO_API_URL = os.getenv("LEONARDO_API_URL", "https://cloud.leonardo.ai/api/rest/v1")
+def get_gemini_model():
+    if GEMINI_DISABLED:
+        return None  # Gemini intentionally disabled
+    return get_genai().GenerativeModel(GEMINI_MODEL)
 
 class KitchenElement(BaseModel):
     type: str
@@ -48,25 +56,21 @@ class GenerateKitchenRequest(BaseModel):
     ceilingColor: str = "#FFFFFF"
     kitchenShape: Optional[str] = None  # 'l-shape', 'u-shape', 'galley', etc.
     generateImage: bool = False
+    projectId: Optional[str] = None
+    forceRegenerate: bool = False  # bypass the render cache
 
 def convertDesignToPrompt(elements: List[KitchenElement], wallColor: str, floorColor: str, ceilingColor: str, kitchenShape: Optional[str]) -> str:
     """Convert design elements to a descriptive prompt for Gemini"""
     
-    # Detect kitchen shape from elements
-    walls = [e for e in elements if e.type == 'wall']
-    baseCabinets = [e for e in elements if e.furnitureType in ['base-cabinet', 'cabinet']]
-    wallCabinets = [e for e in elements if e.furnitureType == 'wall-cabinet']
-    sinks = [e for e in elements if e.furnitureType == 'sink']
-    stoves = [e for e in elements if e.furnitureType == 'stove']
-    refrigerators = [e for e in elements if e.furnitureType == 'refrigerator']
-    
-    # Build description
-    shape_desc = kitchenShape or "modern"
-    if len(walls) >= 3:
-        if kitchenShape:
-            shape_desc = f"{kitchenShape} kitchen"
-        else:
-            shape_desc = "U-shaped kitchen" if len(walls) == 3 else "L-shaped kitchen"
+    # NumPy-backed; imported here so it isn't loaded at startup
+    from app.services.layout_analysis import analyze_layout, describe_shape
+
+    # Classify elements and infer the layout from geometry in one pass
+    layout = analyze_layout(elements)
+    counts = layout["counts"]
+
+    # Build description; an explicit shape from the client wins
+    shape_desc = kitchenShape or describe_shape(layout) or "modern"
     
     # Color descriptions
     color_map = {
@@ -78,11 +82,9 @@ def convertDesignToPrompt(elements: List[KitchenElement], wallColor: str, floorC
     floor_color_name = color_map.get(floorColor, "light gray")
     
     # Cabinet description
-    cabinet_color = "light wood" if baseCabinets else "white"
-    if baseCabinets:
-        first_cabinet = baseCabinets[0]
-        if first_cabinet.fill:
-            cabinet_color = color_map.get(first_cabinet.fill, "light wood")
+    cabinet_color = "light wood" if counts["baseCabinets"] else "white"
+    if layout["firstBaseCabinetFill"]:
+        cabinet_color = color_map.get(layout["firstBaseCabinetFill"], "light wood")
     
     prompt = f"""Create a photorealistic, professional interior design rendering of a {shape_desc} kitchen.
 
@@ -92,16 +94,25 @@ Design specifications:
 - Floor: {floor_color_name} flooring
 - Cabinets: {cabinet_color} base cabinets and wall cabinets
 - Countertops: white marble or quartz countertops sitting flat on base cabinets
-- Number of base cabinets: {len(baseCabinets)}
-- Number of wall cabinets: {len(wallCabinets)}
+- Number of base cabinets: {counts["baseCabinets"]}
+- Number of wall cabinets: {counts["wallCabinets"]}
 """
     
-    if sinks:
+    if layout["runs"]:
+        runs = ", ".join(f"{run['orientation']} run of {run['elements']} units" for run in layout["runs"])
+        prompt += f"- Cabinet runs: {runs}\n"
+    if layout["island"]:
+        prompt += "- Kitchen island: free-standing island with matching countertop\n"
+    if layout["peninsula"]:
+        prompt += "- Peninsula: counter extending from the cabinet run\n"
+    if counts["sinks"]:
         prompt += f"- Kitchen sink: stainless steel sink integrated into countertop\n"
-    if stoves:
+    if counts["stoves"]:
         prompt += f"- Gas stove: black gas stove positioned flat on countertop\n"
-    if refrigerators:
+    if counts["refrigerators"]:
         prompt += f"- Refrigerator: stainless steel refrigerator\n"
+    if layout["workTriangle"]:
+        prompt += "- Sink, stove and refrigerator arranged as a work triangle\n"
     
     prompt += """
 Style requirements:
@@ -118,102 +129,8 @@ Camera angle: Interior view from inside the kitchen, eye level perspective showi
     
     return prompt
 
-def generate_leonardo_image(prompt: str) -> dict:
-    """Create an image with Leonardo and return urls + metadata."""
-    if not LEONARDO_API_KEY:
-        raise HTTPException(
-            status_code=500,
-            detail="Leonardo API key not configured"
-        )
-    
-    headers = {
-        "Authorization": f"Bearer {LEONARDO_API_KEY}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-    
-    try:
-        create_payload = {
-            "prompt": prompt,
-            "modelId": LEONARDO_MODEL_ID,
-            # Leonardo accepts specific sizes; keep within 1024 range for reliability.
-            "width": 1024,
-            "height": 768,
-            "num_images": 1,
-            "guidance_scale": 7,
-            "public": False,
-        }
-        create_resp = requests.post(
-            f"{LEONARDO_API_URL}/generations",
-            json=create_payload,
-            headers=headers,
-            timeout=30
-        )
-        if create_resp.status_code >= 400:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Failed to create Leonardo generation: {create_resp.status_code} {create_resp.text}"
-            )
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Failed to create Leonardo generation: {str(e)}"
-        )
-    
-    generation_id = create_resp.json().get("sdGenerationJob", {}).get("generationId")
-    if not generation_id:
-        raise HTTPException(
-            status_code=502,
-            detail="Leonardo generationId missing from response"
-        )
-    
-    # Poll for completion
-    deadline = time.time() + 60  # up to ~1 minute
-    while time.time() < deadline:
-        time.sleep(4)
-        try:
-            poll_resp = requests.get(
-                f"{LEONARDO_API_URL}/generations/{generation_id}",
-                headers=headers,
-                timeout=20
-            )
-            poll_resp.raise_for_status()
-        except requests.RequestException as e:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Failed to fetch Leonardo generation status: {str(e)}"
-            )
-        
-        gen_data = poll_resp.json().get("generations_by_pk") or {}
-        status = (gen_data.get("status") or "").upper()
-        
-        if status in ["COMPLETE", "COMPLETED", "FINISHED"]:
-            images = gen_data.get("generated_images") or []
-            image_urls = [img.get("url") for img in images if img.get("url")]
-            if not image_urls:
-                raise HTTPException(
-                    status_code=502,
-                    detail="Leonardo generation completed without images"
-                )
-            return {
-                "generation_id": generation_id,
-                "image_urls": image_urls,
-                "status": status.lower()
-            }
-        
-        if status in ["FAILED", "ERROR"]:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Leonardo generation failed with status {status}"
-            )
-    
-    raise HTTPException(
-        status_code=504,
-        detail="Leonardo generation timed out before completion"
-    )
-
 @router.post("/generate-kitchen")
-async def generate_kitchen_image(request: GenerateKitchenRequest):
+async def generate_kitchen_image(request: GenerateKitchenRequest, current_user: Optional[dict] = Depends(get_optional_user)):
     """Generate a photorealistic kitchen image; Gemini enhancement is disabled."""
     
     try:
@@ -237,7 +154,11 @@ async def generate_kitchen_image(request: GenerateKitchenRequest):
                 leonardo_error = "Leonardo API key not configured"
             else:
                 try:
-                    leonardo_result = generate_leonardo_image(enhanced_prompt)
+                    leonardo_result = await generate_image_cached(
+                        enhanced_prompt,
+                        current_user["companyId"] if current_user else None,
+                        force_regenerate=request.forceRegenerate
+                    )
                 except HTTPException as e:
                     leonardo_error = e.detail if isinstance(e.detail, str) else str(e.detail)
                 except Exception as e:
@@ -254,8 +175,10 @@ async def generate_kitchen_image(request: GenerateKitchenRequest):
             response_body.update({
                 "image_provider": "leonardo",
                 "image_urls": leonardo_result.get("image_urls"),
+                "proxy_urls": leonardo_result.get("proxy_urls"),
                 "generation_id": leonardo_result.get("generation_id"),
-                "status": leonardo_result.get("status")
+                "status": leonardo_result.get("status"),
+                "cached": leonardo_result.get("cached", False)
             })
         elif leonardo_error:
             response_body["image_error"] = leonardo_error
@@ -269,7 +192,7 @@ async def generate_kitchen_image(request: GenerateKitchenRequest):
         )
 
 @router.post("/generate-kitchen-image")
-async def generate_kitchen_image_direct(request: GenerateKitchenRequest):
+async def generate_kitchen_image_direct(request: GenerateKitchenRequest, current_user: Optional[dict] = Depends(get_optional_user)):
     """Generate kitchen image using Gemini's image generation (if available)"""
     
     if not LEONARDO_API_KEY:
@@ -287,15 +210,21 @@ async def generate_kitchen_image_direct(request: GenerateKitchenRequest):
             request.kitchenShape
         )
         
-        image_result = generate_leonardo_image(prompt)
+        image_result = await generate_image_cached(
+            prompt,
+            current_user["companyId"] if current_user else None,
+            force_regenerate=request.forceRegenerate
+        )
         
         return {
             "success": True,
             "prompt": prompt,
             "image_provider": "leonardo",
             "image_urls": image_result.get("image_urls"),
+            "proxy_urls": image_result.get("proxy_urls"),
             "generation_id": image_result.get("generation_id"),
-            "status": image_result.get("status")
+            "status": image_result.get("status"),
+            "cached": image_result.get("cached", False)
         }
         
     except Exception as e:
@@ -304,3 +233,68 @@ async def generate_kitchen_image_direct(request: GenerateKitchenRequest):
             detail=f"Failed to generate image: {str(e)}"
         )
 
+
+@router.post("/jobs")
+async def submit_kitchen_render_job(request: GenerateKitchenRequest, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Queue a kitchen render and return a job id to poll at /api/jobs/{id}"""
+    
+    if request.projectId:
+        try:
+            uuid.UUID(request.projectId)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid projectId")
+    
+    if not LEONARDO_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="Leonardo API key not configured"
+        )
+    
+    prompt = convertDesignToPrompt(
+        request.elements,
+        request.wallColor,
+        request.floorColor,
+        request.ceilingColor,
+        request.kitchenShape
+    )
+    tenant_id = current_user["companyId"] if current_user else None
+    
+    async def run(job: RenderJob) -> dict:
+        image_result = await generate_image_cached(prompt, tenant_id, force_regenerate=request.forceRegenerate)
+        return {
+            "success": True,
+            "prompt": prompt,
+            "image_provider": "leonardo",
+            "image_urls": image_result.get("image_urls"),
+            "proxy_urls": image_result.get("proxy_urls"),
+            "generation_id": image_result.get("generation_id"),
+            "status": image_result.get("status"),
+            "cached": image_result.get("cached", False)
+        }
+    
+    try:
+        job = await submit_job(RenderJob("kitchen", prompt, run, tenant_id, request.projectId))
+    except (RenderQueueFull, RenderJobNotSaved) as e:
+        raise AppError(str(e), 503)
+    
+    return {"jobId": job.id, "status": job.status, "statusUrl": f"/api/jobs/{job.id}"}
+
+@router.post("/leonardo/callback")
+async def leonardo_callback(request: Request):
+    """Leonardo completion webhook; resolves the matching pending generation early (on whichever worker waits for it)"""
+    
+    if not LEONARDO_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    auth_header = request.headers.get("authorization", "")
+    token = auth_header[7:] if auth_header.lower().startswith("bearer ") else auth_header
+    if not hmac.compare_digest(token.encode("utf-8"), LEONARDO_WEBHOOK_SECRET.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Webhook body must be a JSON object")
+    return {"received": True, "matched": await handle_webhook(payload)}
@@ -0,0 +1,84 @@
+# app/routers/jobs.py
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import asyncio
+import json
+import time
+from app.middleware.auth import get_optional_user
+from app.services.render_jobs import TERMINAL_STATUSES, get_job, load_persisted_job
+
+router = APIRouter()
+
+# How often a stream re-reads a job that runs on another worker
+JOB_POLL_SECONDS = 1.0
+
+def find_visible_job(job_id: str, current_user: Optional[dict]):
+    """Return the in-memory job if the caller may see it"""
+    job = get_job(job_id)
+    if job is None:
+        return None
+    if job.tenant_id and (not current_user or current_user["companyId"] != job.tenant_id):
+        return None
+    return job
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Get render job status, progress and result"""
+    job = find_visible_job(job_id, current_user)
+    if job is not None:
+        return {"job": job.to_dict()}
+    
+    # Job runs (or ran) on another worker; read its saved state
+    tenant_id = current_user["companyId"] if current_user else None
+    persisted = await run_in_threadpool(load_persisted_job, job_id, tenant_id)
+    if persisted:
+        return {"job": persisted}
+    
+    raise HTTPException(status_code=404, detail="Job not found")
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Server-sent events with job progress until it completes or fails"""
+    job = find_visible_job(job_id, current_user)
+    if job is not None:
+        return _event_stream(_local_events(job))
+    
+    tenant_id = current_user["companyId"] if current_user else None
+    snapshot = await run_in_threadpool(load_persisted_job, job_id, tenant_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _event_stream(_persisted_events(job_id, tenant_id, snapshot))
+
+def _sse(snapshot: dict) -> str:
+    return f"event: {snapshot['status']}\ndata: {json.dumps(snapshot, default=str)}\n\n"
+
+async def _local_events(job):
+    while True:
+        snapshot = job.to_dict()
+        yield _sse(snapshot)
+        if snapshot["status"] in TERMINAL_STATUSES:
+            break
+        await job.wait_for_change(15)
+
+async def _persisted_events(job_id: str, tenant_id: Optional[str], snapshot: dict):
+    """Follow a job running on another worker through its saved state"""
+    last_sent = time.monotonic()
+    yield _sse(snapshot)
+    while snapshot["status"] not in TERMINAL_STATUSES:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        latest = await run_in_threadpool(load_persisted_job, job_id, tenant_id)
+        if latest is None:
+            break
+        if latest != snapshot or time.monotonic() - last_sent >= 15:
+            last_sent = time.monotonic()
+            yield _sse(latest)
+        snapshot = latest
+
+def _event_stream(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
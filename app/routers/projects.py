@@ -1,5 +1,5 @@
 # app/routers/projects.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Any
 import json
@@ -7,6 +7,7 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from app.middleware.auth import get_current_user
 from app.config.db import execute_query, get_db, return_db
+from app.config.replicas import prefer_replica
 from app.middleware.error_handler import AppError
 
 router = APIRouter()
@@ -20,7 +21,7 @@ class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
 
-@router.get("/")
+@router.get("/", dependencies=[Depends(prefer_replica)])
 async def get_projects(current_user: dict = Depends(get_current_user)):
     try:
         company_id = current_user["companyId"]
@@ -43,7 +44,7 @@ async def get_projects(current_user: dict = Depends(get_current_user)):
         print(f"Get projects error: {e}")
         raise AppError(str(e), 500)
 
-@router.get("/{project_id}")
+@router.get("/{project_id}", dependencies=[Depends(prefer_replica)])
 async def get_project(project_id: str, current_user: dict = Depends(get_current_user)):
     try:
         company_id = current_user["companyId"]
@@ -216,8 +217,13 @@ async def update_project(project_id: str, project: ProjectUpdate, current_user:
         print(f"Update project error: {e}")
         raise AppError(str(e), 500)
 
+def check_saved_version(project_id: str, version: int):
+    """Run design checks for a saved version (NumPy-backed, so imported on first save rather than at startup)"""
+    from app.services.design_checks import check_project_version
+    check_project_version(project_id, version)
+
 @router.post("/{project_id}/data")
-async def save_project_data(project_id: str, data: dict, current_user: dict = Depends(get_current_user)):
+async def save_project_data(project_id: str, data: dict, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
     try:
         company_id = current_user["companyId"]
         
@@ -247,6 +253,9 @@ async def save_project_data(project_id: str, data: dict, current_user: dict = De
             (project_id, json.dumps(data), next_version)
         )
         
+        # Re-check changed elements for collisions/clearance after the response
+        background_tasks.add_task(check_saved_version, project_id, next_version)
+        
         return {"message": "Project data saved", "version": next_version}
     except HTTPException:
         raise
@@ -254,6 +263,37 @@ async def save_project_data(project_id: str, data: dict, current_user: dict = De
         print(f"Save project data error: {e}")
         raise AppError(str(e), 500)
 
+@router.get("/{project_id}/suggestions", dependencies=[Depends(prefer_replica)])
+async def get_project_suggestions(project_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        company_id = current_user["companyId"]
+        
+        # Verify project belongs to company
+        project = execute_query(
+            "SELECT id FROM projects WHERE id = %s AND company_id = %s",
+            (project_id, company_id)
+        )
+        
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        
+        result = execute_query(
+            """
+            SELECT id, issue_type, severity, description, element_ids, suggestion, fix_action, applied, created_at
+            FROM ai_suggestions
+            WHERE project_id = %s
+            ORDER BY CASE severity WHEN 'error' THEN 0 WHEN 'warning' THEN 1 ELSE 2 END, created_at DESC
+            """,
+            (project_id,)
+        )
+        
+        return {"suggestions": result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Get suggestions error: {e}")
+        raise AppError(str(e), 500)
+
 @router.delete("/{project_id}")
 async def delete_project(project_id: str, current_user: dict = Depends(get_current_user)):
     try:
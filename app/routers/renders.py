@@ -0,0 +1,73 @@
+# app/routers/renders.py
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import Optional
+import re
+from app.services.render_images import VARIANT_FORMATS, get_variant
+
+router = APIRouter()
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def pick_format(request: Request, fmt: Optional[str]) -> str:
+    """Explicit ?fmt= wins, otherwise WebP when the client accepts it"""
+    if fmt:
+        if fmt not in VARIANT_FORMATS:
+            raise HTTPException(status_code=400, detail="Unsupported image format")
+        return fmt
+    return "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+
+def parse_range(range_header: str, size: int):
+    """Parse a single 'bytes=start-end' range; returns (start, end) or None"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # Suffix range: last N bytes
+        start = max(0, size - int(match.group(2)))
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        return None
+    return start, end
+
+@router.get("/{generation_id}/image")
+async def get_render_image(
+    generation_id: str,
+    request: Request,
+    w: Optional[int] = Query(default=None, ge=1, le=4096),
+    index: int = Query(default=0, ge=0, le=16),
+    fmt: Optional[str] = None,
+):
+    """Serve a cached, resized copy of a generated render image"""
+    image_format = pick_format(request, fmt)
+    data, name = await get_variant(generation_id, index, w, image_format)
+    etag = f'"{name}"'
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept",
+    }
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    size = len(data)
+    
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        return Response(
+            content=data[start:end + 1],
+            status_code=206,
+            media_type=VARIANT_FORMATS[image_format],
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+        )
+    
+    return Response(content=data, media_type=VARIANT_FORMATS[image_format], headers=headers)
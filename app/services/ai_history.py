@@ -0,0 +1,117 @@
+# app/services/ai_history.py
+"""
+AI designer history stored in `ai_prompts`.
+
+Synchronous generations are written as {"kind", "status", "request",
+"variants"}; background jobs already persist {"job": {...}} rows (see
+render_jobs), so the list query projects the same small set of fields out of
+either shape in SQL and never ships the full variant payloads. Pages use a
+(created_at, id) keyset cursor served by idx_ai_prompts_project_created.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.config.db import execute_query
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Both row shapes: direct results and persisted render jobs
+_VARIANTS = "COALESCE(ap.result->'variants', ap.result->'job'->'result'->'variants', '[]'::jsonb)"
+
+_LIST_COLUMNS = f"""
+    ap.id, ap.project_id, ap.prompt, ap.created_at,
+    COALESCE(ap.result->>'kind', ap.result->'job'->>'kind') AS kind,
+    COALESCE(ap.result->>'status', ap.result->'job'->>'status') AS status,
+    jsonb_array_length({_VARIANTS}) AS variant_count,
+    {_VARIANTS}->0->'proxy_urls'->>0 AS thumbnail_url
+"""
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), str(uuid.UUID(row_id))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def record_generation(tenant_id: str, project_id: str, prompt: str, result: dict) -> Optional[str]:
+    """Store a generation for a project owned by the tenant; returns the row id (None if not owned)."""
+    rows = execute_query(
+        """
+        INSERT INTO ai_prompts (project_id, prompt, result)
+        SELECT p.id, %s, %s
+        FROM projects p
+        WHERE p.id = %s AND p.company_id = %s
+        RETURNING id
+        """,
+        (prompt, json.dumps(result, default=str), project_id, tenant_id)
+    )
+    return str(rows[0]["id"]) if rows else None
+
+
+def list_history(tenant_id: str, project_id: Optional[str] = None, cursor: Optional[str] = None,
+                 limit: int = HISTORY_PAGE_SIZE) -> dict:
+    """One page of history for a project (or every project of the tenant), newest first."""
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    conditions = ["p.company_id = %s"]
+    params: list = [tenant_id]
+    if project_id:
+        conditions.append("ap.project_id = %s")
+        params.append(project_id)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        conditions.append("(ap.created_at, ap.id) < (%s, %s::uuid)")
+        params += [created_at, row_id]
+    params.append(limit + 1)
+
+    rows = execute_query(
+        f"""
+        SELECT {_LIST_COLUMNS}
+        FROM ai_prompts ap
+        JOIN projects p ON ap.project_id = p.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY ap.created_at DESC, ap.id DESC
+        LIMIT %s
+        """,
+        tuple(params)
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return {"items": rows, "nextCursor": next_cursor}
+
+
+def get_history_item(tenant_id: str, item_id: str) -> Optional[dict]:
+    """Full stored result for one history entry."""
+    try:
+        uuid.UUID(item_id)
+    except ValueError:
+        return None
+    rows = execute_query(
+        f"""
+        SELECT ap.id, ap.project_id, ap.prompt, ap.created_at, {_VARIANTS} AS variants,
+               COALESCE(ap.result->>'kind', ap.result->'job'->>'kind') AS kind,
+               COALESCE(ap.result->>'status', ap.result->'job'->>'status') AS status
+        FROM ai_prompts ap
+        JOIN projects p ON ap.project_id = p.id
+        WHERE ap.id = %s AND p.company_id = %s
+        """,
+        (item_id, tenant_id)
+    )
+    return rows[0] if rows else None
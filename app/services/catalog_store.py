@@ -0,0 +1,73 @@
+# app/services/catalog_store.py
+"""
+Catalog blocks shared by every worker process.
+
+Blocks live in the `catalog_blocks` table; each process serves reads from
+an in-memory snapshot (dict by id, oldest update first) that is reloaded
+when older than CATALOG_REFRESH_SECONDS. A write goes to the table and into
+the writer's snapshot at once, so the writer reads its own change
+immediately and other workers within the refresh interval.
+"""
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from app.config.db import execute_query
+
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "2"))
+
+
+class CatalogStore:
+    def __init__(self, parse, refresh_seconds: float = CATALOG_REFRESH_SECONDS):
+        self._parse = parse
+        self._refresh_seconds = refresh_seconds
+        self._blocks: dict = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self._refresh_seconds
+
+    def _load(self):
+        rows = execute_query("SELECT id, definition FROM catalog_blocks ORDER BY updated_at, id")
+        blocks = {}
+        for row in rows:
+            try:
+                blocks[row["id"]] = self._parse(row["definition"])
+            except ValueError as e:
+                print(f"Skipping invalid catalog block {row['id']}: {e}")
+        with self._lock:
+            self._blocks = blocks
+            self._loaded_at = time.monotonic()
+
+    def _snapshot(self) -> dict:
+        if not self._fresh():
+            self._load()
+        return self._blocks
+
+    def all(self) -> List:
+        return list(self._snapshot().values())
+
+    def get(self, block_id: str):
+        return self._snapshot().get(block_id)
+
+    def _save(self, block_id: str, definition: dict):
+        execute_query(
+            """
+            INSERT INTO catalog_blocks (id, definition)
+            VALUES (%s, %s)
+            ON CONFLICT (id) DO UPDATE SET definition = EXCLUDED.definition, updated_at = CURRENT_TIMESTAMP
+            """,
+            (block_id, json.dumps(definition))
+        )
+
+    def upsert(self, block):
+        """Create or replace a block (a replaced block moves to the end, like a new one)."""
+        self._save(block.id, block.model_dump())
+        with self._lock:
+            blocks = dict(self._blocks)
+            blocks.pop(block.id, None)
+            blocks[block.id] = block
+            self._blocks = blocks
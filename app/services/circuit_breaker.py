@@ -0,0 +1,105 @@
+# app/services/circuit_breaker.py
+"""
+Failure-rate circuit breaker for outbound provider calls.
+
+closed    -> calls flow; outcomes are recorded in a sliding time window.
+open      -> the failure rate crossed the threshold; calls fail fast until
+             the cool-down elapses.
+half_open -> a limited number of probe calls are let through; a success
+             closes the circuit, a failure re-opens it.
+
+Outcomes recorded with `passive=True` come from calls the breaker does not
+gate (e.g. status polls of work already accepted): they count toward the
+failure rate while closed, but never decide a half-open probe.
+"""
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = 0.5, min_calls: int = 10,
+                 window_seconds: float = 60, open_seconds: float = 30, half_open_calls: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._outcomes = deque()  # (timestamp, ok)
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call should not be attempted."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self.state = "half_open"
+                self.opened_at = now
+                self._probes = 0
+            if self.state == "half_open":
+                # A probe that never reported back (e.g. cancelled) must not wedge the circuit
+                if self._probes >= self.half_open_calls and now - self.opened_at >= self.open_seconds:
+                    self.opened_at = now
+                    self._probes = 0
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open, probe in progress")
+                self._probes += 1
+
+    def record_success(self, passive: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if passive and self.state != "closed":
+                return
+            if self.state == "half_open":
+                self.state = "closed"
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self, passive: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if passive and self.state != "closed":
+                return
+            if self.state == "half_open":
+                self._open(now)
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self._outcomes.clear()
+        print(f"⚠️  Circuit {self.name} opened")
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                "state": self.state,
+                "calls_in_window": len(self._outcomes),
+                "failures_in_window": failures,
+                "rejected": self.rejected,
+            }
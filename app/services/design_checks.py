@@ -0,0 +1,417 @@
+# app/services/design_checks.py
+"""
+Design checks that fill the `ai_suggestions` table.
+
+Elements are axis-aligned rectangles from the saved project data. Candidate
+pairs come from a sweep-and-prune pass (sort by min x, binary-search the
+overlap window, prune on y) instead of testing every pair, and all checks
+run vectorized over those pairs:
+
+- collision:     elements at the same mounting level (floor or upper
+                 cabinets) that overlap each other, or anything cutting into
+                 a wall;
+- clearance:     something standing in front of an appliance that needs room
+                 to open, or inside a door's swing;
+- accessibility: walkways between counters/walls narrower than
+                 MIN_AISLE_WIDTH (narrower than RECOMMENDED_AISLE_WIDTH is a
+                 clearance warning).
+
+After a save only pairs that involve an element changed since the version
+the stored suggestions describe (`projects.suggestions_version`) are
+re-checked; suggestions for untouched elements are kept. Storing is a
+compare-and-set on that version, so a check that finishes late (on another
+worker, or for an older save) never overwrites suggestions for a newer one.
+
+Distances are in inches; set DESIGN_UNITS_PER_INCH when plans use other units.
+"""
+import json
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from app.config.db import execute_query, get_db, return_db
+
+DESIGN_UNITS_PER_INCH = float(os.getenv("DESIGN_UNITS_PER_INCH", "1"))
+
+OVERLAP_TOLERANCE = 0.5
+MIN_AISLE_WIDTH = 36
+RECOMMENDED_AISLE_WIDTH = 42
+# Gaps narrower than this are fillers between units, not walkways
+MIN_WALKWAY_GAP = 12
+# Room needed in front of appliances to open them (doors use their own width)
+FRONT_CLEARANCE = {
+    "refrigerator": 36,
+    "dishwasher": 21,
+    "oven": 30,
+    "stove": 30,
+}
+
+WALL_TYPES = {"wall"}
+OPENING_TYPES = {"door", "window", "opening"}
+UPPER_TYPES = {"wall-cabinet"}
+
+_project_locks: dict = {}
+_project_locks_guard = threading.Lock()
+
+
+def _kind(element: dict) -> str:
+    return element.get("furnitureType") or element.get("type") or "element"
+
+
+def _label(kind: str) -> str:
+    return kind.replace("-", " ")
+
+
+def _parse_elements(elements: list) -> tuple:
+    """Keep elements with a footprint; return (ids, kinds, rects) in design units."""
+    ids, kinds, rows = [], [], []
+    for index, element in enumerate(elements or []):
+        if not isinstance(element, dict):
+            continue
+        try:
+            x, y = float(element["x"]), float(element["y"])
+            width, height = float(element.get("width") or 0), float(element.get("height") or 0)
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not width or not height:
+            continue
+        ids.append(str(element.get("id", index)))
+        kinds.append(_kind(element))
+        rows.append((min(x, x + width), min(y, y + height), max(x, x + width), max(y, y + height)))
+    rects = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+    return ids, kinds, rects
+
+
+def candidate_pairs(rects: np.ndarray, margin: float) -> tuple:
+    """Sweep-and-prune: index pairs (a, b) whose rects come within `margin` of each other."""
+    n = len(rects)
+    if n < 2:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    order = np.argsort(rects[:, 0], kind="stable")
+    min_x = rects[order, 0]
+    max_x = rects[order, 2]
+    # Everything after i in sort order up to `ends[i]` starts before i ends (plus margin)
+    ends = np.searchsorted(min_x, max_x + margin, side="right")
+    counts = np.maximum(ends - np.arange(1, n + 1), 0)
+    first = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    a, b = order[first], order[first + 1 + offsets]
+    keep = (rects[a, 1] <= rects[b, 3] + margin) & (rects[b, 1] <= rects[a, 3] + margin)
+    return a[keep], b[keep]
+
+
+def _gaps(rects: np.ndarray, a: np.ndarray, b: np.ndarray) -> tuple:
+    """Per-axis separation between paired rects (negative = overlap depth)."""
+    gap_x = np.maximum(rects[b, 0] - rects[a, 2], rects[a, 0] - rects[b, 2])
+    gap_y = np.maximum(rects[b, 1] - rects[a, 3], rects[a, 1] - rects[b, 3])
+    return gap_x, gap_y
+
+
+def _away(rects: np.ndarray, mover: int, other: int, axis: int) -> float:
+    """+1 if `mover` lies on the positive side of `other` along `axis`, else -1."""
+    return 1.0 if rects[mover, axis] + rects[mover, axis + 2] >= rects[other, axis] + rects[other, axis + 2] else -1.0
+
+
+def _move(axis: int, delta: float) -> dict:
+    delta = round(float(delta), 2)
+    return {"dx": delta, "dy": 0.0} if axis == 0 else {"dx": 0.0, "dy": delta}
+
+
+def _clear_of(mover: np.ndarray, obstacle: np.ndarray, axis: int, sign: float) -> float:
+    """Signed distance moving `mover` in direction `sign` until it no longer overlaps `obstacle`."""
+    if sign > 0:
+        return obstacle[axis + 2] - mover[axis]
+    return -(mover[axis + 2] - obstacle[axis])
+
+
+def _cross_pairs(left: np.ndarray, right: np.ndarray, tolerance: float) -> tuple:
+    """Sweep-and-prune between two sets: index pairs (li, ri) of rects overlapping by more than `tolerance`."""
+    combined = np.concatenate([left, right])
+    a, b = candidate_pairs(combined, 0.0)
+    a_left = a < len(left)
+    mixed = a_left != (b < len(left))
+    li = np.where(a_left, a, b)[mixed]
+    ri = np.where(a_left, b, a)[mixed]
+    gx, gy = _gaps(combined, li, ri)
+    hit = (gx < -tolerance) & (gy < -tolerance)
+    return li[hit], ri[hit] - len(left)
+
+
+def _occupied(gaps: np.ndarray, rects: np.ndarray, tolerance: float) -> np.ndarray:
+    """Which gap rects have some element in them."""
+    occupied = np.zeros(len(gaps), dtype=bool)
+    occupied[_cross_pairs(gaps, rects, tolerance)[0]] = True
+    return occupied
+
+
+def _issue(issue_type: str, severity: str, description: str, element_ids: list,
+           suggestion: str, fix_action: Optional[dict]) -> dict:
+    return {
+        "issue_type": issue_type,
+        "severity": severity,
+        "description": description,
+        "element_ids": element_ids,
+        "suggestion": suggestion,
+        "fix_action": fix_action,
+    }
+
+
+def _clearance_zones(kinds: np.ndarray, rects: np.ndarray, walls: np.ndarray, scale: float) -> tuple:
+    """Return (owner index, zone rect, axis it extends along) for every element that needs room in front of it."""
+    owners, zones, axes = [], [], []
+    widths = rects[:, 2] - rects[:, 0]
+    heights = rects[:, 3] - rects[:, 1]
+
+    # Doors: swing direction is unknown, so reserve the door width on both sides
+    doors = np.flatnonzero(np.isin(kinds, list(OPENING_TYPES)))
+    if len(doors):
+        r = rects[doors]
+        horizontal = (widths[doors] >= heights[doors])[:, None]
+        reach = np.maximum(widths[doors], heights[doors])
+        before = np.where(horizontal, np.stack([r[:, 0], r[:, 1] - reach, r[:, 2], r[:, 1]], axis=1),
+                          np.stack([r[:, 0] - reach, r[:, 1], r[:, 0], r[:, 3]], axis=1))
+        after = np.where(horizontal, np.stack([r[:, 0], r[:, 3], r[:, 2], r[:, 3] + reach], axis=1),
+                         np.stack([r[:, 2], r[:, 1], r[:, 2] + reach, r[:, 3]], axis=1))
+        owners += [doors, doors]
+        zones += [before, after]
+        axes += [np.where(horizontal[:, 0], 1, 0)] * 2
+
+    # Appliances: the front faces away from the nearest wall
+    need = np.array([FRONT_CLEARANCE.get(kind, 0) for kind in kinds], dtype=np.float64) * scale
+    appliances = np.flatnonzero(need > 0)
+    if len(appliances) and len(walls):
+        r = rects[appliances]
+        dx = np.maximum(0, np.maximum(walls[None, :, 0] - r[:, None, 2], r[:, None, 0] - walls[None, :, 2]))
+        dy = np.maximum(0, np.maximum(walls[None, :, 1] - r[:, None, 3], r[:, None, 1] - walls[None, :, 3]))
+        distance = np.hypot(dx, dy)
+        nearest = np.argmin(distance, axis=1)
+        # Free-standing appliances are left to the walkway checks
+        against_wall = distance[np.arange(len(r)), nearest] <= np.minimum(widths[appliances], heights[appliances])
+        r, wall, reach = r[against_wall], walls[nearest[against_wall]], need[appliances[against_wall]]
+        wall_horizontal = (wall[:, 2] - wall[:, 0]) >= (wall[:, 3] - wall[:, 1])
+        zone = np.where(
+            wall_horizontal[:, None],
+            np.where((wall[:, 1] < r[:, 1])[:, None],
+                     np.stack([r[:, 0], r[:, 3], r[:, 2], r[:, 3] + reach], axis=1),
+                     np.stack([r[:, 0], r[:, 1] - reach, r[:, 2], r[:, 1]], axis=1)),
+            np.where((wall[:, 0] < r[:, 0])[:, None],
+                     np.stack([r[:, 2], r[:, 1], r[:, 2] + reach, r[:, 3]], axis=1),
+                     np.stack([r[:, 0] - reach, r[:, 1], r[:, 0], r[:, 3]], axis=1)),
+        )
+        owners.append(appliances[against_wall])
+        zones.append(zone)
+        axes.append(np.where(wall_horizontal, 1, 0))
+
+    if not owners:
+        return np.empty(0, dtype=np.intp), np.empty((0, 4)), np.empty(0, dtype=np.intp)
+    return np.concatenate(owners), np.concatenate(zones), np.concatenate(axes)
+
+
+def check_design(elements: list, changed_ids: Optional[set] = None) -> list:
+    """
+    Run all checks and return suggestion dicts.
+
+    With `changed_ids`, only issues involving at least one changed element
+    are returned (the rest are assumed unchanged since the last run).
+    """
+    ids, kinds, rects = _parse_elements(elements)
+    if not ids:
+        return []
+    scale = DESIGN_UNITS_PER_INCH
+    tolerance = OVERLAP_TOLERANCE * scale
+    kinds_arr = np.asarray(kinds, dtype=object)
+    is_wall = np.isin(kinds_arr, list(WALL_TYPES))
+    is_opening = np.isin(kinds_arr, list(OPENING_TYPES))
+    is_upper = np.isin(kinds_arr, list(UPPER_TYPES))
+    if changed_ids is None:
+        changed = np.ones(len(ids), dtype=bool)
+    else:
+        changed = np.isin(np.asarray(ids, dtype=object), list(changed_ids))
+
+    issues = []
+    a, b = candidate_pairs(rects, RECOMMENDED_AISLE_WIDTH * scale)
+    relevant = changed[a] | changed[b]
+    a, b = a[relevant], b[relevant]
+    gap_x, gap_y = _gaps(rects, a, b)
+
+    # Collisions: same mounting level (walls span both), not two walls, openings sit in walls by design
+    collide = (
+        (gap_x < -tolerance) & (gap_y < -tolerance)
+        & ((is_upper[a] == is_upper[b]) | is_wall[a] | is_wall[b])
+        & ~(is_wall[a] & is_wall[b])
+        & ~is_opening[a] & ~is_opening[b]
+    )
+    for i, j in zip(a[collide], b[collide]):
+        mover, other = (i, j) if is_wall[j] else (j, i)
+        # Smallest move that separates them, along either axis
+        moves = [_clear_of(rects[mover], rects[other], axis, _away(rects, mover, other, axis)) for axis in (0, 1)]
+        axis = 0 if abs(moves[0]) <= abs(moves[1]) else 1
+        what = "cuts into the wall" if is_wall[other] else f"overlaps the {_label(kinds[other])}"
+        issues.append(_issue(
+            "collision", "error",
+            f"The {_label(kinds[mover])} {what}.",
+            [ids[i], ids[j]],
+            f"Move the {_label(kinds[mover])} {round(abs(moves[axis]) / scale, 1)} in. to clear it.",
+            {"action": "move", "elementId": ids[mover], **_move(axis, moves[axis])},
+        ))
+
+    # Walkways: floor elements facing each other across an empty gap that is too narrow
+    floor = ~is_upper[a] & ~is_upper[b] & ~is_opening[a] & ~is_opening[b] & ~(is_wall[a] & is_wall[b])
+    fillers = rects[~is_upper & ~is_opening]
+    for axis, gap, overlap in ((0, gap_x, -gap_y), (1, gap_y, -gap_x)):
+        narrow = floor & (overlap > tolerance) & (gap >= MIN_WALKWAY_GAP * scale) & (gap < RECOMMENDED_AISLE_WIDTH * scale)
+        i, j = a[narrow], b[narrow]
+        # The open space between the pair, over the span where they face each other
+        other = 1 - axis
+        space = np.empty((len(i), 4))
+        space[:, axis] = np.minimum(rects[i, axis + 2], rects[j, axis + 2])
+        space[:, axis + 2] = np.maximum(rects[i, axis], rects[j, axis])
+        space[:, other] = np.maximum(rects[i, other], rects[j, other])
+        space[:, other + 2] = np.minimum(rects[i, other + 2], rects[j, other + 2])
+        walkway = ~_occupied(space, fillers, tolerance)
+        for i, j, width in zip(i[walkway], j[walkway], gap[narrow][walkway]):
+            mover, other = (i, j) if is_wall[j] else (j, i)
+            inches = round(float(width) / scale, 1)
+            blocking = inches < MIN_AISLE_WIDTH
+            issues.append(_issue(
+                "accessibility" if blocking else "clearance",
+                "error" if blocking else "warning",
+                f"Walkway between the {_label(kinds[i])} and the {_label(kinds[j])} is {inches} in. wide.",
+                [ids[i], ids[j]],
+                f"Widen the walkway to at least {RECOMMENDED_AISLE_WIDTH} in.",
+                {"action": "move", "elementId": ids[mover],
+                 **_move(axis, _away(rects, mover, other, axis) * (RECOMMENDED_AISLE_WIDTH * scale - width))},
+            ))
+
+    # Appliance and door clearance zones
+    owners, zones, axes = _clearance_zones(kinds_arr, rects, rects[is_wall], scale)
+    obstacles = np.flatnonzero(~is_wall & ~is_upper & ~is_opening)
+    if len(owners) and len(obstacles):
+        zi, oi = _cross_pairs(zones, rects[obstacles], tolerance)
+        owner, obstacle = owners[zi], obstacles[oi]
+        keep = (owner != obstacle) & (changed[owner] | changed[obstacle])
+        for zone_index, owner, obstacle in zip(zi[keep], owner[keep], obstacle[keep]):
+            owner_kind = _label(kinds[owner])
+            axis = axes[zone_index]
+            shift = _clear_of(rects[obstacle], zones[zone_index], axis, _away(rects, obstacle, owner, axis))
+            issues.append(_issue(
+                "clearance", "warning",
+                f"The {_label(kinds[obstacle])} blocks the clearance in front of the {owner_kind}.",
+                [ids[owner], ids[obstacle]],
+                f"Keep the area in front of the {owner_kind} clear so it can open fully.",
+                {"action": "move", "elementId": ids[obstacle],
+                 **_move(axis, shift)},
+            ))
+
+    return issues
+
+
+def _elements_of(data: Optional[dict]) -> list:
+    if not isinstance(data, dict):
+        return []
+    elements = data.get("elements")
+    return elements if isinstance(elements, list) else []
+
+
+def changed_element_ids(previous: list, current: list) -> Optional[set]:
+    """
+    Ids of added, modified or removed elements, or None if everything must be
+    re-checked (no previous version, or a wall moved and clearances shift).
+    """
+    if not previous:
+        return None
+    before = {str(e.get("id", i)): e for i, e in enumerate(previous) if isinstance(e, dict)}
+    after = {str(e.get("id", i)): e for i, e in enumerate(current) if isinstance(e, dict)}
+    changed = {key for key in before.keys() | after.keys() if before.get(key) != after.get(key)}
+    if any(_kind(before.get(key) or after.get(key)) in WALL_TYPES for key in changed):
+        return None
+    return changed
+
+
+def _project_lock(project_id: str) -> threading.Lock:
+    with _project_locks_guard:
+        return _project_locks.setdefault(project_id, threading.Lock())
+
+
+def store_suggestions(project_id: str, version: int, base_version: Optional[int], issues: list,
+                      changed_ids: Optional[set]) -> bool:
+    """
+    Replace open suggestions for the changed elements (or all of them) in one
+    transaction and mark them as describing `version`. Returns False, writing
+    nothing, if the stored suggestions no longer describe `base_version`.
+    """
+    conn = get_db()
+    try:
+        with conn.cursor() as cur:
+            # The project's row lock serializes writers across workers
+            cur.execute(
+                """
+                UPDATE projects SET suggestions_version = %s
+                WHERE id = %s AND suggestions_version IS NOT DISTINCT FROM %s
+                """,
+                (version, project_id, base_version)
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False
+            if changed_ids is None:
+                cur.execute("DELETE FROM ai_suggestions WHERE project_id = %s AND applied = false", (project_id,))
+            elif changed_ids:
+                cur.execute(
+                    "DELETE FROM ai_suggestions WHERE project_id = %s AND applied = false AND element_ids && %s::text[]",
+                    (project_id, list(changed_ids))
+                )
+            if issues:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO ai_suggestions
+                        (project_id, issue_type, severity, description, element_ids, suggestion, fix_action,
+                         project_version)
+                    VALUES %s
+                    """,
+                    [
+                        (project_id, issue["issue_type"], issue["severity"], issue["description"],
+                         issue["element_ids"], issue["suggestion"], json.dumps(issue["fix_action"]), version)
+                        for issue in issues
+                    ]
+                )
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_db(conn)
+
+
+def check_project_version(project_id: str, version: int):
+    """Check a saved version against the one the stored suggestions describe and update ai_suggestions."""
+    with _project_lock(project_id):
+        try:
+            while True:
+                project = execute_query("SELECT suggestions_version FROM projects WHERE id = %s", (project_id,))
+                if not project:
+                    return
+                base_version = project[0]["suggestions_version"]
+                if base_version is not None and base_version >= version:
+                    return
+                rows = execute_query(
+                    "SELECT version, data_json FROM project_data WHERE project_id = %s AND version IN (%s, %s)",
+                    (project_id, version, version if base_version is None else base_version)
+                )
+                data = {row["version"]: row["data_json"] for row in rows}
+                if version not in data:
+                    return
+                current = _elements_of(data[version])
+                changed_ids = changed_element_ids(_elements_of(data.get(base_version)), current)
+                issues = check_design(current, changed_ids) if changed_ids is None or changed_ids else []
+                if store_suggestions(project_id, version, base_version, issues, changed_ids):
+                    return
+                # Another check stored first: start again from what it stored
+        except Exception as e:
+            print(f"Design check failed for project {project_id}: {e}")
@@ -0,0 +1,270 @@
+# app/services/layout_analysis.py
+"""
+Vectorized kitchen layout analysis.
+
+Turns a list of design elements into NumPy arrays once, classifies every
+element in a single pass, and derives the layout from geometry:
+
+- cabinet runs: counter elements (base cabinets, sinks, stoves, ...) that
+  sit against a wall (or, with no walls drawn, against an edge of the
+  layout's bounding box), with their run lengths;
+- shape: single-wall, galley, L-shaped, U-shaped or G-shaped, from which
+  edges carry runs and how those edges relate (parallel/perpendicular),
+  plus an island or peninsula from the free-standing counter elements;
+- work triangle: sink / stove / refrigerator distances.
+
+All lengths are in the design's own units.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+
+# Category codes
+OTHER, WALL, BASE, WALL_CABINET, SINK, STOVE, REFRIGERATOR, APPLIANCE = range(8)
+
+FURNITURE_CATEGORIES = {
+    "base-cabinet": BASE,
+    "cabinet": BASE,
+    "wall-cabinet": WALL_CABINET,
+    "sink": SINK,
+    "stove": STOVE,
+    "refrigerator": REFRIGERATOR,
+    "dishwasher": APPLIANCE,
+    "oven": APPLIANCE,
+    "tall-cabinet": APPLIANCE,
+}
+# Elements that stand on the floor and form counter runs
+COUNTER_CATEGORIES = (BASE, SINK, STOVE, REFRIGERATOR, APPLIANCE)
+
+# Cap per appliance type when searching for the tightest work triangle
+TRIANGLE_CANDIDATES = 64
+# Rows per block when testing rectangles against each other
+TOUCH_CHUNK = 512
+
+
+def _as_arrays(elements: Iterable) -> tuple:
+    """One pass over the elements: category codes plus an (n, 4) x/y/w/h array."""
+    rows = []
+    codes = []
+    fills = []
+    for e in elements:
+        if e.type == "wall":
+            codes.append(WALL)
+        else:
+            codes.append(FURNITURE_CATEGORIES.get(e.furnitureType, OTHER))
+        rows.append((e.x, e.y, e.width or 0.0, e.height or 0.0))
+        fills.append(e.fill)
+    geometry = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+    return np.asarray(codes, dtype=np.int8), geometry, fills
+
+
+def _normalize_rects(geometry: np.ndarray) -> np.ndarray:
+    """Return (n, 4) min_x, min_y, max_x, max_y (handles negative width/height)."""
+    x, y, w, h = geometry.T
+    return np.stack([np.minimum(x, x + w), np.minimum(y, y + h), np.maximum(x, x + w), np.maximum(y, y + h)], axis=1)
+
+
+def _wall_edges(wall_rects: np.ndarray) -> np.ndarray:
+    """Walls as axis-aligned centerline segments: (k, 5) x1, y1, x2, y2, horizontal."""
+    widths = wall_rects[:, 2] - wall_rects[:, 0]
+    heights = wall_rects[:, 3] - wall_rects[:, 1]
+    horizontal = widths >= heights
+    cy = (wall_rects[:, 1] + wall_rects[:, 3]) / 2
+    cx = (wall_rects[:, 0] + wall_rects[:, 2]) / 2
+    x1 = np.where(horizontal, wall_rects[:, 0], cx)
+    x2 = np.where(horizontal, wall_rects[:, 2], cx)
+    y1 = np.where(horizontal, cy, wall_rects[:, 1])
+    y2 = np.where(horizontal, cy, wall_rects[:, 3])
+    return np.stack([x1, y1, x2, y2, horizontal.astype(np.float64)], axis=1)
+
+
+def _bbox_edges(rects: np.ndarray) -> np.ndarray:
+    """The four sides of the bounding box of `rects`, in the same form as _wall_edges."""
+    min_x, min_y = rects[:, 0].min(), rects[:, 1].min()
+    max_x, max_y = rects[:, 2].max(), rects[:, 3].max()
+    return np.array([
+        [min_x, min_y, max_x, min_y, 1.0],  # top
+        [min_x, max_y, max_x, max_y, 1.0],  # bottom
+        [min_x, min_y, min_x, max_y, 0.0],  # left
+        [max_x, min_y, max_x, max_y, 0.0],  # right
+    ])
+
+
+def _rect_edge_distance(rects: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """(n, k) distance from each rect to each axis-aligned edge segment."""
+    r = rects[:, None, :]
+    e = edges[None, :, :]
+    seg_min_x = np.minimum(e[..., 0], e[..., 2])
+    seg_max_x = np.maximum(e[..., 0], e[..., 2])
+    seg_min_y = np.minimum(e[..., 1], e[..., 3])
+    seg_max_y = np.maximum(e[..., 1], e[..., 3])
+    dx = np.maximum(0, np.maximum(seg_min_x - r[..., 2], r[..., 0] - seg_max_x))
+    dy = np.maximum(0, np.maximum(seg_min_y - r[..., 3], r[..., 1] - seg_max_y))
+    return np.hypot(dx, dy)
+
+
+def _union_length(starts: np.ndarray, ends: np.ndarray) -> float:
+    """Total length covered by a set of 1-D intervals."""
+    if starts.size == 0:
+        return 0.0
+    order = np.argsort(starts)
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    # A new segment starts wherever an interval begins past everything before it
+    new_segment = np.empty(starts.size, dtype=bool)
+    new_segment[0] = True
+    new_segment[1:] = starts[1:] > reach[:-1]
+    segment_ids = np.cumsum(new_segment) - 1
+    segment_starts = starts[new_segment]
+    segment_ends = np.zeros(segment_starts.size)
+    np.maximum.at(segment_ends, segment_ids, reach)
+    return float((segment_ends - segment_starts).sum())
+
+
+def _touching(rects: np.ndarray, others: np.ndarray, gap: float) -> np.ndarray:
+    """For each rect, whether it lies within `gap` of any of `others` (chunked to bound memory)."""
+    result = np.zeros(len(rects), dtype=bool)
+    if not len(others):
+        return result
+    for start in range(0, len(rects), TOUCH_CHUNK):
+        chunk = rects[start:start + TOUCH_CHUNK, None, :]
+        gap_x = np.maximum(others[None, :, 0] - chunk[..., 2], chunk[..., 0] - others[None, :, 2])
+        gap_y = np.maximum(others[None, :, 1] - chunk[..., 3], chunk[..., 1] - others[None, :, 3])
+        result[start:start + TOUCH_CHUNK] = ((gap_x <= gap) & (gap_y <= gap)).any(axis=1)
+    return result
+
+
+def _connected_to(rects: np.ndarray, anchors: np.ndarray, gap: float) -> np.ndarray:
+    """Which rects reach an anchor through a chain of touching rects (frontier expansion)."""
+    reached = np.zeros(len(rects), dtype=bool)
+    frontier = anchors
+    while len(frontier):
+        pending = np.flatnonzero(~reached)
+        hit = pending[_touching(rects[pending], frontier, gap)]
+        reached[hit] = True
+        frontier = rects[hit]
+    return reached
+
+
+def _work_triangle(centers: np.ndarray, codes: np.ndarray) -> Optional[dict]:
+    sinks = centers[codes == SINK][:TRIANGLE_CANDIDATES]
+    stoves = centers[codes == STOVE][:TRIANGLE_CANDIDATES]
+    fridges = centers[codes == REFRIGERATOR][:TRIANGLE_CANDIDATES]
+    if not (len(sinks) and len(stoves) and len(fridges)):
+        return None
+    # Tightest triangle over all candidate combinations, by broadcasting
+    sink_stove = np.linalg.norm(sinks[:, None, None, :] - stoves[None, :, None, :], axis=-1)
+    stove_fridge = np.linalg.norm(stoves[None, :, None, :] - fridges[None, None, :, :], axis=-1)
+    fridge_sink = np.linalg.norm(fridges[None, None, :, :] - sinks[:, None, None, :], axis=-1)
+    perimeter = sink_stove + stove_fridge + fridge_sink
+    i, j, k = np.unravel_index(np.argmin(perimeter), perimeter.shape)
+    return {
+        "sinkToStove": float(sink_stove[i, j, 0]),
+        "stoveToRefrigerator": float(stove_fridge[0, j, k]),
+        "refrigeratorToSink": float(fridge_sink[i, 0, k]),
+        "perimeter": float(perimeter[i, j, k]),
+    }
+
+
+def _edges_shape(run_edges: np.ndarray) -> Optional[str]:
+    """Name the layout from the edges that carry cabinet runs."""
+    count = len(run_edges)
+    if count == 0:
+        return None
+    if count == 1:
+        return "single-wall"
+    horizontal = run_edges[:, 4].astype(bool)
+    if count == 2:
+        return "galley" if horizontal[0] == horizontal[1] else "L-shaped"
+    if count == 3:
+        return "U-shaped" if 0 < horizontal.sum() < 3 else "galley"
+    return "G-shaped"
+
+
+def analyze_layout(elements: Iterable) -> dict:
+    """Classify elements and infer shape, cabinet runs and work triangle."""
+    codes, geometry, fills = _as_arrays(elements)
+    counts = np.bincount(codes, minlength=8) if codes.size else np.zeros(8, dtype=np.int64)
+
+    analysis = {
+        "counts": {
+            "walls": int(counts[WALL]),
+            "baseCabinets": int(counts[BASE]),
+            "wallCabinets": int(counts[WALL_CABINET]),
+            "sinks": int(counts[SINK]),
+            "stoves": int(counts[STOVE]),
+            "refrigerators": int(counts[REFRIGERATOR]),
+            "appliances": int(counts[APPLIANCE]),
+        },
+        "shape": None,
+        "island": False,
+        "peninsula": False,
+        "runs": [],
+        "workTriangle": None,
+        "firstBaseCabinetFill": None,
+    }
+    if counts[BASE]:
+        analysis["firstBaseCabinetFill"] = fills[int(np.argmax(codes == BASE))]
+
+    counter_mask = np.isin(codes, COUNTER_CATEGORIES)
+    if not counter_mask.any():
+        return analysis
+
+    rects = _normalize_rects(geometry)
+    counter_rects = rects[counter_mask]
+    counter_codes = codes[counter_mask]
+    centers = (counter_rects[:, :2] + counter_rects[:, 2:]) / 2
+    analysis["workTriangle"] = _work_triangle(centers, counter_codes)
+
+    wall_mask = codes == WALL
+    edges = _wall_edges(rects[wall_mask]) if wall_mask.any() else _bbox_edges(counter_rects)
+
+    # Tolerance from typical cabinet depth (the short side of counter elements)
+    depth = np.median(np.minimum(counter_rects[:, 2] - counter_rects[:, 0], counter_rects[:, 3] - counter_rects[:, 1]))
+    tolerance = max(float(depth) * 0.75, 1e-6)
+
+    distances = _rect_edge_distance(counter_rects, edges)
+    nearest = np.argmin(distances, axis=1)
+    against_edge = distances[np.arange(len(counter_rects)), nearest] <= tolerance
+
+    run_edges = []
+    for edge_index in np.unique(nearest[against_edge]):
+        members = counter_rects[against_edge & (nearest == edge_index)]
+        edge = edges[edge_index]
+        axis = 0 if edge[4] else 1
+        length = _union_length(members[:, axis], members[:, axis + 2])
+        # Ignore a lone element that barely touches a wall
+        if len(members) < 2 and length < 2 * depth:
+            continue
+        run_edges.append(edge)
+        analysis["runs"].append({
+            "orientation": "horizontal" if edge[4] else "vertical",
+            "elements": int(len(members)),
+            "length": length,
+        })
+    run_edges = np.asarray(run_edges).reshape(-1, 5)
+    analysis["shape"] = _edges_shape(run_edges)
+
+    # Free-standing counters: connected (through each other) to a run -> peninsula, otherwise island
+    free = counter_rects[~against_edge]
+    if len(free):
+        connected = _connected_to(free, counter_rects[against_edge], tolerance * 0.1)
+        analysis["peninsula"] = bool(connected.any())
+        analysis["island"] = bool((~connected).any())
+        if analysis["shape"] is None:
+            analysis["shape"] = "island"
+
+    return analysis
+
+
+def describe_shape(analysis: dict) -> Optional[str]:
+    """Human-readable layout name, e.g. 'L-shaped with island'."""
+    shape = analysis.get("shape")
+    if not shape:
+        return None
+    extras = []
+    if analysis.get("island") and shape != "island":
+        extras.append("island")
+    if analysis.get("peninsula"):
+        extras.append("peninsula")
+    return f"{shape} with {' and '.join(extras)}" if extras else shape
@@ -0,0 +1,577 @@
+# app/services/leonardo.py
+"""
+Async Leonardo image generation client.
+
+All provider traffic goes through one shared httpx.AsyncClient (keep-alive
+connection pool). Pending generations are tracked by a single background
+poller with an adaptive schedule (or completed early by the webhook), so a
+pending render never blocks the event loop or needs its own task.
+
+A webhook usually lands on a worker that isn't waiting for that generation;
+it is then stored in `provider_callbacks`, which every worker's poller
+checks for its own pending generations every LEONARDO_CALLBACK_CHECK_SECONDS.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.config.db import execute_query
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.metrics import CallbackMetric, provider_errors_total, provider_request_duration_seconds
+from app.services.render_cache import cached_render
+
+LEONARDO_API_KEY = os.getenv("LEONARDO_API_KEY")
+LEONARDO_MODEL_ID = os.getenv("LEONARDO_MODEL_ID", "1e60896f-3c26-4296-8ecc-53e2afecc132")
+LEONARDO_API_URL = os.getenv("LEONARDO_API_URL", "https://cloud.leonardo.ai/api/rest/v1")
+
+LEONARDO_CREATE_TIMEOUT = float(os.getenv("LEONARDO_CREATE_TIMEOUT", "30"))
+LEONARDO_POLL_TIMEOUT = float(os.getenv("LEONARDO_POLL_TIMEOUT", "20"))
+# Total time we wait for a generation to finish
+LEONARDO_GENERATION_DEADLINE = float(os.getenv("LEONARDO_GENERATION_DEADLINE", "60"))
+# Poll delay starts at INITIAL and grows by BACKOFF up to MAX seconds
+LEONARDO_POLL_INITIAL = float(os.getenv("LEONARDO_POLL_INITIAL", "2"))
+LEONARDO_POLL_MAX = float(os.getenv("LEONARDO_POLL_MAX", "8"))
+LEONARDO_POLL_BACKOFF = float(os.getenv("LEONARDO_POLL_BACKOFF", "1.5"))
+# Shared secret Leonardo sends to our completion webhook (disabled if unset)
+LEONARDO_WEBHOOK_SECRET = os.getenv("LEONARDO_WEBHOOK_SECRET")
+# How often pending generations are looked up among webhooks received by other workers
+LEONARDO_CALLBACK_CHECK_SECONDS = float(os.getenv("LEONARDO_CALLBACK_CHECK_SECONDS", "1"))
+LEONARDO_MAX_CONNECTIONS = int(os.getenv("LEONARDO_MAX_CONNECTIONS", "50"))
+# Generations in flight at once, across the worker and per tenant
+LEONARDO_MAX_CONCURRENT = int(os.getenv("LEONARDO_MAX_CONCURRENT", "32"))
+LEONARDO_MAX_CONCURRENT_PER_TENANT = int(os.getenv("LEONARDO_MAX_CONCURRENT_PER_TENANT", "12"))
+# Bulkhead: generations a tenant may have waiting for a slot, and how long they may wait
+LEONARDO_MAX_QUEUED_PER_TENANT = int(os.getenv("LEONARDO_MAX_QUEUED_PER_TENANT", "24"))
+LEONARDO_SLOT_WAIT_TIMEOUT = float(os.getenv("LEONARDO_SLOT_WAIT_TIMEOUT", "30"))
+# Send a second (hedged) create request if the first hasn't answered after this many seconds; 0 = off
+LEONARDO_HEDGE_AFTER = float(os.getenv("LEONARDO_HEDGE_AFTER", "0"))
+
+breaker = CircuitBreaker(
+    "leonardo",
+    failure_rate=float(os.getenv("LEONARDO_BREAKER_FAILURE_RATE", "0.5")),
+    min_calls=int(os.getenv("LEONARDO_BREAKER_MIN_CALLS", "10")),
+    window_seconds=float(os.getenv("LEONARDO_BREAKER_WINDOW", "60")),
+    open_seconds=float(os.getenv("LEONARDO_BREAKER_OPEN_SECONDS", "30")),
+)
+
+_client: Optional[httpx.AsyncClient] = None
+_global_slots: Optional[asyncio.Semaphore] = None
+_tenant_slots: dict = {}  # tenant id -> [semaphore, holders]
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for the image provider (created on first use)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LEONARDO_MAX_CONNECTIONS,
+                max_keepalive_connections=min(20, LEONARDO_MAX_CONNECTIONS),
+            ),
+            timeout=httpx.Timeout(LEONARDO_POLL_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@asynccontextmanager
+async def generation_slot(tenant_id: Optional[str] = None):
+    """
+    Hold one global and one per-tenant generation slot for the duration of a render.
+
+    Acts as a per-tenant bulkhead: a tenant with too many generations queued,
+    or one that waits too long for a slot, gets a fast 503 instead of piling
+    up work that starves other tenants.
+    """
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(LEONARDO_MAX_CONCURRENT)
+    tenant_key = tenant_id or "anonymous"
+    entry = _tenant_slots.get(tenant_key)
+    if entry is None:
+        entry = _tenant_slots[tenant_key] = [asyncio.Semaphore(LEONARDO_MAX_CONCURRENT_PER_TENANT), 0]
+    if entry[1] >= LEONARDO_MAX_CONCURRENT_PER_TENANT + LEONARDO_MAX_QUEUED_PER_TENANT:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many image generations in progress, please try again shortly"
+        )
+    entry[1] += 1
+    acquired_tenant = acquired_global = False
+    try:
+        try:
+            await asyncio.wait_for(entry[0].acquire(), LEONARDO_SLOT_WAIT_TIMEOUT)
+            acquired_tenant = True
+            await asyncio.wait_for(_global_slots.acquire(), LEONARDO_SLOT_WAIT_TIMEOUT)
+            acquired_global = True
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="Image generation capacity exhausted, please try again shortly"
+            )
+        yield
+    finally:
+        if acquired_global:
+            _global_slots.release()
+        if acquired_tenant:
+            entry[0].release()
+        entry[1] -= 1
+        # Forget idle tenants so the map stays bounded
+        if entry[1] == 0 and _tenant_slots.get(tenant_key) is entry:
+            del _tenant_slots[tenant_key]
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {LEONARDO_API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+
+
+def generation_params() -> dict:
+    """Model parameters sent with every generation (also part of the render cache key)."""
+    return {
+        "modelId": LEONARDO_MODEL_ID,
+        # Leonardo accepts specific sizes; keep within 1024 range for reliability.
+        "width": 1024,
+        "height": 768,
+        "num_images": 1,
+        "guidance_scale": 7,
+        "public": False,
+    }
+
+
+def _is_provider_failure(status_code: int) -> bool:
+    """Responses that say the provider is unhealthy (vs. a bad request from us)."""
+    return status_code >= 500 or status_code == 429
+
+
+def _observe(operation: str, started: float, error_kind: Optional[str] = None):
+    provider_request_duration_seconds.observe(time.perf_counter() - started, "leonardo", operation)
+    if error_kind:
+        provider_errors_total.inc("leonardo", operation, error_kind)
+
+
+def _error_kind(exc: Optional[httpx.HTTPError] = None, status_code: Optional[int] = None) -> str:
+    if status_code is not None:
+        return "http_429" if status_code == 429 else f"http_{status_code // 100}xx"
+    return "timeout" if isinstance(exc, httpx.TimeoutException) else "network"
+
+
+async def _create_once(prompt: str) -> str:
+    create_payload = {"prompt": prompt, **generation_params()}
+    started = time.perf_counter()
+    try:
+        create_resp = await get_http_client().post(
+            f"{LEONARDO_API_URL}/generations",
+            json=create_payload,
+            headers=_headers(),
+            timeout=LEONARDO_CREATE_TIMEOUT,
+        )
+    except httpx.HTTPError as e:
+        _observe("create", started, _error_kind(e))
+        breaker.record_failure()
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to create Leonardo generation: {str(e)}"
+        )
+    _observe("create", started, _error_kind(status_code=create_resp.status_code) if create_resp.status_code >= 400 else None)
+    if create_resp.status_code >= 400:
+        if _is_provider_failure(create_resp.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to create Leonardo generation: {create_resp.status_code} {create_resp.text}"
+        )
+    breaker.record_success()
+
+    generation_id = create_resp.json().get("sdGenerationJob", {}).get("generationId")
+    if not generation_id:
+        raise HTTPException(
+            status_code=502,
+            detail="Leonardo generationId missing from response"
+        )
+    return generation_id
+
+
+async def _create_hedged(prompt: str) -> str:
+    """Race a second create request if the first is slower than LEONARDO_HEDGE_AFTER."""
+    first = asyncio.create_task(_create_once(prompt))
+    done, _ = await asyncio.wait({first}, timeout=LEONARDO_HEDGE_AFTER)
+    if done:
+        return first.result()
+
+    pending = {first, asyncio.create_task(_create_once(prompt))}
+    last_error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def create_generation(prompt: str) -> str:
+    """Start a Leonardo generation and return its generationId (fails fast if the circuit is open)."""
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        provider_errors_total.inc("leonardo", "create", "circuit_open")
+        raise HTTPException(
+            status_code=503,
+            detail="Image provider is temporarily unavailable, please try again shortly"
+        )
+    if LEONARDO_HEDGE_AFTER > 0:
+        return await _create_hedged(prompt)
+    return await _create_once(prompt)
+
+
+async def fetch_generation(generation_id: str) -> dict:
+    """
+    Fetch one generation's status; returns the `generations_by_pk` object.
+
+    Polls are not gated by the breaker, so their outcomes are passive: they
+    feed its failure rate but leave a half-open circuit to the create probe.
+    """
+    started = time.perf_counter()
+    try:
+        poll_resp = await get_http_client().get(
+            f"{LEONARDO_API_URL}/generations/{generation_id}",
+            headers=_headers(),
+            timeout=LEONARDO_POLL_TIMEOUT,
+        )
+        poll_resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        _observe("fetch", started, _error_kind(status_code=e.response.status_code))
+        if _is_provider_failure(e.response.status_code):
+            breaker.record_failure(passive=True)
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to fetch Leonardo generation status: {str(e)}"
+        )
+    except httpx.HTTPError as e:
+        _observe("fetch", started, _error_kind(e))
+        breaker.record_failure(passive=True)
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to fetch Leonardo generation status: {str(e)}"
+        )
+    _observe("fetch", started)
+    breaker.record_success(passive=True)
+    return poll_resp.json().get("generations_by_pk") or {}
+
+
+def parse_generation(generation_id: str, gen_data: dict) -> Optional[dict]:
+    """Return the result dict if the generation finished, None if still pending."""
+    status = (gen_data.get("status") or "").upper()
+
+    if status in ["COMPLETE", "COMPLETED", "FINISHED"]:
+        images = gen_data.get("generated_images") or []
+        image_urls = [img.get("url") for img in images if img.get("url")]
+        if not image_urls:
+            raise HTTPException(
+                status_code=502,
+                detail="Leonardo generation completed without images"
+            )
+        return {
+            "generation_id": generation_id,
+            "image_urls": image_urls,
+            "status": status.lower()
+        }
+
+    if status in ["FAILED", "ERROR"]:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Leonardo generation failed with status {status}"
+        )
+    return None
+
+
+class _PendingGeneration:
+    def __init__(self, future: asyncio.Future, next_poll_at: float, deadline: float):
+        self.future = future
+        self.next_poll_at = next_poll_at
+        self.deadline = deadline
+        self.attempt = 0
+        self.polling = False
+
+
+class GenerationPoller:
+    """
+    One background task that polls every in-flight generation.
+
+    Each generation is polled on its own adaptive schedule (fast at first,
+    then backing off with jitter) and its future is completed when it
+    finishes, fails or times out. A webhook callback can complete a
+    generation early via `complete()`, directly when it reaches this worker
+    or through `provider_callbacks` when it reaches another one.
+    """
+
+    def __init__(self):
+        self._pending: dict = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # In-flight polls (the loop only keeps weak references to tasks)
+        self._polls: set = set()
+        self._next_callback_check = 0.0
+        self._checking_callbacks = False
+        self.polls = 0
+
+    def _next_delay(self, attempt: int) -> float:
+        delay = min(LEONARDO_POLL_INITIAL * (LEONARDO_POLL_BACKOFF ** attempt), LEONARDO_POLL_MAX)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _ensure_running(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def wait(self, generation_id: str) -> dict:
+        """Wait for a generation to finish; raises HTTPException on failure/timeout."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        entry = _PendingGeneration(
+            loop.create_future(),
+            now + self._next_delay(0),
+            now + LEONARDO_GENERATION_DEADLINE,
+        )
+        self._pending[generation_id] = entry
+        self._ensure_running()
+        self._wakeup.set()
+        try:
+            return await entry.future
+        finally:
+            if self._pending.get(generation_id) is entry:
+                del self._pending[generation_id]
+
+    def complete(self, generation_id: str, gen_data: dict) -> bool:
+        """Resolve a pending generation from status data; returns False if still pending."""
+        entry = self._pending.get(generation_id)
+        if entry is None or entry.future.done():
+            return False
+        try:
+            result = parse_generation(generation_id, gen_data)
+        except HTTPException as e:
+            entry.future.set_exception(e)
+            return True
+        if result is None:
+            return False
+        entry.future.set_result(result)
+        return True
+
+    def _fail(self, generation_id: str, exc: Exception):
+        entry = self._pending.get(generation_id)
+        if entry is not None and not entry.future.done():
+            entry.future.set_exception(exc)
+
+    async def _poll(self, generation_id: str, entry: _PendingGeneration):
+        entry.polling = True
+        try:
+            self.polls += 1
+            gen_data = await fetch_generation(generation_id)
+            if not self.complete(generation_id, gen_data):
+                entry.attempt += 1
+                entry.next_poll_at = asyncio.get_running_loop().time() + self._next_delay(entry.attempt)
+        except HTTPException as e:
+            self._fail(generation_id, e)
+        except Exception as e:
+            self._fail(generation_id, HTTPException(
+                status_code=502,
+                detail=f"Failed to fetch Leonardo generation status: {str(e)}"
+            ))
+        finally:
+            entry.polling = False
+            self._wakeup.set()
+
+    async def _check_callbacks(self, generation_ids: list):
+        self._checking_callbacks = True
+        try:
+            for row in await run_in_threadpool(_load_callbacks, generation_ids):
+                self.complete(row["generation_id"], row["payload"])
+        except Exception as e:
+            print(f"Checking Leonardo callbacks failed: {e}")
+        finally:
+            self._checking_callbacks = False
+            self._wakeup.set()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._polls.add(task)
+        task.add_done_callback(self._polls.discard)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+            next_wake = None
+            for generation_id, entry in list(self._pending.items()):
+                if entry.future.done() or entry.polling:
+                    continue
+                if now >= entry.deadline:
+                    self._fail(generation_id, HTTPException(
+                        status_code=504,
+                        detail="Leonardo generation timed out before completion"
+                    ))
+                elif now >= entry.next_poll_at:
+                    self._spawn(self._poll(generation_id, entry))
+                else:
+                    wake_at = min(entry.next_poll_at, entry.deadline)
+                    next_wake = wake_at if next_wake is None else min(next_wake, wake_at)
+            waiting = [gid for gid, entry in self._pending.items() if not entry.future.done()]
+            if LEONARDO_WEBHOOK_SECRET and waiting:
+                if now >= self._next_callback_check and not self._checking_callbacks:
+                    self._next_callback_check = now + LEONARDO_CALLBACK_CHECK_SECONDS
+                    self._spawn(self._check_callbacks(waiting))
+                next_wake = self._next_callback_check if next_wake is None else min(next_wake, self._next_callback_check)
+            timeout = None if next_wake is None else max(0.0, next_wake - now)
+            # Not wait_for: on 3.11 it drops a cancel (stop()) that races with the wakeup
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._wakeup.wait()
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._polls):
+            task.cancel()
+        await asyncio.gather(*self._polls, return_exceptions=True)
+
+
+poller = GenerationPoller()
+
+
+async def wait_for_generation(generation_id: str) -> dict:
+    """Wait for a generation via the shared poller."""
+    return await poller.wait(generation_id)
+
+
+async def generate_leonardo_image(prompt: str) -> dict:
+    """Create an image with Leonardo and return urls + metadata."""
+    if not LEONARDO_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="Leonardo API key not configured"
+        )
+
+    generation_id = await create_generation(prompt)
+    result = await wait_for_generation(generation_id)
+
+    # Let clients load (resized) copies through our caching image proxy
+    from app.services.render_images import register_render, render_proxy_urls
+    try:
+        await run_in_threadpool(register_render, generation_id, result["image_urls"])
+        result["proxy_urls"] = render_proxy_urls(generation_id, result["image_urls"])
+    except Exception as e:
+        print(f"Failed to register render images for {generation_id}: {e}")
+    return result
+
+
+async def generate_image_cached(prompt: str, tenant_id: Optional[str] = None, variant: int = 0,
+                                force_regenerate: bool = False) -> dict:
+    """
+    Generate an image through the tenant's render cache.
+
+    `variant` is part of the cache key so that several variants of the same
+    prompt stay distinct images. The generation itself holds a global and a
+    per-tenant slot; cache hits don't.
+    """
+    async def generate() -> dict:
+        async with generation_slot(tenant_id):
+            return await generate_leonardo_image(prompt)
+
+    params = {**generation_params(), "variant": variant}
+    return await cached_render(prompt, params, tenant_id, generate, force_regenerate)
+
+
+def _record_callback(generation_id: str, gen_data: dict):
+    execute_query(
+        """
+        INSERT INTO provider_callbacks (generation_id, payload) VALUES (%s, %s)
+        ON CONFLICT (generation_id) DO UPDATE SET payload = EXCLUDED.payload, received_at = CURRENT_TIMESTAMP
+        """,
+        (generation_id, json.dumps(gen_data))
+    )
+    if random.random() < 0.01:
+        # Nobody waits for a generation past its deadline
+        execute_query(
+            "DELETE FROM provider_callbacks WHERE received_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+            (2 * LEONARDO_GENERATION_DEADLINE,)
+        )
+
+
+def _load_callbacks(generation_ids: list) -> list:
+    return execute_query(
+        "SELECT generation_id, payload FROM provider_callbacks WHERE generation_id = ANY(%s)",
+        (generation_ids,)
+    )
+
+
+async def handle_webhook(payload: dict) -> bool:
+    """
+    Complete a pending generation from a Leonardo webhook payload; returns
+    whether this worker was waiting for it. Otherwise it is stored for the
+    worker that is.
+
+    Accepts both the webhook shape ({"data": {"object": {...}}}) and the
+    polling shape ({"generations_by_pk": {...}}).
+    """
+    data = payload.get("data")
+    gen_data = (data.get("object") if isinstance(data, dict) else None) or payload.get("generations_by_pk") or payload
+    if not isinstance(gen_data, dict):
+        return False
+    generation_id = gen_data.get("id") or gen_data.get("generationId")
+    if not generation_id or not isinstance(generation_id, str):
+        return False
+    if "generated_images" not in gen_data and "images" in gen_data:
+        gen_data = {**gen_data, "generated_images": gen_data["images"]}
+    if poller.complete(generation_id, gen_data):
+        return True
+    await run_in_threadpool(_record_callback, generation_id, gen_data)
+    return False
+
+
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+CallbackMetric(
+    "provider_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+    lambda: {"leonardo": _BREAKER_STATES[breaker.stats()["state"]]}, ("provider",),
+)
+CallbackMetric(
+    "provider_circuit_rejected_total", "Calls rejected by an open circuit.",
+    lambda: {"leonardo": breaker.stats()["rejected"]}, ("provider",), "counter",
+)
+CallbackMetric(
+    "provider_generations_in_flight", "Generations holding a provider slot.",
+    lambda: {"leonardo": LEONARDO_MAX_CONCURRENT - _global_slots._value if _global_slots else 0}, ("provider",),
+)
+CallbackMetric(
+    "provider_generations_polling", "Generations waiting on the shared poller.",
+    lambda: {"leonardo": len(poller._pending)}, ("provider",),
+)
@@ -0,0 +1,279 @@
+# app/services/metrics.py
+"""
+Minimal in-process metrics registry with Prometheus text exposition.
+
+Counters and histograms are updated on the hot path (a dict lookup and a
+lock per observation); gauges that mirror existing state (DB pool, bcrypt
+pool, token cache, circuit breaker) are read through callbacks only when
+/metrics is scraped. Every metric caps its number of label sets so a
+misbehaving label can't grow memory without bound.
+
+Values are kept per worker process and every series carries a `worker`
+label (the pid), so counters from different workers never look like one
+counter resetting. With METRICS_DIR set (gunicorn.conf.py points it at
+tmpfs), each worker also writes a snapshot there every
+METRICS_PUBLISH_SECONDS and /metrics merges the live workers' snapshots, so
+a scrape answered by any worker covers all of them.
+"""
+import asyncio
+import bisect
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Label sets beyond this collapse into a single "_overflow" series
+MAX_SERIES_PER_METRIC = 500
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "5"))
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    parts.append(f'worker="{os.getpid()}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Tuple[str, ...], series: dict) -> Tuple[str, ...]:
+        if labels in series or len(series) < MAX_SERIES_PER_METRIC:
+            return labels
+        return tuple("_overflow" for _ in labels)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            key = self._key(labels, self._values)
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels, self._series)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Gauge (or counter) whose value is read from existing state at scrape time."""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], object],
+                 labels: Iterable[str] = (), type_name: str = "gauge"):
+        super().__init__(name, help_text, labels)
+        self.type_name = type_name
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"Metric {self.name} callback failed: {e}")
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [
+            f"{self.name}{_format_labels(self.label_names, key if isinstance(key, tuple) else (key,))} {_format_value(v)}"
+            for key, v in value.items()
+        ]
+
+
+def _families() -> list:
+    """This worker's samples as [name, help, type, samples] per metric."""
+    with _registry_lock:
+        metrics = list(_registry)
+    families = []
+    for metric in metrics:
+        samples = metric.render()
+        if samples:
+            families.append([metric.name, metric.help, metric.type_name, samples])
+    return families
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def publish_metrics():
+    """Write this worker's snapshot to METRICS_DIR (renamed into place, so readers never see half a file)."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    with open(path + ".tmp", "w") as f:
+        json.dump(_families(), f)
+    os.replace(path + ".tmp", path)
+
+
+def unpublish_metrics():
+    if METRICS_DIR:
+        try:
+            os.remove(_snapshot_path(os.getpid()))
+        except OSError:
+            pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _other_workers() -> list:
+    """Snapshots published by the other live workers; files left by dead ones are removed."""
+    snapshots = []
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return snapshots
+    for name in names:
+        pid = name[:-len(".json")]
+        if not name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        if not _alive(int(pid)):
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def render_metrics() -> str:
+    """All registered metrics (of every live worker with METRICS_DIR) in Prometheus text format (version 0.0.4)."""
+    families = {family[0]: family for family in _families()}
+    if METRICS_DIR:
+        for snapshot in _other_workers():
+            for name, help_text, type_name, samples in snapshot:
+                if name in families:
+                    families[name][3].extend(samples)
+                else:
+                    families[name] = [name, help_text, type_name, list(samples)]
+    lines = []
+    for name, help_text, type_name, samples in families.values():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {type_name}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+async def _publish_periodically(interval: float):
+    while True:
+        try:
+            await asyncio.to_thread(publish_metrics)
+        except Exception as e:
+            print(f"Publishing metrics to {METRICS_DIR} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_metrics_publisher():
+    """Publish this worker's metrics to METRICS_DIR, if set."""
+    if not METRICS_DIR:
+        return None
+    return asyncio.create_task(_publish_periodically(METRICS_PUBLISH_SECONDS))
+
+
+def get_metric(name: str) -> Optional[_Metric]:
+    with _registry_lock:
+        return next((m for m in _registry if m.name == name), None)
+
+
+# Shared metrics used across modules
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests by method, route template and status.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template.", ("method", "route"))
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds", "Database query latency by statement label.", ("query",))
+db_query_errors_total = Counter(
+    "db_query_errors_total", "Database queries that raised, by statement label.", ("query",))
+db_pool_exhausted_total = Counter(
+    "db_pool_exhausted_total", "Connection requests refused because the pool was exhausted.")
+provider_request_duration_seconds = Histogram(
+    "provider_request_duration_seconds", "Image provider call latency.", ("provider", "operation"), PROVIDER_BUCKETS)
+provider_errors_total = Counter(
+    "provider_errors_total", "Image provider call failures by kind.", ("provider", "operation", "kind"))
@@ -0,0 +1,152 @@
+# app/services/passwords.py
+"""
+Password hashing off the event loop.
+
+bcrypt is deliberately slow (tens to hundreds of ms of CPU per call), so every
+hash/verify runs in a dedicated, bounded thread pool instead of inside the
+async handler. The bcrypt C extension releases the GIL while hashing, so the
+pool gives real parallelism while the event loop keeps serving other requests.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+from app.services.metrics import CallbackMetric
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Max hash/verify jobs waiting for a worker before we shed load with a 503
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "64"))
+SLOW_QUEUE_WAIT_MS = float(os.getenv("PASSWORD_SLOW_QUEUE_MS", "500"))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_stats_lock = threading.Lock()
+_stats = {
+    "queued": 0,
+    "running": 0,
+    "completed": 0,
+    "rejected": 0,
+    "queue_time_ms_total": 0.0,
+    "queue_time_ms_max": 0.0,
+    "run_time_ms_total": 0.0,
+}
+
+
+class PasswordQueueFull(Exception):
+    """Raised when too many password jobs are already waiting."""
+
+
+def prepare_password_for_bcrypt(password: str) -> str:
+    """
+    Pre-hash password with SHA-256 to allow passwords longer than bcrypt's 72-byte limit.
+    Returns a hex string (64 characters = 64 bytes when UTF-8 encoded).
+    """
+    password_bytes = password.encode('utf-8')
+    sha256_binary = hashlib.sha256(password_bytes).digest()
+    return sha256_binary.hex()
+
+
+def _hash_sync(password: str) -> str:
+    return pwd_context.hash(prepare_password_for_bcrypt(password))
+
+
+def _verify_sync(password: str, password_hash: str) -> tuple:
+    """
+    Verify a password against a stored hash.
+
+    Returns (valid, needs_upgrade). Tries the current scheme (SHA-256 + bcrypt)
+    first, then the legacy direct-bcrypt scheme for older accounts; a legacy
+    match (or an outdated cost factor) means the hash should be rewritten.
+    """
+    try:
+        if pwd_context.verify(prepare_password_for_bcrypt(password), password_hash):
+            return True, pwd_context.needs_update(password_hash)
+    except Exception:
+        pass
+
+    # Legacy fallback only if the raw password fits bcrypt's limit
+    if len(password.encode('utf-8')) <= 72:
+        try:
+            if pwd_context.verify(password, password_hash):
+                return True, True
+        except Exception:
+            pass
+    return False, False
+
+
+def _timed(fn, submitted_at: float, *args):
+    started_at = time.perf_counter()
+    queue_ms = (started_at - submitted_at) * 1000
+    with _stats_lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+        _stats["queue_time_ms_total"] += queue_ms
+        _stats["queue_time_ms_max"] = max(_stats["queue_time_ms_max"], queue_ms)
+    if queue_ms > SLOW_QUEUE_WAIT_MS:
+        print(f"⚠️  Password job waited {queue_ms:.0f}ms for a bcrypt worker")
+    try:
+        return fn(*args)
+    finally:
+        with _stats_lock:
+            _stats["running"] -= 1
+            _stats["completed"] += 1
+            _stats["run_time_ms_total"] += (time.perf_counter() - started_at) * 1000
+
+
+async def _submit(fn, *args):
+    with _stats_lock:
+        if _stats["queued"] >= PASSWORD_QUEUE_LIMIT:
+            _stats["rejected"] += 1
+            raise PasswordQueueFull("Too many concurrent password operations")
+        _stats["queued"] += 1
+    future = _executor.submit(_timed, fn, time.perf_counter(), *args)
+    future.add_done_callback(_release_if_cancelled)
+    # Cancelling the awaiting task (client gone, timeout, shutdown) cancels the job if it hasn't started
+    return await asyncio.wrap_future(future)
+
+
+def _release_if_cancelled(future):
+    """Free the queue slot of a job cancelled before a worker picked it up (_timed never ran)."""
+    if future.cancelled():
+        with _stats_lock:
+            _stats["queued"] -= 1
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password (SHA-256 pre-hash + bcrypt) in the bcrypt pool."""
+    return await _submit(_hash_sync, password)
+
+
+async def verify_password(password: str, password_hash: str) -> tuple:
+    """Verify a password in the bcrypt pool. Returns (valid, needs_upgrade)."""
+    return await _submit(_verify_sync, password, password_hash)
+
+
+def get_password_pool_stats() -> dict:
+    """Snapshot of bcrypt pool queue depth and timing counters."""
+    with _stats_lock:
+        stats = dict(_stats)
+    completed = stats["completed"] or 1
+    stats["workers"] = PASSWORD_HASH_WORKERS
+    stats["queue_time_ms_avg"] = stats["queue_time_ms_total"] / completed
+    stats["run_time_ms_avg"] = stats["run_time_ms_total"] / completed
+    return stats
+
+
+CallbackMetric(
+    "password_pool_jobs", "bcrypt jobs waiting for or holding a worker.",
+    lambda: {state: get_password_pool_stats()[state] for state in ("queued", "running")}, ("state",),
+)
+CallbackMetric(
+    "password_pool_jobs_total", "bcrypt jobs completed or rejected because the queue was full.",
+    lambda: {outcome: get_password_pool_stats()[outcome] for outcome in ("completed", "rejected")}, ("outcome",), "counter",
+)
+CallbackMetric(
+    "password_pool_queue_seconds_max", "Longest time a bcrypt job waited for a worker.",
+    lambda: get_password_pool_stats()["queue_time_ms_max"] / 1000,
+)
@@ -0,0 +1,272 @@
+# app/services/plan_symbols.py
+"""
+Compile catalog plan symbols into cacheable render artifacts.
+
+Each block's `planSymbols` is a list of rect/line/circle shapes in unit
+coordinates (0..1 of the block footprint). We validate them once and compile
+them into a normalized SVG (one path per style layer) plus small PNG sprites,
+keyed by a content hash so identical symbols are shared between blocks.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Annotated, Any, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+# Sprite sizes (longest side, in px) rendered for every symbol
+SPRITE_SIZES = [32, 64, 128]
+SYMBOL_CACHE_SIZE = int(os.getenv("PLAN_SYMBOL_CACHE_SIZE", "2048"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 'base' / 'detail' style roles, hex colors, named colors or rgb()/rgba()
+COLOR_PATTERN = r"^(#[0-9A-Fa-f]{3,8}|[A-Za-z]+|rgba?\([0-9., %]+\))$"
+
+STYLE_COLORS = {
+    "base": "#1F2937",
+    "detail": "#9CA3AF",
+}
+
+
+class RectShape(BaseModel):
+    kind: Literal["rect"]
+    x: float
+    y: float
+    width: float = Field(ge=0)
+    height: float = Field(ge=0)
+    cornerRadius: Optional[float] = Field(default=None, ge=0)
+    stroke: Optional[str] = Field(default=None, pattern=COLOR_PATTERN)
+    strokeWidth: Optional[float] = Field(default=None, ge=0)
+    fill: Optional[str] = Field(default=None, pattern=COLOR_PATTERN)
+    dash: Optional[List[float]] = None
+
+
+class LineShape(BaseModel):
+    kind: Literal["line"]
+    points: List[float] = Field(min_length=4, max_length=4)
+    stroke: Optional[str] = Field(default=None, pattern=COLOR_PATTERN)
+    strokeWidth: Optional[float] = Field(default=None, ge=0)
+    dash: Optional[List[float]] = None
+
+
+class CircleShape(BaseModel):
+    kind: Literal["circle"]
+    x: float
+    y: float
+    radius: float = Field(ge=0)
+    stroke: Optional[str] = Field(default=None, pattern=COLOR_PATTERN)
+    strokeWidth: Optional[float] = Field(default=None, ge=0)
+    fill: Optional[str] = Field(default=None, pattern=COLOR_PATTERN)
+    dash: Optional[List[float]] = None
+
+
+PlanShape = Annotated[Union[RectShape, LineShape, CircleShape], Field(discriminator="kind")]
+_shapes_adapter = TypeAdapter(List[PlanShape])
+
+
+class PlanSymbolError(ValueError):
+    """Raised when a block's planSymbols cannot be validated."""
+
+
+class CompiledSymbol:
+    def __init__(self, symbol_hash: str, width: float, height: float, path: str, svg: str, shapes: list):
+        self.hash = symbol_hash
+        self.width = width
+        self.height = height
+        self.path = path
+        self.svg = svg
+        self.shapes = shapes
+        self.sprites: dict = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "hash": self.hash,
+            "path": self.path,
+            "svgUrl": f"/api/catalog/symbols/{self.hash}.svg",
+            "sprites": {
+                str(size): f"/api/catalog/symbols/{self.hash}/{size}.png"
+                for size in SPRITE_SIZES
+            },
+        }
+
+
+_cache: "OrderedDict[str, CompiledSymbol]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _fmt(value: float) -> str:
+    """Format a coordinate compactly (4 decimals, no trailing zeros)."""
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def validate_plan_symbols(plan_symbols: Optional[List[Any]]) -> list:
+    """Validate raw planSymbols and return typed shapes."""
+    try:
+        return _shapes_adapter.validate_python(plan_symbols or [])
+    except ValidationError as e:
+        raise PlanSymbolError(f"Invalid planSymbols: {e.errors()[0].get('msg')}") from e
+
+
+def symbol_hash(plan_symbols: Optional[List[Any]], width: float, height: float) -> str:
+    """Content hash of a symbol (shapes + footprint aspect)."""
+    canonical = json.dumps(
+        {"shapes": plan_symbols or [], "w": width, "h": height},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def _shape_path(shape, sx: float, sy: float) -> str:
+    """SVG path data for one shape, scaled to a viewBox of (sx, sy)."""
+    if shape.kind == "rect":
+        x, y, w, h = shape.x * sx, shape.y * sy, shape.width * sx, shape.height * sy
+        r = min((shape.cornerRadius or 0) * min(sx, sy), w / 2, h / 2)
+        if r <= 0:
+            return f"M{_fmt(x)} {_fmt(y)}h{_fmt(w)}v{_fmt(h)}h{_fmt(-w)}Z"
+        return (
+            f"M{_fmt(x + r)} {_fmt(y)}h{_fmt(w - 2 * r)}"
+            f"a{_fmt(r)} {_fmt(r)} 0 0 1 {_fmt(r)} {_fmt(r)}v{_fmt(h - 2 * r)}"
+            f"a{_fmt(r)} {_fmt(r)} 0 0 1 {_fmt(-r)} {_fmt(r)}h{_fmt(-(w - 2 * r))}"
+            f"a{_fmt(r)} {_fmt(r)} 0 0 1 {_fmt(-r)} {_fmt(-r)}v{_fmt(-(h - 2 * r))}"
+            f"a{_fmt(r)} {_fmt(r)} 0 0 1 {_fmt(r)} {_fmt(-r)}Z"
+        )
+    if shape.kind == "line":
+        x1, y1, x2, y2 = shape.points
+        return f"M{_fmt(x1 * sx)} {_fmt(y1 * sy)}L{_fmt(x2 * sx)} {_fmt(y2 * sy)}"
+    # circle: two half arcs
+    cx, cy = shape.x * sx, shape.y * sy
+    r = shape.radius * min(sx, sy)
+    return (
+        f"M{_fmt(cx - r)} {_fmt(cy)}"
+        f"a{_fmt(r)} {_fmt(r)} 0 1 0 {_fmt(2 * r)} 0"
+        f"a{_fmt(r)} {_fmt(r)} 0 1 0 {_fmt(-2 * r)} 0Z"
+    )
+
+
+def _style_key(shape) -> tuple:
+    fill = getattr(shape, "fill", None)
+    dash = tuple(shape.dash) if shape.dash else None
+    return (shape.stroke or "base", fill, shape.strokeWidth, dash)
+
+
+def _color(value: Optional[str]) -> str:
+    if not value:
+        return "none"
+    return STYLE_COLORS.get(value, value)
+
+
+def _viewbox(width: float, height: float) -> tuple:
+    """Viewbox keeping block aspect ratio with the longest side = 1."""
+    longest = max(width, height) or 1
+    return (width / longest or 1, height / longest or 1)
+
+
+def compile_symbol(plan_symbols: Optional[List[Any]], width: float, height: float) -> CompiledSymbol:
+    """Validate and compile planSymbols, reusing the cached result by content hash."""
+    key = symbol_hash(plan_symbols, width, height)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    shapes = validate_plan_symbols(plan_symbols)
+    sx, sy = _viewbox(width, height)
+
+    # Group shapes by style so the SVG has one <path> per layer
+    layers: "OrderedDict[tuple, List[str]]" = OrderedDict()
+    all_paths = []
+    for shape in shapes:
+        d = _shape_path(shape, sx, sy)
+        all_paths.append(d)
+        layers.setdefault(_style_key(shape), []).append(d)
+
+    stroke_default = 0.01
+    svg_paths = []
+    for (stroke, fill, stroke_width, dash), paths in layers.items():
+        attrs = [
+            f'd="{"".join(paths)}"',
+            f'fill="{_color(fill)}"',
+            f'stroke="{_color(stroke)}"',
+            f'stroke-width="{_fmt(stroke_width if stroke_width is not None else stroke_default)}"',
+        ]
+        if dash:
+            attrs.append(f'stroke-dasharray="{" ".join(_fmt(v) for v in dash)}"')
+        svg_paths.append(f"<path {' '.join(attrs)}/>")
+
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {_fmt(sx)} {_fmt(sy)}" '
+        f'preserveAspectRatio="none">{"".join(svg_paths)}</svg>'
+    )
+    compiled = CompiledSymbol(key, width, height, "".join(all_paths), svg, shapes)
+
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > SYMBOL_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def get_compiled_symbol(key: str) -> Optional[CompiledSymbol]:
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+        return compiled
+
+
+def render_sprite(compiled: CompiledSymbol, size: int) -> bytes:
+    """Rasterize a compiled symbol to a PNG whose longest side is `size` px."""
+    if size not in SPRITE_SIZES:
+        raise PlanSymbolError(f"Unsupported sprite size: {size}")
+    sprite = compiled.sprites.get(size)
+    if sprite is not None:
+        return sprite
+
+    from PIL import Image, ImageDraw
+
+    sx, sy = _viewbox(compiled.width, compiled.height)
+    px_w, px_h = max(1, round(sx * size)), max(1, round(sy * size))
+    # Supersample then downscale for cheap anti-aliasing
+    ss = 4
+    image = Image.new("RGBA", (px_w * ss, px_h * ss), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    scale_x, scale_y = px_w * ss, px_h * ss
+
+    for shape in compiled.shapes:
+        stroke = _color(shape.stroke or "base")
+        fill = _color(getattr(shape, "fill", None))
+        fill = None if fill == "none" else fill
+        line_width = max(1, round((shape.strokeWidth or 0.01) * min(scale_x, scale_y)))
+        if shape.kind == "rect":
+            box = [
+                shape.x * scale_x,
+                shape.y * scale_y,
+                (shape.x + shape.width) * scale_x,
+                (shape.y + shape.height) * scale_y,
+            ]
+            radius = (shape.cornerRadius or 0) * min(scale_x, scale_y)
+            if radius > 0:
+                draw.rounded_rectangle(box, radius=radius, fill=fill, outline=stroke, width=line_width)
+            else:
+                draw.rectangle(box, fill=fill, outline=stroke, width=line_width)
+        elif shape.kind == "line":
+            x1, y1, x2, y2 = shape.points
+            draw.line([x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y], fill=stroke, width=line_width)
+        else:
+            r = shape.radius * min(scale_x, scale_y)
+            cx, cy = shape.x * scale_x, shape.y * scale_y
+            draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=fill, outline=stroke, width=line_width)
+
+    image = image.resize((px_w, px_h), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    sprite = buffer.getvalue()
+    compiled.sprites[size] = sprite
+    return sprite
@@ -0,0 +1,209 @@
+# app/services/profiler.py
+"""
+On-demand sampling profiler for individual requests.
+
+A single daemon thread wakes every PROFILER_INTERVAL_MS and records the
+stack of each request being profiled:
+
+- while the request is running on the event loop thread, the real thread
+  stack (this includes blocking calls such as psycopg2 queries made from
+  async handlers);
+- while it is suspended, its coroutine await chain (where it is waiting).
+
+Samples are aggregated as folded stacks ("frame;frame;frame count"), the
+input format of flamegraph.pl and speedscope. Finished profiles are stored
+in the `request_profiles` table (the newest PROFILER_BUFFER_SIZE are kept),
+so the admin endpoints on any worker can read them.
+
+Requests are profiled when explicitly asked for (X-Profile header with the
+admin token) or, with PROFILER_SLOW_MS set, once they have been running
+longer than that threshold.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+# Start sampling any request still running after this long; 0 = only on request
+PROFILER_SLOW_MS = float(os.getenv("PROFILER_SLOW_MS", "0"))
+PROFILER_BUFFER_SIZE = int(os.getenv("PROFILER_BUFFER_SIZE", "50"))
+# Requests sampled at the same time (extra slow requests are not profiled)
+PROFILER_MAX_ACTIVE = int(os.getenv("PROFILER_MAX_ACTIVE", "8"))
+
+MAX_STACK_DEPTH = 128
+MAX_DISTINCT_STACKS = 5000
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _await_chain(coro) -> list:
+    """Frames of a suspended coroutine and everything it awaits, outermost first."""
+    frames = []
+    while coro is not None and len(frames) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+
+def _thread_stack(frame) -> list:
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, trigger: Optional[str], task, thread_id: int):
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.task = task
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.created_at = time.time()
+        self.sampling = trigger is not None
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._lock = threading.Lock()
+
+    def sample(self, thread_frames: dict):
+        chain = _await_chain(self.task.get_coro()) if self.task is not None else []
+        stack = chain
+        if chain:
+            running = _thread_stack(thread_frames.get(self.thread_id))
+            # Running right now: the thread stack holds the chain plus whatever it is executing
+            if any(frame is chain[0] for frame in running):
+                stack = running
+        if not stack:
+            return
+        key = ";".join(_frame_name(frame) for frame in stack)
+        with self._lock:
+            if key in self.samples or len(self.samples) < MAX_DISTINCT_STACKS:
+                self.samples[key] += 1
+            self.sample_count += 1
+
+    def snapshot(self) -> tuple:
+        with self._lock:
+            return self.sample_count, dict(self.samples)
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._active: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(PROFILER_TOKEN) or PROFILER_SLOW_MS > 0
+
+    def start(self, profile: RequestProfile):
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def finish(self, profile: RequestProfile, status_code: int, tenant_id: Optional[str] = None):
+        """Stop profiling a request and store what was sampled; does blocking I/O, call it off the loop."""
+        with self._lock:
+            self._active.discard(profile)
+        sample_count, stacks = profile.snapshot()
+        # Slow-threshold candidates that finished in time leave nothing behind
+        if not sample_count and profile.trigger is None:
+            return
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        summary = {
+            "method": profile.method,
+            "path": profile.path,
+            "tenantId": tenant_id,
+            "trigger": profile.trigger or "slow",
+            "status": status_code,
+            "durationMs": round(duration_ms, 1),
+            "samples": sample_count,
+            "intervalMs": PROFILER_INTERVAL_MS,
+            "createdAt": profile.created_at,
+        }
+        from app.config.db import execute_query
+        try:
+            rows = execute_query(
+                "INSERT INTO request_profiles (summary, stacks) VALUES (%s, %s) RETURNING id",
+                (json.dumps(summary), json.dumps(stacks))
+            )
+            execute_query("DELETE FROM request_profiles WHERE id <= %s", (rows[0]["id"] - PROFILER_BUFFER_SIZE,))
+        except Exception as e:
+            print(f"Failed to store profile of {profile.method} {profile.path}: {e}")
+
+    def _run(self):
+        interval = PROFILER_INTERVAL_MS / 1000
+        slow = PROFILER_SLOW_MS / 1000
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            now = time.perf_counter()
+            sampling = [p for p in active if p.sampling]
+            for profile in active:
+                if not profile.sampling and slow and now - profile.started >= slow and len(sampling) < PROFILER_MAX_ACTIVE:
+                    profile.sampling = True
+                    sampling.append(profile)
+            if not sampling:
+                continue
+            thread_frames = sys._current_frames()
+            for profile in sampling:
+                try:
+                    profile.sample(thread_frames)
+                except Exception as e:
+                    # Frames can change under us; drop the sample rather than the thread
+                    print(f"Profiler sample failed: {e}")
+            del thread_frames
+
+    def list_profiles(self) -> list:
+        from app.config.db import execute_query
+        rows = execute_query(
+            "SELECT id, summary FROM request_profiles ORDER BY id DESC LIMIT %s",
+            (PROFILER_BUFFER_SIZE,)
+        )
+        return [{"id": row["id"], **row["summary"]} for row in rows]
+
+    def get_profile(self, profile_id: int) -> Optional[dict]:
+        from app.config.db import execute_query
+        rows = execute_query("SELECT id, summary, stacks FROM request_profiles WHERE id = %s", (profile_id,))
+        if not rows:
+            return None
+        return {"id": rows[0]["id"], **rows[0]["summary"], "stacks": rows[0]["stacks"]}
+
+
+def folded_stacks(profile: dict) -> str:
+    """flamegraph.pl / speedscope input: one "a;b;c count" line per stack."""
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(profile["stacks"].items())) + "\n"
+
+
+def top_frames(profile: dict, limit: int = 20) -> list:
+    """Leaf frames with the most samples (where the time actually went)."""
+    leaves: Counter = Counter()
+    for stack, count in profile["stacks"].items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    total = sum(leaves.values()) or 1
+    return [
+        {"frame": frame, "samples": count, "percent": round(100 * count / total, 1)}
+        for frame, count in leaves.most_common(limit)
+    ]
+
+
+profiler = SamplingProfiler()
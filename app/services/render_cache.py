@@ -0,0 +1,139 @@
+# app/services/render_cache.py
+"""
+Prompt-keyed cache of image generation results.
+
+convertDesignToPrompt is deterministic, so an unchanged layout produces the
+same prompt. Results are stored in the `render_cache` table keyed by a hash
+of the normalized prompt plus the model parameters, scoped per tenant, with
+TTL expiry and a per-tenant entry cap (least recently hit evicted first).
+Concurrent identical requests in this worker share one in-flight generation.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+from typing import Awaitable, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config.db import execute_query
+
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "true").lower() != "false"
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", "86400"))
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "500"))
+
+_in_flight: dict = {}  # (tenant, key) -> asyncio.Future
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so cosmetic differences don't miss the cache."""
+    return re.sub(r"\s+", " ", prompt or "").strip()
+
+
+def render_cache_key(prompt: str, params: dict) -> str:
+    canonical = json.dumps(
+        {"prompt": normalize_prompt(prompt), "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _tenant_key(tenant_id: Optional[str]) -> str:
+    return str(tenant_id) if tenant_id else "anonymous"
+
+
+def get_cached_render(tenant_id: Optional[str], cache_key: str) -> Optional[dict]:
+    rows = execute_query(
+        """
+        UPDATE render_cache
+        SET last_hit_at = CURRENT_TIMESTAMP, hit_count = hit_count + 1
+        WHERE tenant_key = %s AND cache_key = %s
+          AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+        RETURNING result
+        """,
+        (_tenant_key(tenant_id), cache_key, RENDER_CACHE_TTL)
+    )
+    return rows[0]["result"] if rows else None
+
+
+def put_cached_render(tenant_id: Optional[str], cache_key: str, result: dict):
+    tenant_key = _tenant_key(tenant_id)
+    execute_query(
+        """
+        INSERT INTO render_cache (tenant_key, cache_key, result)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (tenant_key, cache_key)
+        DO UPDATE SET result = EXCLUDED.result,
+                      created_at = CURRENT_TIMESTAMP,
+                      last_hit_at = CURRENT_TIMESTAMP
+        """,
+        (tenant_key, cache_key, json.dumps(result))
+    )
+    # Size- and TTL-based eviction for this tenant
+    execute_query(
+        """
+        DELETE FROM render_cache
+        WHERE tenant_key = %s
+          AND (created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+               OR cache_key IN (
+                   SELECT cache_key FROM render_cache
+                   WHERE tenant_key = %s
+                   ORDER BY last_hit_at DESC
+                   OFFSET %s
+               ))
+        """,
+        (tenant_key, RENDER_CACHE_TTL, tenant_key, RENDER_CACHE_MAX_ENTRIES)
+    )
+
+
+async def cached_render(prompt: str, params: dict, tenant_id: Optional[str],
+                        generate: Callable[[], Awaitable[dict]], force_regenerate: bool = False) -> dict:
+    """
+    Return a cached result for (prompt, params, tenant) or run `generate`.
+
+    The returned dict gets `cached: True|False`. force_regenerate skips the
+    lookup but still refreshes the cache with the new result.
+    """
+    if not RENDER_CACHE_ENABLED:
+        return {**await generate(), "cached": False}
+
+    cache_key = render_cache_key(prompt, params)
+    flight_key = (_tenant_key(tenant_id), cache_key)
+
+    if not force_regenerate:
+        try:
+            cached = await run_in_threadpool(get_cached_render, tenant_id, cache_key)
+        except Exception as e:
+            print(f"Render cache lookup failed: {e}")
+            cached = None
+        if cached:
+            return {**cached, "cached": True}
+
+        pending = _in_flight.get(flight_key)
+        if pending is not None:
+            return {**await asyncio.shield(pending), "cached": True}
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[flight_key] = future
+    try:
+        result = await generate()
+        future.set_result(result)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Nobody may be waiting on the future; don't warn about an unretrieved exception
+        future.exception()
+        raise
+    finally:
+        if _in_flight.get(flight_key) is future:
+            del _in_flight[flight_key]
+
+    try:
+        await run_in_threadpool(put_cached_render, tenant_id, cache_key, result)
+    except Exception as e:
+        print(f"Render cache store failed: {e}")
+    return {**result, "cached": False}
@@ -0,0 +1,228 @@
+# app/services/render_images.py
+"""
+Local caching proxy for generated render images.
+
+Provider image URLs can expire and always point at the full-size image.
+Each generated image is fetched from the provider once and kept in a
+content-addressed store on local disk; resized WebP/JPEG variants are made
+with Pillow in a small worker pool and cached on disk with LRU eviction.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.config.db import execute_query
+
+RENDER_STORE_DIR = os.getenv("RENDER_STORE_DIR", os.path.join("data", "renders"))
+RENDER_VARIANT_CACHE_MB = int(os.getenv("RENDER_VARIANT_CACHE_MB", "512"))
+RENDER_IMAGE_WORKERS = int(os.getenv("RENDER_IMAGE_WORKERS", "2"))
+# Requested widths snap up to one of these so the variant set stays bounded
+VARIANT_WIDTHS = [128, 256, 512, 768, 1024]
+VARIANT_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+_executor = ThreadPoolExecutor(max_workers=RENDER_IMAGE_WORKERS, thread_name_prefix="render-img")
+_in_flight: dict = {}
+_variant_lock = threading.Lock()
+_variants: "OrderedDict[str, int]" = OrderedDict()  # variant path -> size in bytes
+_variant_bytes = 0
+_variants_loaded = False
+
+
+def _originals_dir() -> str:
+    return os.path.join(RENDER_STORE_DIR, "originals")
+
+
+def _variants_dir() -> str:
+    return os.path.join(RENDER_STORE_DIR, "variants")
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def register_render(generation_id: str, image_urls: list):
+    """Remember a generation's source URLs so the proxy can fetch them later."""
+    for index, url in enumerate(image_urls):
+        execute_query(
+            """
+            INSERT INTO render_images (generation_id, image_index, source_url)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (generation_id, image_index) DO NOTHING
+            """,
+            (generation_id, index, url)
+        )
+
+
+def render_proxy_urls(generation_id: str, image_urls: list) -> list:
+    return [f"/api/renders/{generation_id}/image?index={i}" for i in range(len(image_urls))]
+
+
+def _lookup(generation_id: str, index: int) -> Optional[dict]:
+    rows = execute_query(
+        """
+        SELECT source_url, content_hash
+        FROM render_images
+        WHERE generation_id = %s AND image_index = %s
+        """,
+        (generation_id, index)
+    )
+    return rows[0] if rows else None
+
+
+def _store_hash(generation_id: str, index: int, content_hash: str):
+    execute_query(
+        "UPDATE render_images SET content_hash = %s WHERE generation_id = %s AND image_index = %s",
+        (content_hash, generation_id, index)
+    )
+
+
+async def _fetch_original(generation_id: str, index: int) -> str:
+    from app.services.leonardo import get_http_client
+
+    row = await run_in_threadpool(_lookup, generation_id, index)
+    if not row:
+        raise HTTPException(status_code=404, detail="Render not found")
+
+    content_hash = row.get("content_hash")
+    if content_hash and os.path.exists(os.path.join(_originals_dir(), content_hash)):
+        return content_hash
+
+    try:
+        resp = await get_http_client().get(row["source_url"], timeout=30)
+        resp.raise_for_status()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to fetch render image: {str(e)}")
+
+    data = resp.content
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = os.path.join(_originals_dir(), content_hash)
+    if not os.path.exists(path):
+        await run_in_threadpool(_write_atomic, path, data)
+    await run_in_threadpool(_store_hash, generation_id, index, content_hash)
+    return content_hash
+
+
+async def get_original(generation_id: str, index: int) -> str:
+    """Return the content hash of a stored original, fetching it once if needed."""
+    key = (generation_id, index)
+    pending = _in_flight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_fetch_original(generation_id, index))
+        _in_flight[key] = pending
+        pending.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(pending)
+
+
+def snap_width(width: Optional[int]) -> int:
+    if not width:
+        return VARIANT_WIDTHS[-1]
+    for candidate in VARIANT_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return VARIANT_WIDTHS[-1]
+
+
+def _load_variant_index():
+    """Rebuild the LRU index from disk (oldest access first)."""
+    global _variant_bytes, _variants_loaded
+    directory = _variants_dir()
+    entries = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, path, stat.st_size))
+    for _, path, size in sorted(entries):
+        _variants[path] = size
+        _variant_bytes += size
+    _variants_loaded = True
+
+
+def _touch_variant(path: str, size: int):
+    global _variant_bytes
+    with _variant_lock:
+        if not _variants_loaded:
+            _load_variant_index()
+        if path in _variants:
+            _variants.move_to_end(path)
+            return
+        _variants[path] = size
+        _variant_bytes += size
+        limit = RENDER_VARIANT_CACHE_MB * 1024 * 1024
+        while _variant_bytes > limit and len(_variants) > 1:
+            old_path, old_size = _variants.popitem(last=False)
+            _variant_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+def _read_variant(path: str) -> Optional[bytes]:
+    """Variant bytes, or None if it is missing (never rendered, or evicted by any worker)."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    _touch_variant(path, len(data))
+    return data
+
+
+def _render_variant(original_path: str, variant_path: str, width: int, fmt: str) -> bytes:
+    from PIL import Image
+
+    with Image.open(original_path) as image:
+        image = image.convert("RGB")
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        if fmt == "webp":
+            image.save(buffer, format="WEBP", quality=80, method=4)
+        else:
+            image.save(buffer, format="JPEG", quality=82, optimize=True, progressive=True)
+    data = buffer.getvalue()
+    _write_atomic(variant_path, data)
+    _touch_variant(variant_path, len(data))
+    return data
+
+
+async def get_variant(generation_id: str, index: int, width: Optional[int], fmt: str) -> Tuple[bytes, str]:
+    """Return (bytes, etag) of a resized variant, rendering it on first use."""
+    content_hash = await get_original(generation_id, index)
+    width = snap_width(width)
+    name = f"{content_hash}-{width}.{fmt}"
+    variant_path = os.path.join(_variants_dir(), name)
+
+    # Read, don't hand out the path: LRU eviction in any worker can unlink the file at any time
+    data = await run_in_threadpool(_read_variant, variant_path)
+    if data is not None:
+        return data, name
+
+    key = ("variant", name)
+    pending = _in_flight.get(key)
+    if pending is None:
+        loop = asyncio.get_running_loop()
+        pending = loop.run_in_executor(
+            _executor, _render_variant,
+            os.path.join(_originals_dir(), content_hash), variant_path, width, fmt,
+        )
+        _in_flight[key] = pending
+        pending.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(pending), name
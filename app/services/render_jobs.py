@@ -0,0 +1,263 @@
+# app/services/render_jobs.py
+"""
+Background render jobs.
+
+Submitting a render returns a job id immediately; a fixed pool of asyncio
+worker tasks drives the actual generation. The running worker keeps the job
+in memory for fast polling/SSE, and every job's state is written to the
+`render_jobs` table (on submit, start, progress and finish) so polls and
+streams served by any other worker or replica see it too. A job that can't
+be recorded there is not accepted. Jobs tied to a project are also kept in
+`ai_prompts` (row id == job id) as the project's AI history.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config.db import execute_query
+from app.services.metrics import CallbackMetric
+
+RENDER_JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", "4"))
+RENDER_JOB_QUEUE_LIMIT = int(os.getenv("RENDER_JOB_QUEUE_LIMIT", "100"))
+# Finished jobs are kept in memory this long (seconds) for polling
+RENDER_JOB_TTL = float(os.getenv("RENDER_JOB_TTL", "3600"))
+
+TERMINAL_STATUSES = ("complete", "failed")
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue is at capacity."""
+
+
+class RenderJobNotSaved(Exception):
+    """Raised when a job can't be recorded where every worker can read it."""
+
+
+class RenderJob:
+    def __init__(self, kind: str, prompt: str, runner: Callable[["RenderJob"], Awaitable[dict]],
+                 tenant_id: Optional[str] = None, project_id: Optional[str] = None, total_steps: int = 1):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.prompt = prompt
+        self.runner = runner
+        self.tenant_id = tenant_id
+        self.project_id = project_id
+        self.status = "queued"
+        self.completed_steps = 0
+        self.total_steps = max(1, total_steps)
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.persisted = False
+        self._changed = asyncio.Event()
+
+    def advance(self, steps: int = 1):
+        """Record progress (called by the runner as generations finish)."""
+        self.completed_steps = min(self.total_steps, self.completed_steps + steps)
+        self._notify()
+        _save_in_background(self)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_change(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.completed_steps / self.total_steps, 3),
+            "completedSteps": self.completed_steps,
+            "totalSteps": self.total_steps,
+            "projectId": self.project_id,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+_jobs: dict = {}
+_queue: Optional[asyncio.Queue] = None
+_workers: list = []
+# Progress writes in flight (the loop only keeps weak references to tasks)
+_saves: set = set()
+
+
+def _insert_state(job: RenderJob):
+    execute_query(
+        """
+        INSERT INTO render_jobs (id, tenant_id, project_id, kind, status, completed_steps, state)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """,
+        (job.id, job.tenant_id, job.project_id, job.kind, job.status, job.completed_steps,
+         json.dumps(job.to_dict(), default=str))
+    )
+    if random.random() < 0.01:
+        execute_query(
+            "DELETE FROM render_jobs WHERE finished_at < CURRENT_TIMESTAMP - make_interval(secs => %s)",
+            (RENDER_JOB_TTL,)
+        )
+
+
+def _save_state(state: dict):
+    """Write a job snapshot; a late or out-of-order progress write never overwrites a newer one."""
+    execute_query(
+        """
+        UPDATE render_jobs
+        SET status = %s, completed_steps = %s, state = %s, updated_at = CURRENT_TIMESTAMP,
+            finished_at = CASE WHEN %s THEN CURRENT_TIMESTAMP END
+        WHERE id = %s AND status NOT IN ('complete', 'failed') AND completed_steps <= %s
+        """,
+        (state["status"], state["completedSteps"], json.dumps(state, default=str),
+         state["status"] in TERMINAL_STATUSES, state["id"], state["completedSteps"])
+    )
+
+
+async def _save(job: RenderJob):
+    try:
+        await run_in_threadpool(_save_state, job.to_dict())
+    except Exception as e:
+        print(f"Failed to save render job {job.id}: {e}")
+
+
+def _save_in_background(job: RenderJob):
+    task = asyncio.create_task(_save(job))
+    _saves.add(task)
+    task.add_done_callback(_saves.discard)
+
+
+def _persist_submit(job: RenderJob) -> bool:
+    """Insert the ai_prompts row for a project-scoped job (only if the project belongs to the tenant)."""
+    rows = execute_query(
+        """
+        INSERT INTO ai_prompts (id, project_id, prompt, result)
+        SELECT %s, p.id, %s, %s
+        FROM projects p
+        WHERE p.id = %s AND p.company_id = %s
+        RETURNING id
+        """,
+        (job.id, job.prompt, json.dumps({"job": job.to_dict()}), job.project_id, job.tenant_id)
+    )
+    return bool(rows)
+
+
+def _persist_result(job: RenderJob):
+    execute_query(
+        "UPDATE ai_prompts SET result = %s WHERE id = %s",
+        (json.dumps({"job": job.to_dict()}, default=str), job.id)
+    )
+
+
+async def _worker():
+    while True:
+        job = await _queue.get()
+        try:
+            job.status = "running"
+            job._notify()
+            await _save(job)
+            try:
+                job.result = await job.runner(job)
+                job.status = "complete"
+                job.completed_steps = job.total_steps
+            except Exception as e:
+                detail = getattr(e, "detail", None)
+                job.error = detail if isinstance(detail, str) else str(e)
+                job.status = "failed"
+            job.finished_at = time.time()
+            await _save(job)
+            if job.persisted:
+                try:
+                    await run_in_threadpool(_persist_result, job)
+                except Exception as e:
+                    print(f"Failed to persist render job {job.id}: {e}")
+            job._notify()
+        finally:
+            _queue.task_done()
+
+
+def start_render_workers():
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=RENDER_JOB_QUEUE_LIMIT)
+    while len(_workers) < RENDER_JOB_WORKERS:
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop_render_workers(drain_timeout: float = 0):
+    """Stop the workers, first letting queued and running jobs finish for up to `drain_timeout` seconds."""
+    if drain_timeout > 0 and _queue is not None:
+        try:
+            await asyncio.wait_for(_queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️  Render jobs still running after {drain_timeout:.0f}s drain, cancelling")
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+def _sweep_finished(now: float):
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job.finished_at is not None and now - job.finished_at > RENDER_JOB_TTL
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+async def submit_job(job: RenderJob) -> RenderJob:
+    """Queue a job and return it immediately."""
+    start_render_workers()
+    _sweep_finished(time.time())
+    if _queue.full():
+        raise RenderQueueFull("Render queue is full, please try again later")
+    try:
+        await run_in_threadpool(_insert_state, job)
+    except Exception as e:
+        # Without the row, status polls on other workers would 404 a running job
+        print(f"Failed to record render job {job.id}: {e}")
+        raise RenderJobNotSaved("Render jobs are temporarily unavailable, please try again later")
+    if job.project_id and job.tenant_id:
+        try:
+            job.persisted = await run_in_threadpool(_persist_submit, job)
+        except Exception as e:
+            print(f"Failed to persist render job {job.id}: {e}")
+    _jobs[job.id] = job
+    _queue.put_nowait(job)
+    return job
+
+
+def get_job(job_id: str) -> Optional[RenderJob]:
+    return _jobs.get(job_id)
+
+
+def load_persisted_job(job_id: str, tenant_id: Optional[str]) -> Optional[dict]:
+    """Read a job's last saved state (e.g. when another worker runs it); tenant jobs only for their tenant."""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    rows = execute_query(
+        "SELECT tenant_id, state FROM render_jobs WHERE id = %s",
+        (job_id,)
+    )
+    if not rows or (rows[0]["tenant_id"] and rows[0]["tenant_id"] != tenant_id):
+        return None
+    return rows[0]["state"]
+
+
+CallbackMetric("render_jobs_queued", "Render jobs waiting for a worker.", lambda: _queue.qsize() if _queue else 0)
@@ -0,0 +1,71 @@
+# benchmarks/compare.py
+"""
+Compare two load-test reports (baseline first) endpoint by endpoint.
+
+    python -m benchmarks.compare before.json after.json --max-regression 10
+
+Exits non-zero if any endpoint's p95 got worse by more than
+--max-regression percent, or its error count went up, so a change can be
+gated on its baseline.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Endpoints with fewer samples than this are reported but never fail the run
+MIN_SAMPLES = 20
+
+
+def _delta(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(baseline: dict, current: dict, max_regression: float) -> list:
+    """Rows of (label, before, after, p95 change %, regressed)."""
+    rows = []
+    for label in sorted(baseline["endpoints"].keys() | current["endpoints"].keys()):
+        before = baseline["endpoints"].get(label)
+        after = current["endpoints"].get(label)
+        if before is None or after is None:
+            rows.append((label, before, after, None, False))
+            continue
+        change = _delta(before["p95Ms"], after["p95Ms"])
+        enough = min(before["count"], after["count"]) >= MIN_SAMPLES
+        regressed = enough and (change > max_regression or after["errors"] > before["errors"])
+        rows.append((label, before, after, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two load-test reports.")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument("--max-regression", type=float, default=10.0,
+                        help="allowed p95 increase per endpoint, in percent")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    current = json.loads(args.current.read_text())
+    print(f"baseline {baseline['meta'].get('gitCommit')} {baseline['meta'].get('label', '')}  ->  "
+          f"current {current['meta'].get('gitCommit')} {current['meta'].get('label', '')}")
+    print(f"{'endpoint':42} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'rps before':>11} {'rps after':>10}")
+
+    rows = compare(baseline, current, args.max_regression)
+    for label, before, after, change, regressed in rows:
+        if change is None:
+            print(f"{label:42} {'only in ' + ('baseline' if after is None else 'current'):>42}")
+            continue
+        flag = "  ❌" if regressed else ""
+        print(f"{label:42} {before['p95Ms']:>9.1f}ms {after['p95Ms']:>8.1f}ms {change:>+7.1f}% "
+              f"{before['throughputRps']:>11} {after['throughputRps']:>10}{flag}")
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"\n❌ {len(regressions)} endpoint(s) regressed beyond {args.max_regression}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/designs.py
+"""
+Synthetic floor plans for the load tests.
+
+A plan is a grid of kitchens (walls, L-shaped base cabinet runs, wall
+cabinets, sink/stove/refrigerator and an island) in the element format the
+frontend saves, repeated until the JSON reaches the requested size. Element
+ids are stable, so successive autosaves that move a few elements look like
+real edits to the incremental design checks.
+"""
+import json
+import random
+
+ROOM_SIZE = 480
+CABINET = 24
+
+
+def _element(element_id: str, kind: str, x: float, y: float, width: float, height: float,
+             furniture_type: str = None, rng: random.Random = None) -> dict:
+    element = {
+        "id": element_id,
+        "type": kind,
+        "x": x,
+        "y": y,
+        "width": width,
+        "height": height,
+        "rotation": 0,
+        "fill": "#8B7355" if kind == "furniture" else "#333333",
+        "stroke": "#222222",
+        "strokeWidth": 1,
+        "label": furniture_type or kind,
+    }
+    if furniture_type:
+        element["furnitureType"] = furniture_type
+        element["sku"] = f"{furniture_type[:3].upper()}-{rng.randint(1000, 9999)}"
+        element["finish"] = rng.choice(["oak", "walnut", "white-shaker", "graphite"])
+    return element
+
+
+def _kitchen(room: int, origin_x: float, origin_y: float, rng: random.Random) -> list:
+    prefix = f"r{room}"
+    size = ROOM_SIZE - 60
+    elements = [
+        _element(f"{prefix}-wall-top", "wall", origin_x, origin_y, size, 6),
+        _element(f"{prefix}-wall-left", "wall", origin_x, origin_y, 6, size),
+        _element(f"{prefix}-wall-bottom", "wall", origin_x, origin_y + size - 6, size, 6),
+        _element(f"{prefix}-wall-right", "wall", origin_x + size - 6, origin_y, 6, size),
+    ]
+    # L-shaped run along the top and left walls, uppers above the top run
+    for i in range(12):
+        x = origin_x + 6 + i * 30
+        kind = {4: "sink", 8: "stove"}.get(i, "base-cabinet")
+        elements.append(_element(f"{prefix}-top-{i}", "furniture", x, origin_y + 6, 30, CABINET, kind, rng))
+        elements.append(_element(f"{prefix}-upper-{i}", "furniture", x, origin_y + 6, 30, 12, "wall-cabinet", rng))
+    for i in range(1, 9):
+        kind = "refrigerator" if i == 8 else "base-cabinet"
+        elements.append(_element(f"{prefix}-left-{i}", "furniture", origin_x + 6, origin_y + 6 + i * 30, CABINET, 30, kind, rng))
+    for i in range(3):
+        elements.append(_element(
+            f"{prefix}-island-{i}", "furniture", origin_x + 150 + i * 36, origin_y + 200, 36, 36, "base-cabinet", rng))
+    return elements
+
+
+def make_design(target_bytes: int, seed: int = 0) -> dict:
+    """A design document whose JSON is at least `target_bytes` long."""
+    rng = random.Random(seed)
+    elements = []
+    size = 0
+    room = 0
+    while size < target_bytes:
+        row, col = divmod(room, 10)
+        room_elements = _kitchen(room, col * ROOM_SIZE, row * ROOM_SIZE, rng)
+        elements.extend(room_elements)
+        size += len(json.dumps(room_elements))
+        room += 1
+    return {
+        "elements": elements,
+        "wallColor": "#FFFFFF",
+        "floorColor": "#F5F5F5",
+        "ceilingColor": "#FFFFFF",
+        "scale": 1,
+        "design_mode": "2d",
+    }
+
+
+def make_elements(count: int, seed: int = 0) -> list:
+    """Exactly `count` plan elements (whole kitchens, the last one cut short)."""
+    rng = random.Random(seed)
+    elements = []
+    room = 0
+    while len(elements) < count:
+        row, col = divmod(room, 10)
+        elements.extend(_kitchen(room, col * ROOM_SIZE, row * ROOM_SIZE, rng))
+        room += 1
+    return elements[:count]
+
+
+def edit(design: dict, rng: random.Random, moves: int = 3) -> dict:
+    """Copy of the design with a few furniture elements nudged (an autosave's worth of edits)."""
+    elements = list(design["elements"])
+    for _ in range(moves):
+        index = rng.randrange(len(elements))
+        if elements[index]["type"] != "furniture":
+            continue
+        moved = dict(elements[index])
+        moved["x"] += rng.choice((-6, 6))
+        elements[index] = moved
+    return {**design, "elements": elements}
@@ -0,0 +1,93 @@
+# benchmarks/import_budget.py
+"""
+Cold-start check: how long `import main` takes and what it pulls in.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters and
+fails (exit 1) if
+
+- the fastest run exceeds the budget (--budget-ms / IMPORT_BUDGET_MS), or
+- a module that must stay lazy (provider SDKs, image and array libraries)
+  was imported at startup.
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 900 --top 30 --json report.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+# Loaded on first use only; importing any of these at startup is a regression
+LAZY_MODULES = ("google.generativeai", "PIL", "numpy")
+
+
+def import_times(runs: int) -> tuple:
+    """(total ms of the fastest run, {module: (self ms, cumulative ms)} of that run)."""
+    best = None
+    env = {**os.environ, "DATABASE_URL": os.getenv("DATABASE_URL", "postgresql://localhost/unused")}
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                                cwd=ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            sys.exit(f"import main failed:\n{result.stderr[-2000:]}")
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            if not self_us.strip().isdigit():
+                continue  # header line
+            modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        total = modules["main"][1]
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the app.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters; the fastest counts")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--json", type=Path, help="write the full report here")
+    args = parser.parse_args()
+
+    total, modules = import_times(args.runs)
+    top_level = sorted(
+        ((name, times) for name, times in modules.items() if "." not in name and name != "main"),
+        key=lambda item: item[1][1], reverse=True,
+    )
+    print(f"import main: {total:.0f} ms (budget {args.budget_ms:.0f} ms, fastest of {args.runs})")
+    print(f"\n{'package':32} {'cumulative':>11}")
+    for name, (_, cumulative) in top_level[:args.top]:
+        print(f"{name:32} {cumulative:>9.1f}ms")
+
+    eager = sorted(name for name in modules if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES))
+    eager_roots = sorted({lazy for lazy in LAZY_MODULES if any(n == lazy or n.startswith(lazy + ".") for n in eager)})
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "totalMs": round(total, 1),
+            "budgetMs": args.budget_ms,
+            "eagerLazyModules": eager_roots,
+            "modules": {name: {"selfMs": s, "cumulativeMs": c} for name, (s, c) in modules.items()},
+        }, indent=2))
+
+    failed = False
+    if eager_roots:
+        print(f"\n❌ Imported at startup but should be lazy: {', '.join(eager_roots)}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"\n❌ Import time {total:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("\n✅ Within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+# benchmarks/load.py
+"""
+Reproducible load test against a local Postgres and a mock Leonardo.
+
+Starts the mock provider and the API (uvicorn subprocesses), applies the
+migrations, seeds tenants and projects with multi-MB designs through the API,
+then drives a weighted mix of scenarios from concurrent virtual users:
+
+- login:    login storms (bcrypt pool, user lookup)
+- autosave: bursts of design saves on one project (large JSONB inserts,
+            background design checks)
+- browse:   project list, open a project, read its suggestions
+- render:   submit a design job and poll it to completion
+
+Results (throughput and p50/p95/p99 per endpoint) are printed and written
+as JSON; compare two runs with `python -m benchmarks.compare`.
+
+    python -m benchmarks.load --database-url postgresql://localhost/kab_bench \\
+        --mix autosave=4,browse=4,login=1,render=1 --duration 60 --output after.json
+
+The database is written to: point it at a scratch database.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+
+from benchmarks.designs import edit, make_design
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_PASSWORD = "bench-password-1"
+DEFAULT_MIX = "autosave=4,browse=4,login=1,render=1"
+# Distinct design variants per run; saves rotate through them
+DESIGN_VARIANTS = 4
+
+
+class Recorder:
+    """Latencies and errors per endpoint label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.scenarios = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, method: str, label: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.latencies[label].append(time.perf_counter() - started)
+            self.errors[label] += 1
+            self.statuses[label][type(e).__name__] += 1
+            return None
+        self.latencies[label].append(time.perf_counter() - started)
+        self.statuses[label][str(response.status_code)] += 1
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+    def observe(self, label: str, seconds: float, ok: bool = True):
+        self.latencies[label].append(seconds)
+        self.statuses[label]["ok" if ok else "failed"] += 1
+        if not ok:
+            self.errors[label] += 1
+
+
+def percentile(ordered: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for label in sorted(recorder.latencies):
+        ordered = sorted(recorder.latencies[label])
+        endpoints[label] = {
+            "count": len(ordered),
+            "errors": recorder.errors[label],
+            "throughputRps": round(len(ordered) / elapsed, 2),
+            "p50Ms": round(percentile(ordered, 50) * 1000, 2),
+            "p95Ms": round(percentile(ordered, 95) * 1000, 2),
+            "p99Ms": round(percentile(ordered, 99) * 1000, 2),
+            "meanMs": round(sum(ordered) / len(ordered) * 1000, 2),
+            "maxMs": round(ordered[-1] * 1000, 2),
+            "statuses": dict(recorder.statuses[label]),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "endpoints": endpoints,
+        "scenarios": dict(recorder.scenarios),
+        "totals": {
+            "requests": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "throughputRps": round(total / elapsed, 2),
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Environment: database, mock provider, API server
+# ---------------------------------------------------------------------------
+
+def prepare_database(database_url: str, allow_remote: bool):
+    host = urlparse(database_url).hostname or "localhost"
+    if host not in ("localhost", "127.0.0.1", "::1") and not allow_remote:
+        sys.exit(f"Refusing to seed non-local database host {host!r} (use --allow-remote-db)")
+    subprocess.run([sys.executable, "-m", "app.db.migrate"], cwd=ROOT, check=True,
+                   env={**os.environ, "DATABASE_URL": database_url})
+
+
+def start_process(args: list, env: dict, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=ROOT, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                sys.exit(f"{url} exited with code {process.returncode}; see its log in the output directory")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.25)
+    sys.exit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def server_env(args) -> dict:
+    return {
+        "DATABASE_URL": args.database_url,
+        "LEONARDO_API_URL": f"http://127.0.0.1:{args.mock_port}/api/rest/v1",
+        "LEONARDO_API_KEY": "bench",
+        "LEONARDO_POLL_INITIAL": "0.5",
+        "LEONARDO_POLL_MAX": "1",
+        # Measure the service, not the limiter
+        "RATE_LIMIT_ENABLED": "false",
+        "RENDER_STORE_DIR": str(args.out_dir / "renders"),
+        "JWT_SECRET": "bench-secret",
+    }
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------------------------
+
+async def seed(client: httpx.AsyncClient, args, designs: list) -> list:
+    """Register (or log into) each tenant and make sure it has its projects; returns tenant dicts."""
+    tenants = []
+    for t in range(args.tenants):
+        email = f"user@bench-tenant-{t}.example.com"
+        response = await client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+        if response.status_code == 401:
+            response = await client.post("/api/auth/register", json={
+                "email": email, "password": BENCH_PASSWORD, "companyName": f"Bench Tenant {t}",
+            })
+        response.raise_for_status()
+        token = response.json()["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        existing = (await client.get("/api/projects/", headers=headers)).json()["projects"]
+        project_ids = [str(p["id"]) for p in existing][:args.projects]
+        for p in range(len(project_ids), args.projects):
+            response = await client.post("/api/projects/", headers=headers, json={
+                "name": f"Bench project {p}", "description": "load test",
+            })
+            response.raise_for_status()
+            project_id = str(response.json()["project"]["id"])
+            response = await client.post(f"/api/projects/{project_id}/data", content=designs[0],
+                                         headers={**headers, "Content-Type": "application/json"})
+            response.raise_for_status()
+            project_ids.append(project_id)
+        tenants.append({"email": email, "headers": headers, "projects": project_ids})
+        print(f"  seeded tenant {t}: {len(project_ids)} projects")
+    return tenants
+
+
+# ---------------------------------------------------------------------------
+# Scenarios: each is one "visit" by a virtual user
+# ---------------------------------------------------------------------------
+
+async def login_scenario(client, recorder: Recorder, tenant: dict, rng: random.Random, ctx: dict):
+    await recorder.request(client, "POST", "POST /api/auth/login", "/api/auth/login",
+                           json={"email": tenant["email"], "password": BENCH_PASSWORD})
+
+
+async def autosave_scenario(client, recorder: Recorder, tenant: dict, rng: random.Random, ctx: dict):
+    project_id = rng.choice(tenant["projects"])
+    headers = {**tenant["headers"], "Content-Type": "application/json"}
+    for _ in range(ctx["burst"]):
+        body = ctx["designs"][rng.randrange(len(ctx["designs"]))]
+        await recorder.request(client, "POST", "POST /api/projects/{id}/data",
+                               f"/api/projects/{project_id}/data", content=body, headers=headers)
+        await asyncio.sleep(rng.uniform(0.05, 0.2))
+
+
+async def browse_scenario(client, recorder: Recorder, tenant: dict, rng: random.Random, ctx: dict):
+    headers = tenant["headers"]
+    await recorder.request(client, "GET", "GET /api/projects", "/api/projects/", headers=headers)
+    project_id = rng.choice(tenant["projects"])
+    await recorder.request(client, "GET", "GET /api/projects/{id}", f"/api/projects/{project_id}", headers=headers)
+    await recorder.request(client, "GET", "GET /api/projects/{id}/suggestions",
+                           f"/api/projects/{project_id}/suggestions", headers=headers)
+
+
+async def render_scenario(client, recorder: Recorder, tenant: dict, rng: random.Random, ctx: dict):
+    started = time.perf_counter()
+    response = await recorder.request(client, "POST", "POST /api/ai-designer/jobs", "/api/ai-designer/jobs",
+                                      headers=tenant["headers"], json={
+                                          "prompt": f"Modern kitchen, variation {rng.randrange(ctx['render_prompts'])}",
+                                          "variants": 1,
+                                          "projectId": rng.choice(tenant["projects"]),
+                                      })
+    if response is None or response.status_code >= 400:
+        return
+    job_id = response.json()["jobId"]
+    deadline = started + ctx["render_timeout"]
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0.5)
+        poll = await recorder.request(client, "GET", "GET /api/jobs/{id}", f"/api/jobs/{job_id}",
+                                      headers=tenant["headers"])
+        if poll is None or poll.status_code >= 400:
+            break
+        status = poll.json()["job"]["status"]
+        if status in ("complete", "failed"):
+            recorder.observe("render job end-to-end", time.perf_counter() - started, status == "complete")
+            return
+    recorder.observe("render job end-to-end", time.perf_counter() - started, False)
+
+
+SCENARIOS = {
+    "login": login_scenario,
+    "autosave": autosave_scenario,
+    "browse": browse_scenario,
+    "render": render_scenario,
+}
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            sys.exit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def virtual_user(index: int, client, recorder: Recorder, tenants: list, weights: dict,
+                       deadline: float, args, ctx: dict):
+    rng = random.Random(args.seed * 1000 + index)
+    names = list(weights)
+    tenant = tenants[index % len(tenants)]
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights=[weights[n] for n in names])[0]
+        recorder.scenarios[name] += 1
+        await SCENARIOS[name](client, recorder, tenant, rng, ctx)
+        await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+async def run(args) -> dict:
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    weights = parse_mix(args.mix)
+
+    print("📐 Building designs...")
+    base = make_design(int(args.design_mb * 1024 * 1024), args.seed)
+    rng = random.Random(args.seed)
+    designs = [json.dumps(base).encode()] + [
+        json.dumps(edit(base, rng)).encode() for _ in range(DESIGN_VARIANTS - 1)
+    ]
+
+    if not args.no_prepare:
+        print("🗄️  Applying schema...")
+        prepare_database(args.database_url, args.allow_remote_db)
+
+    env = server_env(args)
+    processes = [
+        start_process([sys.executable, "-m", "uvicorn", "benchmarks.mock_leonardo:app",
+                       "--port", str(args.mock_port), "--log-level", "warning"],
+                      {"MOCK_LEONARDO_RENDER_MS": str(args.render_ms)}, args.out_dir / "mock_leonardo.log"),
+        start_process([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                       "--workers", str(args.workers), "--log-level", "warning"],
+                      env, args.out_dir / "api.log"),
+    ]
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        await wait_until_up(f"http://127.0.0.1:{args.mock_port}/docs", processes[0])
+        await wait_until_up(f"{base_url}/health", processes[1])
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            print(f"🌱 Seeding {args.tenants} tenants x {args.projects} projects ({len(designs[0]) / 1e6:.1f} MB designs)...")
+            tenants = await seed(client, args, designs)
+
+            ctx = {"designs": designs, "burst": args.autosave_burst,
+                   "render_prompts": args.render_prompts, "render_timeout": args.timeout}
+            if args.warmup:
+                print(f"🔥 Warming up for {args.warmup}s...")
+                warm = Recorder()
+                deadline = time.monotonic() + args.warmup
+                await asyncio.gather(*[
+                    virtual_user(i, client, warm, tenants, weights, deadline, args, ctx)
+                    for i in range(args.concurrency)
+                ])
+
+            print(f"🚀 Running {args.mix} with {args.concurrency} users for {args.duration}s...")
+            recorder = Recorder()
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(*[
+                virtual_user(i, client, recorder, tenants, weights, deadline, args, ctx)
+                for i in range(args.concurrency)
+            ])
+            elapsed = time.monotonic() - started
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = summarize(recorder, elapsed)
+    report["meta"] = {
+        "label": args.label,
+        "gitCommit": _git_commit(),
+        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "cpuCount": os.cpu_count(),
+        "durationSeconds": round(elapsed, 2),
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "mix": weights,
+        "seed": args.seed,
+        "tenants": args.tenants,
+        "projectsPerTenant": args.projects,
+        "designBytes": len(designs[0]),
+        "renderMs": args.render_ms,
+    }
+    return report
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':42} {'count':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for label, stats in report["endpoints"].items():
+        print(f"{label:42} {stats['count']:>7} {stats['errors']:>5} {stats['throughputRps']:>8} "
+              f"{stats['p50Ms']:>7.1f}ms {stats['p95Ms']:>7.1f}ms {stats['p99Ms']:>7.1f}ms")
+    totals = report["totals"]
+    print(f"\nTotal: {totals['requests']} requests, {totals['errors']} errors, {totals['throughputRps']} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against local stand-ins.")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="scratch Postgres database (default: $BENCH_DATABASE_URL)")
+    parser.add_argument("--allow-remote-db", action="store_true", help="allow a non-localhost database host")
+    parser.add_argument("--no-prepare", action="store_true", help="skip applying schema and migrations")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--think-time", type=float, default=0.5, help="max pause between visits (s)")
+    parser.add_argument("--tenants", type=int, default=8)
+    parser.add_argument("--projects", type=int, default=20, help="projects per tenant")
+    parser.add_argument("--design-mb", type=float, default=2.0, help="size of each saved design")
+    parser.add_argument("--autosave-burst", type=int, default=5, help="saves per autosave visit")
+    parser.add_argument("--render-prompts", type=int, default=50,
+                        help="distinct render prompts (fewer means more render cache hits)")
+    parser.add_argument("--render-ms", type=float, default=3000, help="mock provider render time")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--mock-port", type=int, default=8090)
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="free-form run label stored in the report")
+    parser.add_argument("--out-dir", type=Path, default=ROOT / "benchmarks" / "results",
+                        help="server logs and render store")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url (or BENCH_DATABASE_URL) is required")
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"📝 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# benchmarks/micro.py
+"""
+Microbenchmarks for the CPU-bound pure code paths (no database needed).
+
+Each case times one call of a hot function on prepared input: prompt
+building from designs of 10 to 50k elements, JSON encode/decode of large
+design payloads, JWT issue/verify, the bcrypt pre-hash and bcrypt itself at
+our cost factor, and catalog upsert/lookup. Timing follows timeit: loops are
+auto-ranged per case and the median of --repeat runs is reported.
+
+Every run is appended to a JSON-lines history file. With --check the run is
+compared against the latest earlier entry from the same machine and exits
+non-zero if any case got slower than --max-regression percent.
+
+    python -m benchmarks.micro                      # run and record
+    python -m benchmarks.micro --check              # ...and fail on regressions
+    python -m benchmarks.micro --filter prompt --no-record
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+
+# Imported app modules never connect; the pool is created lazily
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+from benchmarks.designs import make_design, make_elements  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_HISTORY = ROOT / "benchmarks" / "results" / "micro_history.jsonl"
+PROMPT_SIZES = (10, 100, 1000, 10000, 50000)
+PAYLOAD_MB = (1, 10)
+CATALOG_SIZE = 1000
+
+# name -> setup function returning the zero-argument callable to time
+CASES: dict = {}
+
+
+def case(name: str):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _run_handler(handler, *args):
+    """Drive an async route handler that never awaits, without an event loop per call."""
+    coro = handler(*args)
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError(f"{handler.__name__} awaited; benchmark it with an event loop instead")
+
+
+# --- Prompt building -------------------------------------------------------
+
+def _prompt_case(count: int):
+    def setup():
+        from app.routers.gemini import KitchenElement, convertDesignToPrompt
+        elements = [KitchenElement(**e) for e in make_elements(count)]
+        return lambda: convertDesignToPrompt(elements, "#FFFFFF", "#F5F5F5", "#FFFFFF", None)
+    return setup
+
+
+for _count in PROMPT_SIZES:
+    case(f"prompt.convertDesignToPrompt[{_count}]")(_prompt_case(_count))
+
+
+# --- data_json payloads ----------------------------------------------------
+
+def _payload_cases(megabytes: int):
+    def encode():
+        design = make_design(megabytes * 1024 * 1024)
+        return lambda: json.dumps(design)
+
+    def decode():
+        text = json.dumps(make_design(megabytes * 1024 * 1024))
+        return lambda: json.loads(text)
+    return encode, decode
+
+
+for _mb in PAYLOAD_MB:
+    _encode, _decode = _payload_cases(_mb)
+    case(f"json.encode_design[{_mb}MB]")(_encode)
+    case(f"json.decode_design[{_mb}MB]")(_decode)
+
+
+# --- Tokens ----------------------------------------------------------------
+
+@case("auth.create_token")
+def _create_token():
+    from app.routers.auth import create_token
+    return lambda: create_token("6f1c2d3e-0000-4000-8000-000000000001", "6f1c2d3e-0000-4000-8000-000000000002", "admin")
+
+
+def _decode_case(use_cache: bool):
+    def setup():
+        from app.middleware.auth import decode_token
+        from app.routers.auth import create_token
+        token = create_token("6f1c2d3e-0000-4000-8000-000000000001", "6f1c2d3e-0000-4000-8000-000000000002", "admin")
+        return lambda: decode_token(token, use_cache=use_cache)
+    return setup
+
+
+case("auth.decode_token[cached]")(_decode_case(True))
+case("auth.decode_token[uncached]")(_decode_case(False))
+
+
+@case("auth.get_current_user")
+def _get_current_user():
+    from fastapi.security import HTTPAuthorizationCredentials
+    from app.middleware.auth import get_current_user
+    from app.routers.auth import create_token
+    token = create_token("6f1c2d3e-0000-4000-8000-000000000001", "6f1c2d3e-0000-4000-8000-000000000002", "admin")
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return lambda: _run_handler(get_current_user, credentials)
+
+
+# --- Passwords -------------------------------------------------------------
+
+@case("passwords.prepare_password_for_bcrypt")
+def _prepare_password():
+    from app.services.passwords import prepare_password_for_bcrypt
+    return lambda: prepare_password_for_bcrypt("correct horse battery staple 🐴")
+
+
+@case("passwords.bcrypt_hash")
+def _bcrypt_hash():
+    from app.services.passwords import _hash_sync
+    return lambda: _hash_sync("correct horse battery staple")
+
+
+@case("passwords.bcrypt_verify")
+def _bcrypt_verify():
+    from app.services.passwords import _hash_sync, _verify_sync
+    password_hash = _hash_sync("correct horse battery staple")
+    return lambda: _verify_sync("correct horse battery staple", password_hash)
+
+
+# --- Catalog ---------------------------------------------------------------
+
+def _catalog(size: int) -> list:
+    from app.routers.catalog import BlockDefinition
+    return [
+        BlockDefinition(
+            id=f"block-{i}", name=f"Base cabinet {i}", category="base-cabinet", width=24 + i % 12, height=24,
+            planSymbols=[
+                {"kind": "rect", "x": 0, "y": 0, "width": 1, "height": 1, "stroke": "base"},
+                {"kind": "line", "points": [0, 0.8, 1, 0.8], "stroke": "detail", "dash": [0.05, 0.05]},
+                {"kind": "circle", "x": 0.5, "y": 0.4, "radius": 0.1, "stroke": "detail"},
+            ],
+        )
+        for i in range(size)
+    ]
+
+
+def _primed_store():
+    """The router's catalog store filled in memory and never refreshed from the database."""
+    from app.routers import catalog
+    store = catalog.catalog_store
+    store._refresh_seconds = float("inf")
+    store._loaded_at = time.monotonic()
+    store._blocks = {block.id: block for block in _catalog(CATALOG_SIZE)}
+    return catalog, store
+
+
+@case(f"catalog.upsert[{CATALOG_SIZE}]")
+def _catalog_upsert():
+    catalog, store = _primed_store()
+    store._save = lambda block_id, definition: None  # time the in-process path, not the INSERT
+    block = store.get(f"block-{CATALOG_SIZE // 2}")
+    return lambda: _run_handler(catalog.create_block, block, {})
+
+
+@case(f"catalog.block_symbol[{CATALOG_SIZE}]")
+def _catalog_lookup():
+    catalog, _ = _primed_store()
+    return lambda: _run_handler(catalog.get_block_symbol, f"block-{CATALOG_SIZE - 1}", {})
+
+
+@case(f"catalog.find_compiled_symbol[{CATALOG_SIZE}]")
+def _catalog_symbol():
+    from app.services.plan_symbols import symbol_hash
+    catalog, store = _primed_store()
+    block = store.get(f"block-{CATALOG_SIZE - 1}")
+    key = symbol_hash(block.planSymbols, block.width, block.height)
+    return lambda: catalog.find_compiled_symbol(key)
+
+
+# ---------------------------------------------------------------------------
+# Runner and history
+# ---------------------------------------------------------------------------
+
+def measure(fn, repeat: int, min_time: float) -> dict:
+    fn()  # warm caches and lazy imports outside the timed runs
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    loops = max(1, int(loops * min_time / 0.2))
+    per_call = [t / loops for t in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        "medianUs": round(statistics.median(per_call) * 1e6, 3),
+        "minUs": round(min(per_call) * 1e6, 3),
+        "stdevUs": round(statistics.stdev(per_call) * 1e6, 3) if len(per_call) > 1 else 0.0,
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def machine_id() -> str:
+    return f"{platform.node()}/{platform.machine()}/py{platform.python_version()}"
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_baseline(history: Path, machine: str):
+    """Latest recorded run from this machine, or None."""
+    if not history.exists():
+        return None
+    baseline = None
+    for line in history.read_text().splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if entry.get("machine") == machine:
+            baseline = entry
+    return baseline
+
+
+def regressions(baseline: dict, results: dict, max_regression: float) -> list:
+    found = []
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if not before or not before["medianUs"]:
+            continue
+        change = (result["medianUs"] - before["medianUs"]) / before["medianUs"] * 100
+        if change > max_regression:
+            found.append((name, before["medianUs"], result["medianUs"], change))
+    return found
+
+
+def _format_us(value: float) -> str:
+    if value >= 1e6:
+        return f"{value / 1e6:.2f}s"
+    if value >= 1e3:
+        return f"{value / 1e3:.2f}ms"
+    return f"{value:.2f}µs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run microbenchmarks for the pure hot paths.")
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="target seconds per repeat")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY, help="JSON-lines history file")
+    parser.add_argument("--no-record", action="store_true", help="don't append this run to the history")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a case regressed against the history")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in percent")
+    parser.add_argument("--label", default="", help="free-form label stored with the run")
+    parser.add_argument("--list", action="store_true", help="list case names and exit")
+    args = parser.parse_args()
+
+    names = [name for name in CASES if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    machine = machine_id()
+    baseline = load_baseline(args.history, machine)
+    results = {}
+    for name in names:
+        results[name] = measure(CASES[name](), args.repeat, args.min_time)
+        before = (baseline or {}).get("results", {}).get(name)
+        change = ""
+        if before and before["medianUs"]:
+            change = f"{(results[name]['medianUs'] - before['medianUs']) / before['medianUs'] * 100:+.1f}%"
+        print(f"{name:48} {_format_us(results[name]['medianUs']):>10}  ±{_format_us(results[name]['stdevUs']):>9} {change:>8}")
+
+    if not args.no_record:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "recordedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "gitCommit": _git_commit(),
+            "machine": machine,
+            "label": args.label,
+            "results": results,
+        }
+        with open(args.history, "a") as history:
+            history.write(json.dumps(entry) + "\n")
+
+    if args.check:
+        if baseline is None:
+            print("\nℹ️  No earlier run from this machine in the history; nothing to compare")
+            return
+        found = regressions(baseline, results, args.max_regression)
+        if found:
+            print(f"\n❌ Regressed beyond {args.max_regression}% against {baseline['gitCommit']}:")
+            for name, before, after, change in found:
+                print(f"   {name}: {_format_us(before)} -> {_format_us(after)} ({change:+.1f}%)")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {baseline['gitCommit']}")
+
+
+if __name__ == "__main__":
+    main()
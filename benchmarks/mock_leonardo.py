@@ -0,0 +1,70 @@
+# benchmarks/mock_leonardo.py
+"""
+Local stand-in for the Leonardo REST API used by the load tests.
+
+Implements the calls the app makes (create a generation, fetch its status)
+and serves the generated image itself, with configurable latency:
+
+- MOCK_LEONARDO_CREATE_MS: latency of the create call
+- MOCK_LEONARDO_RENDER_MS: how long a generation stays PENDING
+- MOCK_LEONARDO_FAILURE_RATE: share of create calls answered with a 500
+
+    uvicorn benchmarks.mock_leonardo:app --port 8090
+"""
+import asyncio
+import io
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from PIL import Image
+
+CREATE_MS = float(os.getenv("MOCK_LEONARDO_CREATE_MS", "150"))
+RENDER_MS = float(os.getenv("MOCK_LEONARDO_RENDER_MS", "3000"))
+FAILURE_RATE = float(os.getenv("MOCK_LEONARDO_FAILURE_RATE", "0"))
+
+app = FastAPI(title="Mock Leonardo")
+
+# generation id -> time it completes
+_generations: dict = {}
+
+
+def _render_png() -> bytes:
+    # Same size the app requests, with some noise so it doesn't compress to nothing
+    image = Image.effect_noise((1024, 768), 48).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+IMAGE_PNG = _render_png()
+
+
+@app.post("/api/rest/v1/generations")
+async def create_generation(request: Request):
+    await request.json()
+    await asyncio.sleep(CREATE_MS / 1000 * random.uniform(0.8, 1.2))
+    if FAILURE_RATE and random.random() < FAILURE_RATE:
+        raise HTTPException(status_code=500, detail="mock failure")
+    generation_id = str(uuid.uuid4())
+    _generations[generation_id] = time.monotonic() + RENDER_MS / 1000 * random.uniform(0.8, 1.2)
+    return {"sdGenerationJob": {"generationId": generation_id, "apiCreditCost": 0}}
+
+
+@app.get("/api/rest/v1/generations/{generation_id}")
+async def get_generation(generation_id: str, request: Request):
+    ready_at = _generations.get(generation_id)
+    if ready_at is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    if time.monotonic() < ready_at:
+        return {"generations_by_pk": {"id": generation_id, "status": "PENDING", "generated_images": []}}
+    url = str(request.url_for("get_image", generation_id=generation_id))
+    return {"generations_by_pk": {"id": generation_id, "status": "COMPLETE", "generated_images": [{"url": url}]}}
+
+
+@app.get("/images/{generation_id}.png")
+async def get_image(generation_id: str):
+    return Response(IMAGE_PNG, media_type="image/png")
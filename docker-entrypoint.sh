@@ -29,17 +29,11 @@ done
 
 echo "Database is ready!"
 
-# Initialize schema if it does not exist
-if [ -f "src/db/schema.sql" ]; then
-  echo "Running initial schema..."
-  PGPASSWORD=$DB_PASS psql -h "$DB_HOST" -p "$DB_PORT" -U "$DB_USER" -d "$DB_NAME" -f src/db/schema.sql 2>&1 | grep -v "already exists" || true
-fi
-
-# Run migrations
+# Apply pending migrations (one ledger read when the schema is current; a failure stops the container)
 echo "Running migrations..."
-python -m app.db.migrate || echo "Migrations completed with warnings"
+python -m app.db.migrate
 
-# Start server
+# Start server (worker count sized from the container's CPU and memory limits)
 echo "Starting FastAPI server on port ${PORT:-8000}..."
-exec uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000} --workers 1
+exec gunicorn main:app -c gunicorn.conf.py
 
@@ -0,0 +1,79 @@
+# gunicorn.conf.py
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+- the app is imported once in the master (preload) and forked, so workers
+  start fast and share read-only pages; connection pools, thread pools and
+  background tasks are created lazily in each worker after the fork;
+- worker count is sized from the CPU quota and memory limit
+  (app/config/server.py), WEB_CONCURRENCY overrides it;
+- workers are recycled after MAX_REQUESTS requests (with jitter so they
+  don't all restart together) or once their RSS passes WORKER_MAX_MEMORY_MB;
+- the worker count is exported as WEB_CONCURRENCY, so the app picks
+  shared state (e.g. rate-limit counters in Postgres) when there are
+  several workers;
+- each worker publishes its metrics to METRICS_DIR on tmpfs, so a
+  /metrics scrape answered by any worker covers all of them;
+- on SIGTERM workers stop accepting, finish in-flight requests and drain
+  queued render jobs for up to GRACEFUL_TIMEOUT seconds.
+"""
+import os
+import shutil
+
+from app.config.server import MB, cpu_limit, memory_limit, worker_count
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = worker_count()
+preload_app = True
+
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", str(max_requests // 10)))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers in containers
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = os.getenv("ACCESS_LOG") or None
+errorlog = "-"
+
+# Per-worker budgets: split shared resources between the workers unless set explicitly.
+# Read by the app when it is preloaded below, after this file runs.
+# The app keys multi-worker behaviour (e.g. the shared rate-limit store) off the worker count
+os.environ["WEB_CONCURRENCY"] = str(workers)
+_memory = memory_limit()
+if not os.getenv("WORKER_MAX_MEMORY_MB") and _memory:
+    os.environ["WORKER_MAX_MEMORY_MB"] = str(int(_memory * 0.9 // workers // MB))
+if not os.getenv("DB_POOL_MAX") and os.getenv("DB_MAX_CONNECTIONS"):
+    os.environ["DB_POOL_MAX"] = str(max(2, int(os.getenv("DB_MAX_CONNECTIONS")) // workers))
+if not os.getenv("PASSWORD_HASH_WORKERS"):
+    os.environ["PASSWORD_HASH_WORKERS"] = str(max(1, int(cpu_limit()) // workers))
+# Workers publish metric snapshots here so /metrics on any worker covers all of them
+# (one directory per master, so a restarted server never merges stale workers)
+if worker_tmp_dir:
+    os.environ.setdefault("METRICS_DIR", os.path.join(worker_tmp_dir, f"kab-metrics-{os.getpid()}"))
+# Leave a few seconds of the graceful timeout for the HTTP drain and shutdown hooks
+os.environ.setdefault("RENDER_DRAIN_SECONDS", str(max(0, graceful_timeout - 10)))
+
+
+def when_ready(server):
+    server.log.info(
+        "Serving with %d workers (cpu limit %.1f, memory limit %s MB, worker ceiling %s MB, max_requests %d)",
+        workers, cpu_limit(), _memory // MB if _memory else "?", os.getenv("WORKER_MAX_MEMORY_MB", "-"), max_requests,
+    )
+
+
+def post_fork(server, worker):
+    # Connections must never be shared across a fork; preload happens before any exist,
+    # but drop a pool created in the master just in case.
+    from app.config import db, replicas
+    db.connection_pool = None
+    replicas.reset_replicas()
+
+
+def on_exit(server):
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and metrics_dir.startswith(f"{worker_tmp_dir}/kab-metrics-"):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
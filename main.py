@@ -2,12 +2,23 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 import os
+import hmac
 from dotenv import load_dotenv
-from app.routers import auth, projects, catalog, gemini, ai_designer
+from starlette.concurrency import run_in_threadpool
+from app.routers import auth, projects, catalog, gemini, ai_designer, jobs, renders, admin
 from app.middleware.error_handler import setup_error_handlers
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.profiler import ProfilerMiddleware
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.middleware.read_consistency import ReadConsistencyMiddleware
+from app.config.replicas import start_replica_monitor
+from app.config.server import start_memory_watchdog
+from app.services.leonardo import close_http_client, poller
+from app.services.metrics import render_metrics, start_metrics_publisher, unpublish_metrics
+from app.services.render_jobs import start_render_workers, stop_render_workers
 
 load_dotenv()
 
@@ -17,6 +28,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Read-your-writes for replica reads (innermost, so it sees the route's writes)
+app.add_middleware(ReadConsistencyMiddleware)
+
+# Rate limiting (added before CORS so 429 responses still carry CORS headers)
+app.add_middleware(RateLimitMiddleware)
+
 # CORS configuration
 cors_origin = os.getenv("CORS_ORIGIN", "http://localhost:5173")
 # Support multiple origins if comma-separated
@@ -36,9 +53,41 @@ if os.getenv("NODE_ENV") == "production":
         allowed_hosts=["*"]
     )
 
+# Opt-in sampling profiler (X-Profile + X-Admin-Token, or PROFILER_SLOW_MS)
+app.add_middleware(ProfilerMiddleware)
+
+# Request metrics (outermost, so rejected and failed requests are counted too)
+app.add_middleware(MetricsMiddleware)
+
 # Setup error handlers
 setup_error_handlers(app)
 
+_memory_watchdog = None
+_replica_monitor = None
+_metrics_publisher = None
+
+@app.on_event("startup")
+async def startup():
+    global _memory_watchdog, _replica_monitor, _metrics_publisher
+    start_render_workers()
+    # Recycle this worker past WORKER_MAX_MEMORY_MB (set by gunicorn.conf.py)
+    _memory_watchdog = start_memory_watchdog()
+    # Health and replay position of DATABASE_REPLICA_URLS, if any
+    _replica_monitor = start_replica_monitor()
+    # Share this worker's metrics with the others through METRICS_DIR, if set
+    _metrics_publisher = start_metrics_publisher()
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in (_memory_watchdog, _replica_monitor, _metrics_publisher):
+        if task is not None:
+            task.cancel()
+    unpublish_metrics()
+    # Let queued render jobs finish while the server drains
+    await stop_render_workers(float(os.getenv("RENDER_DRAIN_SECONDS", "0")))
+    await poller.stop()
+    await close_http_client()
+
 # Root route
 @app.get("/")
 async def root():
@@ -56,12 +105,25 @@ async def health():
         "timestamp": __import__("datetime").datetime.now().isoformat()
     }
 
+# Prometheus metrics (labelled by worker; all live workers with METRICS_DIR); set METRICS_TOKEN to require a bearer token
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return PlainTextResponse(await run_in_threadpool(render_metrics), media_type="text/plain; version=0.0.4")
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(projects.router, prefix="/api/projects", tags=["projects"])
 app.include_router(catalog.router, prefix="/api/catalog", tags=["catalog"])
 app.include_router(gemini.router, prefix="/api/gemini", tags=["gemini"])
 app.include_router(ai_designer.router, prefix="/api/ai-designer", tags=["ai-designer"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(renders.router, prefix="/api/renders", tags=["renders"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 3001))  # Default to 3001 to match frontend
@@ -1,7 +1,8 @@
 # backend/run.py
-# Simple script to run the FastAPI server with uvicorn
+# Run the API: uvicorn with reload for development, gunicorn + uvicorn workers in production
 import uvicorn
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,12 +10,19 @@ load_dotenv()
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 3001))
     host = os.getenv("HOST", "0.0.0.0")
+    production = os.getenv("NODE_ENV") == "production" or "--prod" in sys.argv[1:]
     
     print(f"🚀 Starting KABS Design Tool API on http://{host}:{port}")
     print(f"📝 Environment: {os.getenv('NODE_ENV', 'development')}")
     print(f"🔗 CORS enabled for: {os.getenv('CORS_ORIGIN', 'http://localhost:5173')}")
     print("")
     
+    if production:
+        # Preloaded multi-worker server sized from the container (see gunicorn.conf.py)
+        os.environ["PORT"] = str(port)
+        os.environ["HOST"] = host
+        os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py"])
+    
     uvicorn.run(
         "main:app",
         host=host,
@@ -22,4 +30,3 @@ if __name__ == "__main__":
         reload=True,
         log_level="info"
     )
-
@@ -1,5 +1,6 @@
 -- KABS 2D Design Tool Database Schema
 -- Multi-tenant architecture for production use
+-- Reference snapshot: the database is built and changed by app/db/migrations (python -m app.db.migrate)
 
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
@@ -51,11 +52,13 @@ CREATE TABLE IF NOT EXISTS projects (
   is_draft BOOLEAN DEFAULT false,
   folder_id UUID REFERENCES folders(id) ON DELETE SET NULL,
   status VARCHAR(50) DEFAULT 'active',
+  suggestions_version INTEGER, -- project_data version the open ai_suggestions describe
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Project Data Table (stores the actual design data)
+-- Large installs convert it to hash partitions on project_id online: python -m app.db.partition_project_data
 CREATE TABLE IF NOT EXISTS project_data (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
   project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
@@ -87,6 +90,7 @@ CREATE TABLE IF NOT EXISTS ai_suggestions (
   suggestion TEXT NOT NULL,
   fix_action JSONB, -- Suggested fix action
   applied BOOLEAN DEFAULT false,
+  project_version INTEGER, -- project_data version that was checked
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -99,6 +103,71 @@ CREATE TABLE IF NOT EXISTS ai_prompts (
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Shared rate limit counters (RATE_LIMIT_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS rate_limit_counters (
+  bucket_key VARCHAR(255) NOT NULL,
+  window_start BIGINT NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket_key, window_start)
+);
+
+-- Provider webhooks, read by whichever worker waits for the generation
+CREATE TABLE IF NOT EXISTS provider_callbacks (
+  generation_id VARCHAR(64) PRIMARY KEY,
+  payload JSONB NOT NULL,
+  received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Captured request profiles (admin profiler), newest PROFILER_BUFFER_SIZE kept
+CREATE TABLE IF NOT EXISTS request_profiles (
+  id BIGSERIAL PRIMARY KEY,
+  summary JSONB NOT NULL,
+  stacks JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Prompt-keyed render result cache
+CREATE TABLE IF NOT EXISTS render_cache (
+  tenant_key VARCHAR(64) NOT NULL,
+  cache_key VARCHAR(64) NOT NULL,
+  result JSONB NOT NULL,
+  hit_count INTEGER DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (tenant_key, cache_key)
+);
+
+-- Source URLs of generated images for the render image proxy
+CREATE TABLE IF NOT EXISTS render_images (
+  generation_id VARCHAR(64) NOT NULL,
+  image_index INTEGER NOT NULL,
+  source_url TEXT NOT NULL,
+  content_hash VARCHAR(64),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (generation_id, image_index)
+);
+
+-- State of every render job (status polls and streams from any worker)
+CREATE TABLE IF NOT EXISTS render_jobs (
+  id UUID PRIMARY KEY,
+  tenant_id VARCHAR(64),
+  project_id UUID,
+  kind VARCHAR(32) NOT NULL,
+  status VARCHAR(16) NOT NULL,
+  completed_steps INTEGER NOT NULL DEFAULT 0,
+  state JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  finished_at TIMESTAMP
+);
+
+-- Catalog blocks (shared by all worker processes)
+CREATE TABLE IF NOT EXISTS catalog_blocks (
+  id VARCHAR(255) PRIMARY KEY,
+  definition JSONB NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_users_company_id ON users(company_id);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
@@ -108,11 +177,16 @@ CREATE INDEX IF NOT EXISTS idx_projects_design_mode ON projects(design_mode);
 CREATE INDEX IF NOT EXISTS idx_projects_is_draft ON projects(is_draft);
 CREATE INDEX IF NOT EXISTS idx_projects_folder_id ON projects(folder_id);
 CREATE INDEX IF NOT EXISTS idx_project_data_project_id ON project_data(project_id);
+CREATE INDEX IF NOT EXISTS idx_project_data_project_version ON project_data(project_id, version DESC);
 CREATE INDEX IF NOT EXISTS idx_pdf_backgrounds_project_id ON pdf_backgrounds(project_id);
 CREATE INDEX IF NOT EXISTS idx_folders_company_id ON folders(company_id);
 CREATE INDEX IF NOT EXISTS idx_folders_user_id ON folders(user_id);
 CREATE INDEX IF NOT EXISTS idx_ai_suggestions_project_id ON ai_suggestions(project_id);
 CREATE INDEX IF NOT EXISTS idx_ai_prompts_project_id ON ai_prompts(project_id);
+CREATE INDEX IF NOT EXISTS idx_companies_slug_prefix ON companies(slug text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_render_cache_last_hit ON render_cache(tenant_key, last_hit_at DESC);
+CREATE INDEX IF NOT EXISTS idx_ai_prompts_project_created ON ai_prompts(project_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_render_jobs_finished_at ON render_jobs(finished_at);
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()